@@ -2,15 +2,45 @@
     Tool : Pivot, Source Name : Pivot.py, Author: M'hamed Bendenia.
 """
 
-from arcgis.features import GeoAccessor
-import matplotlib.pyplot as plt
-import numpy as np
-import pandas as pd
-import arcpy
 import os
 import wx
 import pathlib
-import math
+import collections
+import concurrent.futures
+import threading
+import time
+
+from arcpy_dispatcher import ArcpyDispatcher
+from bar_chart import VirtualBarChart
+from catalog import Catalog
+from chart_cache import ChartCache, ARRAYS
+from charts import CHARTS, COLORS, chart_spec, decorate, series_renderer
+from clusters import ClusterPyramid, CLUSTER_MEASURES
+from decimate import Decimator, ZoomDecimator
+from derived import derive
+from eviction import TableBudget, ResidentTable
+from generalize import Generalizer
+from geometry_store import GeometryStore
+from hexbin import HexbinCache, class_breaks_renderer, quantile_breaks
+from ingest import CONFIRMED_BREAKS, Ingestor
+from labeling import LabelAnchors, LABEL_PROFILES, standard_label_class, top_n_where
+from lazy import lazy_import
+from matrix_store import MatrixStore
+from pivot_plan import PivotPlan, SERIAL
+from query import PivotQuery, QueryExecutor
+from rates import RateMaterializer, RATE_FIELDS
+from render_service import ChartRenderer
+from result_cache import ResultCache
+from session import PivotSession
+from shared_warehouse import SharedWarehouse
+from snapshots import SnapshotStore
+from view_selection import ViewPlanner, UsageStats, WEEK_FREQ
+from watcher import GdbWatcher
+
+# Loaded on first use, importing Pivot stays cheap
+arcpy = lazy_import("arcpy")
+pd = lazy_import("pandas")
+plt = lazy_import("matplotlib.pyplot")
 
 
 class Pivot(wx.Frame):
@@ -18,48 +48,109 @@ class Pivot(wx.Frame):
 
     workspace = None  #: Default gdb path
     workfolder = None  #: Default gdb folder path
-    aprx = arcpy.mp.ArcGISProject("CURRENT")  #: Current project
+    session = None  #: ArcGIS Pro project, map and workspace
+    aprx = None  #: Current project
     active_map = None  #: Current map
-    data_warehouse = {}  #: Data Warehouse
+    arcpy_calls = None  #: Dispatcher thread running the map and layer calls in order
+    warehouse = SnapshotStore(SharedWarehouse())  #: Data Warehouse, published as immutable snapshots, shared with workers
+    pins = threading.local()  #: Snapshot pinned by the running pivot, per thread
+    refresh_lock = threading.Lock()  #: Serializes DW refreshes
+    warehouse_budget = 2 * 1024 ** 3  #: Memory ceiling of the DW tables
+    evict_geometry_first = True  #: Evict geometry columns before whole tables
     fact_table = None  #: Fact table
-    sizer = wx.GridBagSizer(0, 0)  #: Layer sizer
+    sizer = None  #: Layer sizer
     panel = None  #: Pivot panel
     axes = None  #: Pivot axes
     bmp = None  #: Bitmap image axes
     xChoice = yChoice = zChoice = None  #: Dimension choise
     feature_class = None  #: ArcGIS Pro feature class
     x = y = z = None  #: Bitmap axe
+    images_folder = pathlib.Path(__file__).resolve().parent  #: Folder of the axes images
+    axis_regions = (
+        ("X", (91, 106, 88, 104), ("zChoice", "yChoice")),
+        ("Y", (51, 67, 14, 30), ("xChoice", "zChoice")),
+        ("Z", (13, 27, 88, 104), ("xChoice", "yChoice")),
+    )  #: Rotation axis, its click region on the axes image (xmin, xmax, ymin, ymax) and the swapped choices
+    bitmaps = None  #: Axes images by name, loaded once
+    bar_chart = None  #: The graphPlot chart, kept alive for its event handlers
+    chart_grain = "Week"  #: Time grain of the line and stack plots, "Week" or "Date"
+    line_values = "cumulative"  #: Line plot values, "cumulative" or "new": trailing mean of the new cases per period
+    decimator = Decimator()  #: LTTB indices of the plotted series, per series and width
+    zoom_plots = {}  #: Plot name -> its ZoomDecimator, kept alive for its event handlers
+    render_out_of_process = False  #: Render the charts in worker processes, matplotlib is then never imported here
+    chart_workers = 2  #: Chart rendering processes
+    chart_format = "png"  #: Format of the charts rendered out of process, one of charts.FORMATS
+    chart_renderer = None  #: Chart rendering processes, started on the first chart
+    chart_cache = None  #: Prepared chart arrays and rendered chart images, in memory and on disk
+    chart_cache_bytes = 64 * 1024 ** 2  #: Memory ceiling of the chart cache
+    chart_cache_disk_bytes = 256 * 1024 ** 2  #: Disk ceiling of the chart cache
+    aggregate_budget = 64 * 1024 ** 2  #: Byte budget of the materialized aggregates
+    planner = None  #: Aggregate view planner
+    table_budget = None  #: Memory ceiling of the DW tables, spilling to a columnar cache
+    result_cache_bytes = 256 * 1024 ** 2  #: Memory ceiling of the query result cache
+    result_cache = ResultCache(result_cache_bytes)  #: Shared query result cache
+    sources = {}  #: DW table name -> (feature class or table name, is a feature class)
+    catalog = None  #: Workspace catalog
+    executor = None  #: Query executor, pushes queries into the gdb when cheaper
+    materialize_rates = False  #: Draw the rate renderers from precomputed fields instead of Arcade expressions
+    rate_materializer = RateMaterializer()  #: Scratch copies with precomputed rate fields
+    generalize_polygons = True  #: Draw polygon layers from simplified copies at small scales
+    generalizer = Generalizer()  #: Scratch copies of the polygon layers, one per scale level
+    cluster_points = True  #: Draw point layers as grid clusters at small scales
+    clusterer = ClusterPyramid()  #: Scratch grid clusters of the point layers, one per scale level
+    companions = {}  #: Layer name -> scale level layers drawn in its place
+    hexbin_points = False  #: Draw point layers as hexbins instead of graduated symbols
+    hexbin_size = None  #: Hexagon size in map units, HEX_PIXELS at the reference scale if None
+    hexbins = HexbinCache()  #: Scratch hexbin layers, per source and size
+    label_profile = "maplex"  #: Default makeLabel profile, one of LABEL_PROFILES
+    label_top_n = None  #: Label only the N features with the highest label_measure, None for all
+    label_measure = "Confirmed"  #: Ranking field of label_top_n
+    label_anchors = LabelAnchors()  #: Scratch label anchor points, for the fast profile
+    maplex_placement = None  #: The map's Maplex placement properties, restored after the fast profile
+    ingestor = Ingestor()  #: Appended rows tracker and incremental aggregates
+    watcher = None  #: Gdb folder watcher
+    watch_interval = 1.0  #: Seconds between gdb polls
+    watch_debounce = 2.0  #: Quiet seconds after gdb edits before refreshing
+    step_workers = 4  #: Threads running the data preparation steps of a pivot
+    step_pool = None  #: Pool of the data preparation steps, started on the first pivot
+    last_plan = None  #: The last pivot's PivotPlan, with its step timings
 
-    # Define default GDB if parameter is Null
-    if len(arcpy.GetParameterAsText(0)) == 0:
-        workspace = arcpy.env.workspace
-        workfolder = os.path.dirname(workspace)
-    else:
-        workspace = arcpy.GetParameter(0)
-        arcpy.env.workspace = workspace
-        workfolder = os.path.dirname(arcpy.env.workspace)
-
-    # Define current map if parameter is Null
-    if len(arcpy.GetParameterAsText(1)) == 0:
-        active_map = aprx.listMaps()[0]
-    else:
-        active_map = aprx.listMaps(arcpy.GetParameter(1))[0]
-
-    # Setup reference Scale
-    active_map.referenceScale = 59467124.861567564
-
-    # Putting all layers in a dict
-    lyr_dict = {lyr.name.lower(): lyr for lyr in active_map.listLayers()}
-
-    def __init__(self, parent, title):
+    def __init__(self, parent, title, session):
         """
         Initialise the Pivot interface
 
         :param parent: The main Window
         :param title: Window title
+        :param session: The PivotSession to work on
         """
         super(Pivot, self).__init__(parent, title=title, size=wx.Size(410, 250),
                                     style=wx.STAY_ON_TOP ^ wx.DEFAULT_FRAME_STYLE ^ wx.RESIZE_BORDER ^ wx.MAXIMIZE_BOX)
+        self.session = session
+        self.aprx, self.active_map = session.aprx, session.active_map
+        self.workspace, self.workfolder = session.workspace, session.workfolder
+
+        # Aggregates are chosen from the pivots run in previous sessions
+        self.planner = ViewPlanner(self.aggregate_budget,
+                                   UsageStats(os.path.join(self.workfolder, "pivot_usage.json")))
+
+        # DW tables past the memory ceiling spill to a columnar cache and reload on access
+        self.table_budget = TableBudget(self.warehouse_budget, os.path.join(session.scratch_folder, "pivot_cache"),
+                                        geometry_first=self.evict_geometry_first)
+
+        # Charts seen in previous sessions are shown again without aggregating or drawing
+        self.chart_cache = ChartCache(os.path.join(session.scratch_folder, "pivot_charts"), self.chart_cache_bytes,
+                                      self.chart_cache_disk_bytes)
+
+        # Cached results and spilled tables die with the table versions they were computed from
+        self.warehouse.on_retire.append(self.retire_table)
+
+        # Map and layer calls run in order on one thread, pivots keep computing meanwhile
+        self.arcpy_calls = ArcpyDispatcher()
+        self.arcpy_calls.on_error.append(self.onArcpyError)
+
+        self.arcpy_calls.call(session.setup_map)
+        self.lyr_dict = self.arcpy_calls.call(session.layers)
+
         self.InitUI()
         self.Centre()
         self.Show()
@@ -69,10 +160,12 @@ class Pivot(wx.Frame):
         Display the user interface and load data.
         """
         self.panel = wx.Panel(self)
+        self.sizer = wx.GridBagSizer(0, 0)
         self.local = wx.Locale(wx.LANGUAGE_DEFAULT)
 
         # Axes image
-        self.bmp = wx.Bitmap(str(pathlib.Path().absolute().joinpath(r"Scripts\Axes.png")), wx.BITMAP_TYPE_PNG)
+        self.load_bitmaps()
+        self.bmp = self.bitmaps["Axes"]
         self.axes = wx.StaticBitmap(self.panel, wx.ID_ANY, self.bmp, wx.DefaultPosition, (120, 120), 0)
         self.axes.Bind(wx.EVT_LEFT_DOWN, self.onAxesClick)
         self.sizer.Add(self.axes, pos=(1, 1), flag=wx.ALL, border=5)
@@ -90,10 +183,13 @@ class Pivot(wx.Frame):
         self.zChoice.Bind(wx.EVT_CHOICE, self.onZChoiceClick)
         self.sizer.Add(self.zChoice, pos=(2, 0), flag=wx.ALL, border=5)
 
+        self.catalog = Catalog(self.workspace)
+        self.executor = QueryExecutor(self.workspace, self.catalog)
+
         # Filling the DW and the lists by feature classes
-        for fc in arcpy.ListFeatureClasses():
+        for fc in self.catalog.feature_classes:
             try:
-                self.data_warehouse[fc.title().lower()] = pd.DataFrame.spatial.from_featureclass(fc)
+                self.load_table(fc, spatial=True)
                 self.xChoice.Append(fc.title())
                 self.yChoice.Append(fc.title())
                 self.zChoice.Append(fc.title())
@@ -101,16 +197,264 @@ class Pivot(wx.Frame):
                 arcpy.AddError(str(e))
 
         # Filling the DW and the lists by tables
-        for tb in arcpy.ListTables():
+        for tb in self.catalog.tables:
             try:
-                self.data_warehouse[tb.title().lower()] = pd.DataFrame.spatial.from_table(tb)
+                self.load_table(tb, spatial=False)
                 self.xChoice.Append(tb.title())
                 self.yChoice.Append(tb.title())
                 self.zChoice.Append(tb.title())
             except Exception as e:
                 arcpy.AddError(str(e))
+        self.planner.plan()
         self.panel.SetSizerAndFit(self.sizer)
 
+        # Live refresh on external gdb edits
+        self.watcher = GdbWatcher(self.workspace, self.catalog.name_of, self.onGdbChange,
+                                  interval=self.watch_interval, debounce=self.watch_debounce)
+        self.watcher.start()
+        self.Bind(wx.EVT_CLOSE, self.onClose)
+
+    @property
+    def data_warehouse(self):
+        """
+        The DW snapshot this thread reads: the one pinned by the running pivot, else the latest
+        """
+        snapshot = getattr(self.pins, "snapshot", None)
+        return snapshot if snapshot is not None else self.warehouse.current
+
+    def load_table(self, source, spatial):
+        """
+        Load a feature class or a table and publish it in a new DW snapshot
+
+        :param source: The feature class or table name
+        :param spatial: True for a feature class
+        """
+        self.warehouse.publish({source.title().lower(): self.prepare_table(source, spatial)})
+
+    def prepare_table(self, source, spatial):
+        """
+        Read a feature class or a table and get it ready to publish: profiled, versioned, tracked for appends and
+        counted against the memory budget
+
+        :param source: The feature class or table name
+        :param spatial: True for a feature class
+        :return: The ResidentTable to publish
+        """
+        name = source.title().lower()
+        df = self.read_table(source, spatial)
+        self.sources[name] = (source, spatial)
+        self.planner.register(name, df)
+        self.result_cache.set_version(name, self.catalog.token(source))
+        oid_fields = [f for f, t in self.catalog.entries[source].fields if t == "OID"]
+        self.ingestor.track(name, df, oid_fields[0] if oid_fields else None)
+        return self.table_budget.track(name, df, lambda: self.read_table(source, spatial))
+
+    def retire_table(self, snapshot, name, version):
+        """
+        Free what a table version no snapshot holds any more: its cached results and its columnar copy, the
+        warehouse frees its shared memory segment
+
+        :param snapshot: The last snapshot holding it
+        :param name: The table name
+        :param version: The table version
+        """
+        self.result_cache.discard(name, version)
+        table = snapshot.raw(name)
+        if isinstance(table, ResidentTable):
+            self.table_budget.forget(table)
+
+    def shared_table(self, data_name):
+        """
+        Shared memory descriptor of a DW table, for worker processes: the columns are copied once per table
+        version and freed when the version retires, so workers must be done before the pivot unpins its snapshot
+
+        :param data_name: The table name
+        :return: The descriptor, worker processes open it with shared_warehouse.attach_table
+        """
+        return self.warehouse.descriptor(self.data_warehouse, data_name)
+
+    def read_table(self, source, spatial):
+        """
+        Read a feature class or a table from the gdb
+
+        :param source: The feature class or table name
+        :param spatial: True for a feature class
+        :return: A DataFrame
+        """
+        from arcgis.features import GeoAccessor  # registers the DataFrame.spatial accessor
+
+        if spatial:
+            return pd.DataFrame.spatial.from_featureclass(source)
+        return pd.DataFrame.spatial.from_table(source)
+
+    def refresh_tables(self, names=None):
+        """
+        Update the DW tables whose feature class or table changed since they were loaded, on a worker thread: the
+        new versions are published as one snapshot, pivots keep reading theirs meanwhile, and the current pivot
+        runs again once they are published
+
+        :param names: Feature classes or tables known to have changed, None to check the whole gdb
+        :return: The refresh thread, None if a refresh is already running
+        """
+        # A refresh already running publishes its own snapshot
+        if not self.refresh_lock.acquire(False):
+            return None
+        updated = []
+
+        def build(snapshot):
+            try:
+                updates, removed = self.refreshed_tables(snapshot, names)
+            except Exception as e:
+                arcpy.AddError(str(e))
+                return {}, ()
+            updated.extend(updates)
+            return updates, removed
+
+        def published(snapshot):
+            try:
+                if snapshot is not None:
+                    self.seed_aggregates(snapshot, updated)
+                    wx.CallAfter(self.rerun)
+            finally:
+                self.refresh_lock.release()
+
+        try:
+            return self.warehouse.refresh_async(build, published)
+        except Exception:
+            self.refresh_lock.release()
+            raise
+
+    def refreshed_tables(self, snapshot, names=None):
+        """
+        New versions of the changed DW tables: appended rows are read and folded in, any other change reloads the
+        whole table
+
+        :param snapshot: The snapshot being refreshed
+        :param names: Feature classes or tables known to have changed, None to check the whole gdb
+        :return: (table name -> ResidentTable, removed names), for SnapshotStore.publish
+        """
+        updates = {}
+        try:
+            if not self.catalog.refresh(names=names):
+                return updates, ()
+        except Exception as e:
+            arcpy.AddError(str(e))
+            return updates, ()
+        for name, (source, spatial) in list(self.sources.items()):
+            try:
+                if not self.result_cache.set_version(name, self.catalog.token(source)):
+                    continue
+                df = snapshot[name]
+                grown = self.ingestor.append(name, os.path.join(str(self.workspace), source), spatial, df,
+                                             self.catalog.entries[source].rows)
+                if grown is None:
+                    updates[name] = self.prepare_table(source, spatial)
+                    continue
+                self.planner.grow(name, grown, len(grown) - len(df),
+                                  self.ingestor.aggregates[name].cardinality())
+                updates[name] = self.table_budget.track(name, grown,
+                                                        lambda source=source, spatial=spatial: self.read_table(
+                                                            source, spatial))
+            except Exception as e:
+                arcpy.AddError(str(e))
+        return updates, ()
+
+    def seed_aggregates(self, snapshot, names):
+        """
+        Seed the new versions of refreshed tables with their incrementally updated aggregates
+
+        :param snapshot: The snapshot publishing them
+        :param names: The refreshed table names
+        """
+        for name in names:
+            aggregates = self.ingestor.aggregates.get(name)
+            if aggregates is None:
+                continue
+            for group_by in (("Week",), ("Country_Re",)):
+                frame = aggregates.frame(group_by)
+                if frame is not None:
+                    self.result_cache.put(name, "aggregate", group_by, frame, version=snapshot.version_of(name))
+
+    def time_extent(self, lyr_name):
+        """
+        CIM time extent bounds of a layer, from its table's dates
+
+        :param lyr_name: The layer name
+        :return: A dict with 'start' and 'end' in epoch milliseconds
+        """
+        aggregates = self.ingestor.aggregates.get(lyr_name)
+        extent = aggregates.time_extent() if aggregates is not None else None
+        if extent is None:
+            return {"start": 1579651200000, "end": 1594080000000}
+        return {"start": extent[0], "end": extent[1]}
+
+    def onGdbChange(self, names, schema):
+        """
+        Gdb watcher listner, runs on the watcher thread after the debounce interval
+
+        :param names: Changed feature classes and tables
+        :param schema: True if unknown or system tables changed
+        """
+        if not names and not schema:
+            return
+        self.refresh_tables(None if schema else names)
+
+    def onClose(self, event):
+        """
+        Window close event listner
+
+        :param event: The close event
+        """
+        if self.watcher is not None:
+            self.watcher.stop()
+        if self.chart_renderer is not None:
+            self.chart_renderer.shutdown()
+        self.warehouse.shared.close()
+        if self.step_pool is not None:
+            self.step_pool.shutdown(wait=False)
+        # Written once per session, not after every pivot
+        try:
+            self.planner.usage.save()
+        except OSError as e:
+            arcpy.AddError(str(e))
+        event.Skip()
+
+    def onArcpyError(self, command, error):
+        """
+        Dispatcher listner of the failed map and layer calls, runs on the dispatcher thread
+
+        :param command: The failed Command
+        :param error: The exception
+        """
+        arcpy.AddError("{}: {}".format(command.name, error))
+
+    def map_layers(self):
+        """
+        Layers of the active map by lower case name, once the queued map and layer calls ran
+        """
+        return {lyr.name.lower(): lyr for lyr in self.arcpy_calls.call(self.active_map.listLayers)}
+
+    def rerun(self):
+        """
+        Run the current pivot again, if there is one
+        """
+        if wx.NOT_FOUND in (self.xChoice.GetSelection(), self.yChoice.GetSelection(), self.zChoice.GetSelection()):
+            return
+        self.pivotRun()
+
+    def load_bitmaps(self):
+        """
+        Load the axes images next to this module, so clicks never read the disk
+        """
+        self.bitmaps = {}
+        for name in ["Axes"] + [axis for axis, _, _ in self.axis_regions]:
+            path = self.images_folder / (name + ".png")
+            if path.exists():
+                self.bitmaps[name] = wx.Bitmap(str(path), wx.BITMAP_TYPE_PNG)
+            else:
+                arcpy.AddWarning("Missing image: " + str(path))
+        self.bitmaps.setdefault("Axes", wx.Bitmap(120, 120))
+
     def onAxesClick(self, event):
         """
         Bitmap click event listner
@@ -118,36 +462,18 @@ class Pivot(wx.Frame):
         :param event: The mouse click event
         """
         x, y = event.GetPosition()
-        if 91 < x < 106 and 88 < y < 104:
-            self.bmp = wx.Bitmap(str(pathlib.Path().absolute().joinpath(r"Scripts\X.png")), wx.BITMAP_TYPE_PNG)
-            self.axes.SetBitmap(self.bmp)
-            self.panel.Layout()
-
-            temp = self.zChoice.GetSelection()
-            self.zChoice.SetSelection(self.yChoice.GetSelection())
-            self.yChoice.SetSelection(temp)
-            self.pivotRun()
-            return
-        elif 51 < x < 67 and 14 < y < 30:
-            self.bmp = wx.Bitmap(str(pathlib.Path().absolute().joinpath(r"Scripts\Y.png")), wx.BITMAP_TYPE_PNG)
-            self.axes.SetBitmap(self.bmp)
-            self.panel.Layout()
-
-            temp = self.xChoice.GetSelection()
-            self.xChoice.SetSelection(self.zChoice.GetSelection())
-            self.zChoice.SetSelection(temp)
-            self.pivotRun()
-            return
-        elif 13 < x < 27 and 88 < y < 104:
-            self.bmp = wx.Bitmap(str(pathlib.Path().absolute().joinpath(r"Scripts\Z.png")), wx.BITMAP_TYPE_PNG)
-            self.axes.SetBitmap(self.bmp)
-            self.panel.Layout()
-
-            temp = self.xChoice.GetSelection()
-            self.xChoice.SetSelection(self.yChoice.GetSelection())
-            self.yChoice.SetSelection(temp)
-            self.pivotRun()
-            return
+        for axis, (xmin, xmax, ymin, ymax), (first, second) in self.axis_regions:
+            if xmin < x < xmax and ymin < y < ymax:
+                self.bmp = self.bitmaps.get(axis, self.bitmaps["Axes"])
+                self.axes.SetBitmap(self.bmp)
+                self.panel.Layout()
+
+                first, second = getattr(self, first), getattr(self, second)
+                temp = first.GetSelection()
+                first.SetSelection(second.GetSelection())
+                second.SetSelection(temp)
+                self.pivotRun()
+                return
         return
 
     def onXChoiceClick(self, event):
@@ -187,80 +513,316 @@ class Pivot(wx.Frame):
         """
         Start the Pivot operation
         """
+        # The whole pivot reads the current DW snapshot, whatever gets published meanwhile
+        with self.warehouse.acquire() as self.pins.snapshot:
+            try:
+                self.pivotSteps()
+            finally:
+                self.pins.snapshot = None
+
+    def pivotSteps(self):
+        """
+        Run the steps of the selected position: data preparation on the step pool, arcpy and plots in order here
+        """
         self.reset_lyrs()
+        x, y, z = [choice.GetString(choice.GetSelection()).lower()
+                   for choice in (self.xChoice, self.yChoice, self.zChoice)]
 
         arcpy.AddMessage("---------------------")
-        if self.xChoice.GetString(self.xChoice.GetSelection()).lower() == "date_world_cases":
-            if self.yChoice.GetString(self.yChoice.GetSelection()).lower() == "covid_cases":
-                arcpy.AddMessage("3")
+        plan = self.pivotPlan(x, y, z)
+        if plan is None:
+            arcpy.AddWarning("This position is not supported.")
+        else:
+            arcpy.AddMessage(plan.name)
+            if self.step_pool is None:
+                self.step_pool = concurrent.futures.ThreadPoolExecutor(self.step_workers,
+                                                                       thread_name_prefix="PivotStep")
+            for step in plan.run(self.step_pool):
+                arcpy.AddError("{}: {}".format(step.name, step.error))
+            self.last_plan = plan
+            for line in plan.report():
+                arcpy.AddMessage(line)
+            calls = self.arcpy_calls.metrics()
+            arcpy.AddMessage("arcpy queue: depth {depth}, max depth {max_depth}, coalesced {coalesced}".format(**calls))
+            cache = self.result_cache.stats()
+            arcpy.AddMessage("result cache: {entries} entries, {0:.1f} MB, hit rate {hit_rate:.0%}, hits {hits}, "
+                             "misses {misses}, evictions {evictions}".format(cache["resident_bytes"] / 2 ** 20, **cache))
+            budget = self.table_budget.metrics()
+            arcpy.AddMessage("DW tables: {:.1f} / {:.1f} MB resident, evictions {evictions}, reloads {reloads}".format(
+                budget["total_bytes"] / 2 ** 20, budget["max_bytes"] / 2 ** 20, **budget))
+
+        # Re-plan the materialized aggregates with this pivot's queries
+        try:
+            self.planner.plan()
+        except Exception as e:
+            arcpy.AddError(str(e))
+        return
+
+    def pivotPlan(self, x, y, z):
+        """
+        Steps of a position as a dependency graph
+
+        :param x: X dimension name
+        :param y: Y dimension name
+        :param z: Z dimension name
+        :return: The PivotPlan, None if the position is not supported
+        """
+        if x == "date_world_cases":
+            if y == "covid_cases":
+                plan = PivotPlan("3")
+                geometry = self.geometry_step(plan, z)
+                data = self.chart_data_step(plan, "covid_cases")
 
                 """Z with Z.fields[0] as label"""
-                self.makeLabel(lyr_name=self.zChoice.GetString(self.zChoice.GetSelection()).lower(),
-                               field_name="Country_Re")
+                plan.add("label " + z, lambda: self.makeLabel(lyr_name=z, field_name="Country_Re"),
+                         after=geometry, kind=SERIAL)
 
                 """Z symbolized with Z.fields[3]"""
-                self.make_class_breaks_symb(lyr_name=self.zChoice.GetString(self.zChoice.GetSelection()).lower())
+                plan.add("symbology " + z, lambda: self.make_class_breaks_symb(lyr_name=z), after=geometry,
+                         kind=SERIAL)
 
                 """Plot X(time) Y(point)"""
-                self.stackPlot(data_name="covid_cases")
-
-                self.hide(lyr_name=self.xChoice.GetString(self.xChoice.GetSelection()).lower())
-                self.hide(lyr_name=self.yChoice.GetString(self.yChoice.GetSelection()).lower())
+                plan.add("stack plot", lambda: self.stackPlot(data_name="covid_cases"), after=data, kind=SERIAL)
 
+                plan.add("hide " + x, lambda: self.hide(lyr_name=x), kind=SERIAL)
+                plan.add("hide " + y, lambda: self.hide(lyr_name=y), kind=SERIAL)
             else:
-                arcpy.AddMessage("6")
+                plan = PivotPlan("6")
+                geometry = self.geometry_step(plan, x)
 
                 """Time cursor X"""
-                self.setTimeCursor(lyr_name=self.xChoice.GetString(self.xChoice.GetSelection()).lower(),
-                                   time_field="Date")
+                plan.add("time cursor " + x, lambda: self.setTimeCursor(lyr_name=x, time_field="Date"), kind=SERIAL)
 
                 """Y symbolized with Y.fields[3]"""
-                self.make_class_breaks_symb(lyr_name=self.xChoice.GetString(self.xChoice.GetSelection()).lower())
+                plan.add("symbology " + x, lambda: self.make_class_breaks_symb(lyr_name=x), after=geometry,
+                         kind=SERIAL)
 
                 """Plot X(states) Y(count_accidents)"""
-                self.graphPlot(data_name=self.zChoice.GetString(self.zChoice.GetSelection()).lower())
+                # Its query may run in the gdb, it stays with the arcpy steps
+                plan.add("bar plot", lambda: self.graphPlot(data_name=z), kind=SERIAL)
 
-                self.hide(lyr_name=self.zChoice.GetString(self.zChoice.GetSelection()).lower())
+                plan.add("hide " + z, lambda: self.hide(lyr_name=z), kind=SERIAL)
 
-        elif self.xChoice.GetString(self.xChoice.GetSelection()).lower() == "covid_cases":
-            if self.yChoice.GetString(self.yChoice.GetSelection()).lower() == "date_world_cases":
-                arcpy.AddMessage("4")
+        elif x == "covid_cases":
+            if y == "date_world_cases":
+                plan = PivotPlan("4")
+                geometry = self.geometry_step(plan, z)
+                data = self.chart_data_step(plan, y, new=self.line_values == "new")
 
-                self.makeLabel(lyr_name=self.zChoice.GetString(self.zChoice.GetSelection()).lower(),
-                               field_name="Country_Re")
+                plan.add("label " + z, lambda: self.makeLabel(lyr_name=z, field_name="Country_Re"),
+                         after=geometry, kind=SERIAL)
 
-                self.hide(lyr_name=self.xChoice.GetString(self.xChoice.GetSelection()).lower())
-                self.hide(lyr_name=self.yChoice.GetString(self.yChoice.GetSelection()).lower())
+                plan.add("hide " + x, lambda: self.hide(lyr_name=x), kind=SERIAL)
+                plan.add("hide " + y, lambda: self.hide(lyr_name=y), kind=SERIAL)
 
-                self.linePlot(data_name=self.yChoice.GetString(self.yChoice.GetSelection()).lower())
+                plan.add("line plot", lambda: self.linePlot(data_name=y), after=data, kind=SERIAL)
             else:
-                arcpy.AddMessage("2")
+                plan = PivotPlan("2")
+                geometry = self.geometry_step(plan, x)
 
-                self.make_simple_symb(lyr_name=self.zChoice.GetString(self.zChoice.GetSelection()).lower())
-                self.setTimeCursor(lyr_name=self.zChoice.GetString(self.zChoice.GetSelection()).lower(),
-                                   time_field="Date")
-                self.make_point_class_breaks_symb(lyr_name=self.xChoice.GetString(self.xChoice.GetSelection()).lower())
-                self.setTimeCursor(lyr_name=self.xChoice.GetString(self.xChoice.GetSelection()).lower(),
-                                   time_field="Date")
+                plan.add("symbology " + z, lambda: self.make_simple_symb(lyr_name=z), kind=SERIAL)
+                plan.add("time cursor " + z, lambda: self.setTimeCursor(lyr_name=z, time_field="Date"),
+                         kind=SERIAL)
+                if self.hexbin_points:
+                    plan.add("symbology " + x, lambda: self.make_hexbin_symb(lyr_name=x), after=geometry,
+                             kind=SERIAL)
+                else:
+                    plan.add("symbology " + x, lambda: self.make_point_class_breaks_symb(lyr_name=x),
+                             after=geometry, kind=SERIAL)
+                plan.add("time cursor " + x, lambda: self.setTimeCursor(lyr_name=x, time_field="Date"),
+                         after=("symbology " + x,), kind=SERIAL)
 
-        elif self.xChoice.GetString(self.xChoice.GetSelection()).lower() == "world_cases":
-            if self.yChoice.GetString(self.yChoice.GetSelection()).lower() == "date_world_cases":
-                arcpy.AddMessage("5")
+        elif x == "world_cases":
+            if y == "date_world_cases":
+                plan = PivotPlan("5")
+                geometry = self.geometry_step(plan, x)
+                data = self.chart_data_step(plan, z)
 
-                self.make_class_breaks_symb(lyr_name=self.xChoice.GetString(self.xChoice.GetSelection()).lower())
-                self.rateLinePlot(data_name=self.zChoice.GetString(self.zChoice.GetSelection()).lower())
+                plan.add("symbology " + x, lambda: self.make_class_breaks_symb(lyr_name=x), after=geometry,
+                         kind=SERIAL)
+                plan.add("rate plot", lambda: self.rateLinePlot(data_name=z), after=data, kind=SERIAL)
 
-                self.hide(lyr_name=self.zChoice.GetString(self.zChoice.GetSelection()).lower())
+                plan.add("hide " + z, lambda: self.hide(lyr_name=z), kind=SERIAL)
             else:
-                arcpy.AddMessage("1")
+                plan = PivotPlan("1")
 
-                self.make_time_related_symb(lyr_name=self.zChoice.GetString(self.zChoice.GetSelection()).lower(),
-                                            time_field="Date")
+                plan.add("symbology " + z, lambda: self.make_time_related_symb(lyr_name=z, time_field="Date"),
+                         kind=SERIAL)
 
-                self.hide(lyr_name=self.yChoice.GetString(self.yChoice.GetSelection()).lower())
+                plan.add("hide " + y, lambda: self.hide(lyr_name=y), kind=SERIAL)
         else:
-            arcpy.AddWarning("This position is not supported.")
-        return
+            return None
+        return plan
+
+    def geometry_step(self, plan, lyr_name):
+        """
+        Add a step building a layer's GeometryStore, read by the generalization, cluster and label steps
+
+        :param plan: The PivotPlan
+        :param lyr_name: The layer name
+        :return: Names of the steps to depend on, none if the layer has no DW feature class
+        """
+        if lyr_name not in self.sources or not self.sources[lyr_name][1]:
+            return ()
+        if not (self.generalize_polygons or self.cluster_points or self.hexbin_points or self.label_profile == "fast"):
+            return ()
+        plan.add("geometry " + lyr_name, self.pinned(lambda: self.geometry(lyr_name)))
+        return "geometry " + lyr_name,
+
+    def chart_data_step(self, plan, data_name, new=False):
+        """
+        Add a step building the series of a time chart, the plot step then reads them from the cache
+
+        :param plan: The PivotPlan
+        :param data_name: The dimension name
+        :param new: Build the derived matrices of the new cases too
+        :return: Names of the steps to depend on
+        """
+        plan.add("chart data " + data_name, self.pinned(lambda: self.time_series(data_name, (), new)))
+        return "chart data " + data_name,
+
+    def pinned(self, run):
+        """
+        Bind a step to the snapshot pinned by the running pivot, for pool threads
+
+        :param run: The step callable
+        :return: A callable reading the same snapshot from any thread
+        """
+        snapshot = getattr(self.pins, "snapshot", None)
+
+        def call():
+            self.pins.snapshot = snapshot
+            try:
+                return run()
+            finally:
+                self.pins.snapshot = None
+
+        return call
+
+    def aggregate(self, data_name, group_by):
+        """
+        Max of the measures grouped by some dimensions, served from the materialized aggregates when possible
+
+        :param data_name: The dimension name
+        :param group_by: Group-by dimensions, among 'Country_Re', 'Date' and 'Week'
+        :return: A DataFrame with the group-by columns and the measures, shared with the cache: do not modify it
+        """
+        group_by = tuple(group_by)
+        snapshot = self.data_warehouse
+        version = snapshot.version_of(data_name)
+        self.planner.usage.record(data_name, group_by)
+        return self.result_cache.lookup(data_name, "aggregate", group_by,
+                                        lambda: self.planner.aggregate(data_name, snapshot[data_name], group_by,
+                                                                       record=False, version=version),
+                                        version=version)
+
+    def matrix(self, data_name, freq=WEEK_FREQ):
+        """
+        Countries x periods matrices of a Country_Re x Date table, built once per table version
+
+        :param data_name: The dimension name
+        :param freq: Period grain, a pandas frequency, None for days
+        :return: A MatrixStore, shared with the cache: do not modify it
+        """
+        snapshot = self.data_warehouse
+
+        def build():
+            store = MatrixStore.build(snapshot[data_name], freq=freq)
+            report = store.memory_report(snapshot[data_name])
+            arcpy.AddMessage("{} matrix: {:.1f} KB against {:.1f} KB long-form ({:.1%})".format(
+                data_name, report["matrix_bytes"] / 1024, report["long_bytes"] / 1024, report["ratio"]))
+            return store
+
+        return self.result_cache.lookup(data_name, "matrix", freq, build, version=snapshot.version_of(data_name))
+
+    def derived(self, data_name, freq=None, window=7):
+        """
+        New cases, trailing means, growth rates and doubling times per country, cached next to the base matrices
+
+        :param data_name: The dimension name
+        :param freq: Period grain, a pandas frequency, None for days
+        :param window: Trailing window, in days
+        :return: A MatrixStore, shared with the cache: do not modify it
+        """
+        return self.result_cache.lookup(data_name, "derived", (freq, window),
+                                        lambda: derive(self.matrix(data_name, freq), window),
+                                        version=self.data_warehouse.version_of(data_name))
+
+    def has_matrix(self, data_name):
+        """
+        Whether a table is a Country_Re x Date table, with countries x periods matrices
+
+        :param data_name: The dimension name
+        """
+        snapshot = self.data_warehouse
+        return data_name in snapshot and {"Country_Re", "Date"}.issubset(snapshot[data_name].columns)
+
+    def time_series(self, data_name, measures, new=False):
+        """
+        Max of the measures per chart_grain period, from the planned aggregates
+
+        :param data_name: The dimension name
+        :param measures: The measures
+        :param new: Sum over the countries of the trailing mean of the new cases instead, read off the derived
+                    countries x periods matrices, ignored for the tables without matrices
+        :return: Ordered mapping of 'x' and measure -> array
+        """
+        if new and self.has_matrix(data_name):
+            store = self.derived(data_name, WEEK_FREQ if self.chart_grain == "Week" else None)
+            return collections.OrderedDict([("x", store.periods)] + [(m, store.sums(m + "_avg")) for m in measures])
+        df_temp = self.aggregate(data_name, (self.chart_grain,))
+        return collections.OrderedDict([("x", df_temp[self.chart_grain].values)] +
+                                       [(m, df_temp[m].values) for m in measures])
+
+    def class_report(self, lyr_name, measure="Confirmed", upper_bounds=CONFIRMED_BREAKS):
+        """
+        Report the countries per class of the time-related renderer in the latest week, off the countries x weeks
+        matrices
+
+        :param lyr_name: The layer name
+        :param measure: The classified measure
+        :param upper_bounds: The renderer's class upper bounds
+        :return: Counts per class plus one above the last bound, None without matrices
+        """
+        if not self.has_matrix(lyr_name):
+            return None
+        store = self.matrix(lyr_name)
+        if measure not in store.planes or not len(store.periods):
+            return None
+        counts = store.class_counts(measure, store.periods[-1], upper_bounds)
+        arcpy.AddMessage("{} countries per {} class, week of {}: {}".format(
+            lyr_name, measure, str(store.periods[-1])[:10],
+            ", ".join(["\u2264{}: {}".format(bound, count) for bound, count in zip(upper_bounds, counts)] +
+                      [">{}: {}".format(upper_bounds[-1], counts[-1])])))
+        return counts
+
+    def geometry(self, data_name):
+        """
+        Geometries of a spatial DW table as flat coordinate arrays, for spatial joins and headless previews
+
+        :param data_name: The dimension name
+        :return: A GeometryStore, shared with the cache: do not modify it
+        """
+        snapshot = self.data_warehouse
+        return self.result_cache.lookup(data_name, "geometry", (),
+                                        lambda: GeometryStore.from_spatial_df(snapshot[data_name]),
+                                        version=snapshot.version_of(data_name))
+
+    def run_query(self, data_name, **query):
+        """
+        Run a pivot query in the gdb or on the DW table, whichever is estimated cheaper
+
+        :param data_name: The dimension name
+        :param query: PivotQuery arguments
+        :return: A DataFrame, shared with the cache: do not modify it
+        """
+        source = self.sources[data_name][0] if data_name in self.sources else data_name
+        query = PivotQuery(source, **query)
+        snapshot = self.data_warehouse
+        return self.result_cache.lookup(data_name, "query", query.key(),
+                                        lambda: self.executor.execute(query, snapshot.get(data_name),
+                                                                              self.planner.profiles.get(data_name)),
+                                        version=snapshot.version_of(data_name))
 
     def rateLinePlot(self, data_name):
         """
@@ -268,29 +830,13 @@ class Pivot(wx.Frame):
 
         :param data_name: Time dimension name
         """
-        df_temp = self.data_warehouse[data_name].groupby("Date")["Confirmed", "Deaths", "Recovred"].max().reset_index()
-
-        # Agregate Date
-        df_temp['Date'] = pd.to_datetime(df_temp['Date'])
-        df_temp = df_temp.groupby(pd.Grouper(key='Date', freq='W-MON'))["Confirmed",
-                                                                        "Deaths",
-                                                                        "Recovred"].max().reset_index()
-
-        fig, ax = plt.subplots(figsize=(20, 5))
-
-        plt.grid()
-        ax.plot(df_temp.Date.values, df_temp.Deaths.values / df_temp.Confirmed.values, 'r--', marker="o",
-                label="Deaths")
-        ax.plot(df_temp.Date.values, df_temp.Recovred.values / df_temp.Confirmed.values, 'g--', marker="o",
-                label="Recovred")
-
-        ax.legend(loc=2)
-        plt.title("Deaths and Recovred rates.")
-        ax.set_yticklabels(['{:.1f}%'.format(x * 100) for x in ax.get_yticks()])
-        plt.xticks(rotation=70)
-        plt.yticks(rotation=60)
-        plt.tight_layout()
-        plt.show()
+        def prepare():
+            series = self.time_series(data_name, ("Deaths", "Recovred", "Confirmed"))
+            return collections.OrderedDict([("x", series["x"]),
+                                            ("Deaths", series["Deaths"] / series["Confirmed"]),
+                                            ("Recovred", series["Recovred"] / series["Confirmed"])])
+
+        self.timePlot("rate", data_name, ("Deaths", "Recovred"), prepare)
 
     def linePlot(self, data_name):
         """
@@ -298,27 +844,143 @@ class Pivot(wx.Frame):
 
         :param data_name: The dimension name
         """
-        df_temp = self.data_warehouse[data_name].groupby("Date")["Confirmed", "Deaths", "Recovred"].max().reset_index()
-
-        # Agregate Date
-        df_temp['Date'] = pd.to_datetime(df_temp['Date'])
-        df_temp = df_temp.groupby(pd.Grouper(key='Date', freq='W-MON'))["Confirmed",
-                                                                        "Deaths",
-                                                                        "Recovred"].max().reset_index()
-
-        fig, ax = plt.subplots(figsize=(20, 5))
-        plt.grid()
-        ax.plot(df_temp.Date.values, df_temp.Deaths.values, 'r--', label="Deaths")
-        ax.plot(df_temp.Date.values, df_temp.Recovred.values, 'g--', label="Recovred")
-        ax.plot(df_temp.Date.values, df_temp.Confirmed.values, 'y--', label="Confirmed")
-
-        ax.legend(loc=2)
-        plt.title("Confirmed, Deaths and Recovred cases developement by Date.")
-        plt.xticks(rotation=70)
-        plt.yticks(rotation=60)
+        new = self.line_values == "new" and self.has_matrix(data_name)
+
+        def prepare():
+            return self.time_series(data_name, ("Deaths", "Recovred", "Confirmed"), new)
+
+        self.timePlot("new" if new else "line", data_name, ("Deaths", "Recovred", "Confirmed"), prepare)
+
+    def timePlot(self, kind, data_name, measures, prepare, figsize=(20, 5)):
+        """
+        Plot series by date, in a matplotlib window or rendered out of process
+
+        :param kind: 'rate', 'line' or 'stack'
+        :param data_name: The dimension name the series come from
+        :param measures: Names of the plotted series
+        :param prepare: Callable returning an ordered mapping of 'x' (sorted dates) and the series -> values
+        :param figsize: Figure size in inches
+        """
+        key = self.chart_key(data_name, kind, measures)
+        image_key = key and key + (tuple(figsize), 100)
+        if self.render_out_of_process and self.show_cached_chart(image_key, CHARTS[kind]["title"],
+                                                                self.chart_format):
+            return
+        arrays = self.chart_arrays(key, prepare)
+        x = arrays["x"]
+        series = collections.OrderedDict((m, arrays[m]) for m in measures)
+
+        if self.render_out_of_process:
+            spec = chart_spec(kind, measures, figsize, dpi=100, fmt=self.chart_format)
+            idx = self.decimator.indices((data_name, self.data_warehouse.version_of(data_name), self.chart_grain, kind),
+                                         x, series.values(), figsize[0] * spec["dpi"])
+            self.render_chart(spec, dict(((name, y[idx]) for name, y in series.items()), x=x[idx]), image_key)
+            return
+
+        fig, ax = plt.subplots(figsize=figsize)
+        self.decimated_plot(kind, ax, data_name, x, series, series_renderer(kind))
+        decorate(ax, kind)
         plt.tight_layout()
         plt.show()
 
+    def chart_key(self, data_name, kind, measures):
+        """
+        Chart cache key of the prepared arrays: table change token, chart type, measures and time grain
+
+        :param data_name: The dimension name
+        :param kind: A key of CHARTS
+        :param measures: Names of the plotted series
+        :return: The key, None when the table has no change token
+        """
+        token = self.result_cache.token(data_name)
+        if token is None:
+            return None
+        return data_name, token, kind, tuple(measures), None if kind == "bar" else self.chart_grain
+
+    def chart_arrays(self, key, prepare):
+        """
+        Prepared plotting arrays, from the chart cache when possible
+
+        :param key: The chart_key, None to skip the cache
+        :param prepare: Callable returning an ordered mapping of name -> array
+        """
+        return prepare() if key is None else self.chart_cache.lookup(key, ARRAYS, prepare)
+
+    def show_cached_chart(self, image_key, title, fmt="png"):
+        """
+        Show a chart image rendered earlier, without aggregating nor drawing
+
+        :param image_key: The chart_key with the figure size and dpi, None to skip the cache
+        :param title: The window title
+        :param fmt: The image format
+        :return: True on a hit
+        """
+        data = None if image_key is None else self.chart_cache.get(image_key, fmt)
+        if data is None:
+            return False
+        self.show_chart(title, data)
+        return True
+
+    def render_chart(self, spec, arrays, image_key=None, query=None):
+        """
+        Render a chart in a worker process and show it in a ChartFrame once done
+
+        :param spec: The charts.chart_spec
+        :param arrays: Name -> array, 'x' and the spec series, or with a query the DW table it runs on
+        :param image_key: Chart cache key of the image, None to skip the cache
+        :param query: A PivotQuery the worker runs on the shared DW table, None when the arrays are given
+        """
+        if self.chart_renderer is None:
+            self.chart_renderer = ChartRenderer(self.chart_workers)
+
+        def done(future):
+            try:
+                data = future.result()
+            except Exception as e:
+                wx.CallAfter(arcpy.AddError, str(e))
+                return
+            if image_key is not None:
+                self.chart_cache.put(image_key, spec["format"], data)
+            wx.CallAfter(self.show_chart, spec["title"], data)
+
+        if query is None:
+            self.chart_renderer.submit(spec, arrays).add_done_callback(done)
+            return
+        # The table version stays in shared memory while the worker reads it
+        pin = self.warehouse.acquire(self.data_warehouse)
+        try:
+            future = self.chart_renderer.submit_query(spec, self.shared_table(arrays), query)
+        except Exception:
+            self.warehouse.release(pin.snapshot)
+            raise
+        future.add_done_callback(lambda f: self.warehouse.release(pin.snapshot))
+        future.add_done_callback(done)
+
+    def show_chart(self, title, data):
+        """
+        Show rendered chart bytes, on the UI thread
+
+        :param title: The window title
+        :param data: PNG or SVG bytes
+        """
+        from chart_frame import ChartFrame
+
+        ChartFrame(self, title, data)
+
+    def decimated_plot(self, name, ax, data_name, x, ys, render):
+        """
+        Draw series reduced to the axes width with LTTB, reduced again on zoom
+
+        :param name: The plot name
+        :param ax: The axes
+        :param data_name: The dimension name the series come from
+        :param x: Sorted x values
+        :param ys: Ordered mapping of series name -> y values
+        :param render: Callable(ax, x, ys) drawing the series and returning the artists
+        """
+        key = (data_name, self.data_warehouse.version_of(data_name), self.chart_grain, name)
+        self.zoom_plots[name] = ZoomDecimator(ax, x, ys, render, self.decimator, key)
+
     def graphPlot(self, data_name):
         """
         Bar plot
@@ -326,70 +988,46 @@ class Pivot(wx.Frame):
         :param data_name: The dimension name
         """
         try:
-            df_temp = self.data_warehouse[data_name].groupby("Country_Re")[["Confirmed",
-                                                                            "Deaths",
-                                                                            "Recovred"]].max().reset_index()
-            df_temp.drop(df_temp[(df_temp.Confirmed == 0) & (df_temp.Recovred == 0) & (df_temp.Deaths == 0)].index,
-                         inplace=True)
-            data = pd.DataFrame.spatial.from_featureclass("covid_cases")
-            df_temp = data.groupby("Country_Re")[["Confirmed", "Deaths", "Recovred"]].max().reset_index()
-            df_temp.drop(df_temp[(df_temp.Confirmed == 0) & (df_temp.Recovred == 0) & (df_temp.Deaths == 0)].index,
-                         inplace=True)
-
-            n = math.ceil(df_temp.Country_Re.count() / 2)
-            ind = np.arange(df_temp.Country_Re.count())[:n]
-
-            f, (ax1, ax2) = plt.subplots(nrows=2, figsize=(20, 10), dpi=70)
-
-            p1 = ax1.bar(ind - 0.25, df_temp.Confirmed.head(n), 0.25, color=(0.95, 0.62, 0.07, 1), picker=6)
-            p2 = ax1.bar(ind, df_temp.Recovred.head(n), 0.25, color=(0.12, 0.52, 0.29, 1), picker=6)
-            p3 = ax1.bar(ind + 0.25, df_temp.Deaths.head(n), 0.25, color=(1, 0, 0, 1), picker=6)
-
-            p4 = ax2.bar(ind - 0.25, df_temp.Confirmed.tail(n), 0.25, color=(0.95, 0.62, 0.07, 1), picker=6)
-            p5 = ax2.bar(ind, df_temp.Recovred.tail(n), 0.25, color=(0.12, 0.52, 0.29, 1), picker=6)
-            p6 = ax2.bar(ind + 0.25, df_temp.Deaths.tail(n), 0.25, color=(1, 0, 0, 1), picker=6)
-
-            def on_pick(event):
-                rect = event.artist
-                height = rect.get_height()
-                try:
-                    ann = ax1.annotate('{}'.format(height),
-                                       xy=(rect.get_x() + rect.get_width() / 2, height),
-                                       xytext=(0, 3),  # 3 points vertical offset
-                                       textcoords="offset points",
-                                       ha='center', va='bottom')
-
-                    ann2 = ax2.annotate('{}'.format(height),
-                                        xy=(rect.get_x() + rect.get_width() / 2, height),
-                                        xytext=(0, 3),  # 3 points vertical offset
-                                        textcoords="offset points",
-                                        ha='center', va='bottom')
-
-                    plt.pause(1)
-                    ann.remove()
-                    ann2.remove()
-                    f.canvas.draw()
-                except Exception as e:
-                    print(str(e))
+            measures = ("Confirmed", "Deaths", "Recovred")
+            plotted = ("Confirmed", "Recovred", "Deaths")
+            key = self.chart_key("covid_cases", "bar", plotted)
+            image_key = key and key + ((20, 6), 70)
+            if self.render_out_of_process and self.show_cached_chart(image_key, CHARTS["bar"]["title"],
+                                                                    self.chart_format):
+                return
 
-            f.canvas.mpl_connect('pick_event', on_pick)
+            query = dict(group_by=("Country_Re",), order_by=("Country_Re",),
+                         aggregates=[(m, "MAX") for m in measures], where=[[(m, "<>", 0) for m in measures]])
 
-            plt.sca(ax1)
-            ax1.set_title('Confirmed, Recovred and Deaths numbers by Country_Re.')
-            plt.xticks(ind, df_temp.Country_Re.head(n), rotation=90)
-            ax1.set_yscale('symlog')
-            ax1.legend((p1[0], p2[0], p3[0]), ('Confirmed', 'Recovred', 'Deaths'))
-            ax1.margins(x=0.001)
-            plt.tick_params(axis="x", width=10)
-            plt.tight_layout()
+            def prepare():
+                df_temp = self.run_query("covid_cases", **query)
+                return collections.OrderedDict([("x", df_temp.Country_Re.values)] +
+                                               [(m, df_temp[m].values) for m in plotted])
+
+            if self.render_out_of_process:
+                spec = chart_spec("bar", plotted, None, dpi=70, fmt=self.chart_format)
+                arrays = self.chart_cache.get(key, ARRAYS) if key is not None else None
+                if arrays is None and "covid_cases" in self.data_warehouse:
+                    # The worker groups the shared table itself
+                    self.render_chart(spec, "covid_cases", image_key, PivotQuery("covid_cases", **query))
+                else:
+                    self.render_chart(spec, arrays if arrays is not None else self.chart_arrays(key, prepare),
+                                      image_key)
+                return
+
+            arrays = self.chart_arrays(key, prepare)
+            series = collections.OrderedDict((m, arrays[m]) for m in plotted)
 
-            plt.sca(ax2)
-            ax2.set_title('Confirmed, Recovred and Deaths numbers by Country_Re.')
-            plt.xticks(ind, df_temp.Country_Re.tail(n), rotation=90)
-            ax2.set_yscale('symlog')
-            ax2.legend((p4[0], p5[0], p6[0]), ('Confirmed', 'Recovred', 'Deaths'))
-            ax2.margins(x=0.001)
+            f, ax = plt.subplots(figsize=(20, 6), dpi=70)
+            ax.set_yscale('symlog')
 
+            # Only the countries in view are drawn; the wheel and arrow keys scroll, hovering shows values
+            self.bar_chart = VirtualBarChart(ax, arrays["x"], series,
+                                             colors=[COLORS[m] for m in series])
+            self.bar_chart.connect()
+
+            ax.set_title('Confirmed, Recovred and Deaths numbers by Country_Re.')
+            ax.legend(loc=1)
             plt.tick_params(axis="x", width=10)
             plt.tight_layout()
 
@@ -403,39 +1041,39 @@ class Pivot(wx.Frame):
 
         :param data_name: The dimension name
         """
-        df_temp = self.data_warehouse[data_name].groupby("Date")[
-            "Confirmed", "Deaths", "Recovred"].max().reset_index()
-        # Agregate Date
-        df_temp['Date'] = pd.to_datetime(df_temp['Date'])
-        df_temp = df_temp.groupby(pd.Grouper(key='Date', freq='W-MON'))[
-            "Confirmed", "Deaths", "Recovred"].max().reset_index()
-
-        fig, ax = plt.subplots(figsize=(20, 5))
-        plt.grid()
-        ax.stackplot(df_temp.Date.values, df_temp.Deaths.values, df_temp.Recovred.values, df_temp.Confirmed.values,
-                     labels=["Deaths", "Recovred", "Confirmed"],
-                     colors=[(1, 0, 0, 1), (0.12, 0.52, 0.29, 1), (0.95, 0.62, 0.07, 1)])
-        ax.legend(loc=2)
-        plt.title("Confirmed, Deaths and Recovred cases stack by Date.")
-        plt.xticks(rotation=70)
-        plt.tight_layout()
-        plt.show()
+        def prepare():
+            return self.time_series(data_name, ("Deaths", "Recovred", "Confirmed"))
+
+        self.timePlot("stack", data_name, ("Deaths", "Recovred", "Confirmed"), prepare)
 
-    def makeLabel(self, lyr_name, field_name):
+    def makeLabel(self, lyr_name, field_name, profile=None):
         """
         Setup lauer labels
 
         :param lyr_name: The layer name
         :param field_name: The field's name we want to label with
+        :param profile: One of LABEL_PROFILES, label_profile by default
         """
+        profile = profile or self.label_profile
         lyr = self.lyr_dict[lyr_name]
-        definition = lyr.getDefinition('V2')
+        definition = self.arcpy_calls.definition(lyr)
         definition.visibility = True
+        where = self.label_filter(lyr_name, field_name)
+
+        # Fast profile: Standard engine labels on the precomputed anchor points, instead of Maplex polygon placement
+        if profile == "fast" and self.anchor_labels(lyr_name, field_name, where):
+            self.set_label_engine(maplex=False)
+            definition.labelVisibility = False
+            self.arcpy_calls.set_definition(lyr, definition)
+            return
+        self.set_label_engine(maplex=True)
+
         definition.labelClasses[0] = {
             "type": "CIMLabelClass",
             "expression": "$feature."+field_name,
             "expressionEngine": "Arcade",
             "featuresToLabel": "AllVisibleFeatures",
+            "whereClause": where,
             "maplexLabelPlacementProperties": {
                 "type": "CIMMaplexLabelPlacementProperties",
                 "featureType": "Polygon",
@@ -641,9 +1279,89 @@ class Pivot(wx.Frame):
             "iD": -1
         }
         definition.labelVisibility = True
-        lyr.setDefinition(definition)
+        self.arcpy_calls.set_definition(lyr, definition)
         return
 
+    def label_filter(self, lyr_name, field_name):
+        """
+        SQL filter labeling only the label_top_n features by label_measure
+
+        :param lyr_name: The layer name
+        :param field_name: The labeled field
+        :return: A where clause, empty for all features
+        """
+        if not self.label_top_n or lyr_name not in self.sources:
+            return ""
+        try:
+            return top_n_where(self.data_warehouse[lyr_name], field_name, self.label_measure, self.label_top_n)
+        except Exception as e:
+            arcpy.AddWarning("Labels not filtered: " + str(e))
+            return ""
+
+    def anchor_labels(self, lyr_name, field_name, where=""):
+        """
+        Label a layer through an unsymbolized point layer of its cached label anchors
+
+        :param lyr_name: The layer name
+        :param field_name: The labeled field
+        :param where: SQL filter of the labeled features
+        :return: True if the anchors layer was added
+        """
+        if lyr_name not in self.sources or not self.sources[lyr_name][1]:
+            return False
+        source = self.sources[lyr_name][0]
+        try:
+            path = self.label_anchors.publish(os.path.join(str(self.workspace), source), self.catalog.token(source),
+                                              self.geometry(lyr_name), self.data_warehouse[lyr_name], field_name,
+                                              (self.label_measure,))
+            anchors = self.arcpy_calls.add_data(self.active_map, path).result()
+            definition = self.arcpy_calls.definition(anchors)
+            definition.renderer = {
+                "type": "CIMSimpleRenderer",
+                "symbol": {
+                    "type": "CIMSymbolReference",
+                    "symbol": {
+                        "type": "CIMPointSymbol",
+                        "symbolLayers": []
+                    }
+                }
+            }
+            definition.labelClasses = [standard_label_class(field_name, where)]
+            definition.labelVisibility = True
+            definition.visibility = True
+            self.arcpy_calls.set_definition(anchors, definition)
+            self.companions.setdefault(lyr_name, []).append(anchors)
+            return True
+        except Exception as e:
+            arcpy.AddWarning("Anchor labels not built, using Maplex: " + str(e))
+            return False
+
+    def set_label_engine(self, maplex):
+        """
+        Switch the map between the Maplex and the Standard label engines
+
+        :param maplex: True for Maplex
+        """
+        try:
+            definition = self.arcpy_calls.definition(self.active_map)
+            placement = definition.generalPlacementProperties
+            if ("Maplex" in type(placement).__name__) == maplex:
+                return
+            if maplex:
+                definition.generalPlacementProperties = self.maplex_placement or {
+                    "type": "CIMMaplexGeneralPlacementProperties",
+                    "placementQuality": "High"
+                }
+            else:
+                self.maplex_placement = placement
+                definition.generalPlacementProperties = {
+                    "type": "CIMStandardGeneralPlacementProperties",
+                    "invertedLabelTolerance": 2
+                }
+            self.arcpy_calls.set_definition(self.active_map, definition)
+        except Exception as e:
+            arcpy.AddError(str(e))
+
     def make_class_breaks_symb(self, lyr_name):
         """
         Setup lauer 'ClassBreaksRenderer' symbology
@@ -652,7 +1370,7 @@ class Pivot(wx.Frame):
         """
         try:
             lyr = self.lyr_dict[lyr_name]
-            definition = lyr.getDefinition('V2')
+            definition = self.arcpy_calls.definition(lyr)
 
             definition.renderer = {
                 "type": "CIMClassBreaksRenderer",
@@ -1194,12 +1912,13 @@ class Pivot(wx.Frame):
                 "type": "CIMSymbolLayerDrawing"
             }
             definition.visibility = True
+            self.scale_levels(lyr_name, definition)
 
-            lyr.setDefinition(definition)
-            self.active_map.addLayer(lyr, 'TOP')
+            self.arcpy_calls.set_definition(lyr, definition)
+            self.arcpy_calls.add_layer(self.active_map, lyr, 'TOP')
 
-            self.active_map.removeLayer(lyr)
-            self.lyr_dict = {lyr.name.lower(): lyr for lyr in self.active_map.listLayers()}
+            self.arcpy_calls.remove_layer(self.active_map, lyr)
+            self.lyr_dict = self.map_layers()
         except Exception as e:
             arcpy.AddError(str(e))
         return
@@ -1212,7 +1931,7 @@ class Pivot(wx.Frame):
         """
         try:
             lyr = self.lyr_dict[lyr_name]
-            definition = lyr.getDefinition('V2')
+            definition = self.arcpy_calls.definition(lyr)
 
             definition.renderer = {
                 "type": "CIMClassBreaksRenderer",
@@ -2414,16 +3133,50 @@ class Pivot(wx.Frame):
                 ]
             }
             definition.visibility = True
+            self.cluster_levels(lyr_name, definition)
 
-            lyr.setDefinition(definition)
-            self.active_map.addLayer(lyr, 'TOP')
+            self.arcpy_calls.set_definition(lyr, definition)
+            self.arcpy_calls.add_layer(self.active_map, lyr, 'TOP')
 
-            self.active_map.removeLayer(lyr)
-            self.lyr_dict = {lyr.name.lower(): lyr for lyr in self.active_map.listLayers()}
+            self.arcpy_calls.remove_layer(self.active_map, lyr)
+            self.lyr_dict = self.map_layers()
         except Exception as e:
             arcpy.AddError(str(e))
         return
 
+    def make_hexbin_symb(self, lyr_name, field="Confirmed"):
+        """
+        Replace a point layer by hexagons aggregating its measures, classified with computed breaks
+
+        :param lyr_name: The point layer name
+        :param field: The classified measure
+        """
+        source = self.sources[lyr_name][0] if lyr_name in self.sources else None
+        try:
+            path = os.path.join(str(self.workspace), source)
+            size = self.hexbin_size or self.hexbins.default_size(
+                path, self.arcpy_calls.call(getattr, self.active_map, "referenceScale"))
+            df = self.data_warehouse[lyr_name]
+            xy = self.geometry(lyr_name).centroid()
+            out, cells = self.hexbins.publish(path, self.catalog.token(source), size, xy[:, 0], xy[:, 1],
+                                              {m: df[m].values for m in CLUSTER_MEASURES if m in df.columns},
+                                              df["Date"].values if "Date" in df.columns else None)
+        except Exception as e:
+            arcpy.AddWarning("Hexbins not built, drawing every point: " + str(e))
+            return self.make_point_class_breaks_symb(lyr_name)
+
+        try:
+            hexagons = self.arcpy_calls.add_data(self.active_map, out).result()
+            definition = self.arcpy_calls.definition(hexagons)
+            definition.renderer = class_breaks_renderer(field, quantile_breaks(cells[field].values))
+            definition.visibility = True
+            self.arcpy_calls.set_definition(hexagons, definition)
+            # setTimeCursor on the point layer reaches the hexagons
+            self.companions.setdefault(lyr_name, []).append(hexagons)
+        except Exception as e:
+            arcpy.AddError(str(e))
+        self.hide(lyr_name)
+
     def make_simple_symb(self, lyr_name):
         """
         Setup simple class symbology
@@ -2432,7 +3185,7 @@ class Pivot(wx.Frame):
         """
         try:
             lyr = self.lyr_dict[lyr_name]
-            definition = lyr.getDefinition('V2')
+            definition = self.arcpy_calls.definition(lyr)
 
             definition.renderer = {
                 "type": "CIMClassBreaksRenderer",
@@ -2901,11 +3654,11 @@ class Pivot(wx.Frame):
             }
             definition.visibility = True
 
-            lyr.setDefinition(definition)
-            self.active_map.addLayer(lyr, 'TOP')
+            self.arcpy_calls.set_definition(lyr, definition)
+            self.arcpy_calls.add_layer(self.active_map, lyr, 'TOP')
 
-            self.active_map.removeLayer(lyr)
-            self.lyr_dict = {lyr.name.lower(): lyr for lyr in self.active_map.listLayers()}
+            self.arcpy_calls.remove_layer(self.active_map, lyr)
+            self.lyr_dict = self.map_layers()
         except Exception as e:
             arcpy.AddError(str(e))
         return
@@ -2919,7 +3672,19 @@ class Pivot(wx.Frame):
         """
         try:
             lyr = self.lyr_dict[lyr_name]
-            definition = lyr.getDefinition('V2')
+            definition = self.arcpy_calls.definition(lyr)
+
+            """Pointing to the precomputed rates."""
+            materialized = False
+            if self.materialize_rates and lyr_name in self.sources:
+                try:
+                    source = self.sources[lyr_name][0]
+                    path = self.rate_materializer.materialize(os.path.join(str(self.workspace), source),
+                                                              self.catalog.token(source))
+                    definition.featureTable.dataConnection = self.rate_materializer.data_connection(path)
+                    materialized = True
+                except Exception as e:
+                    arcpy.AddWarning("Rates not materialized, using expressions: " + str(e))
 
             """Setting time."""
             definition.featureTable.timeFields = {
@@ -2932,8 +3697,7 @@ class Pivot(wx.Frame):
                 "useTime": True,
                 "customTimeExtent": {
                     "type": "TimeExtent",
-                    "start": 1579651200000,
-                    "end": 1594080000000,
+                    **self.time_extent(lyr_name),
                     "empty": False
                 }
             }
@@ -3480,8 +4244,9 @@ class Pivot(wx.Frame):
 
             definition.visibility = True
 
-            lyr.setDefinition(definition)
-            self.active_map.addLayer(lyr, 'TOP')
+            self.arcpy_calls.set_definition(lyr, definition)
+            self.arcpy_calls.add_layer(self.active_map, lyr, 'TOP')
+            self.class_report(lyr_name)
 
             """Recovred rate."""
             definition.renderer = {
@@ -4191,12 +4956,7 @@ class Pivot(wx.Frame):
                     }
                 },
                 "defaultLabel": "<out of range>",
-                "valueExpressionInfo": {
-                    "type": "CIMExpressionInfo",
-                    "title": "Recovred rate.",
-                    "expression": "$feature.Recovred/$feature.Confirmed",
-                    "returnType": "Default"
-                },
+                **self.rate_value("Recovred_Rate", "Recovred rate.", materialized),
                 "polygonSymbolColorTarget": "Fill",
                 "normalizationType": "Nothing",
                 "exclusionLabel": "<excluded>",
@@ -4247,9 +5007,9 @@ class Pivot(wx.Frame):
             }
             definition.visibility = True
 
-            lyr.setDefinition(definition)
+            self.arcpy_calls.set_definition(lyr, definition)
 
-            self.active_map.addLayer(lyr, 'TOP')
+            self.arcpy_calls.add_layer(self.active_map, lyr, 'TOP')
 
             """Deaths rate."""
             definition.renderer = {
@@ -4678,12 +5438,7 @@ class Pivot(wx.Frame):
                     }
                 },
                 "defaultLabel": "<out of range>",
-                "valueExpressionInfo": {
-                    "type": "CIMExpressionInfo",
-                    "title": "Deaths rate.",
-                    "expression": "$feature.Deaths/$feature.Confirmed",
-                    "returnType": "Default"
-                },
+                **self.rate_value("Deaths_Rate", "Deaths rate.", materialized),
                 "polygonSymbolColorTarget": "Fill",
                 "normalizationType": "Nothing",
                 "exclusionLabel": "<excluded>",
@@ -4734,16 +5489,109 @@ class Pivot(wx.Frame):
             }
             definition.visibility = True
 
-            lyr.setDefinition(definition)
+            self.arcpy_calls.set_definition(lyr, definition)
 
-            self.active_map.addLayer(lyr, 'TOP')
+            self.arcpy_calls.add_layer(self.active_map, lyr, 'TOP')
 
-            self.active_map.removeLayer(lyr)
-            self.lyr_dict = {lyr.name.lower(): lyr for lyr in self.active_map.listLayers()}
+            self.arcpy_calls.remove_layer(self.active_map, lyr)
+            self.lyr_dict = self.map_layers()
         except Exception as e:
             arcpy.AddError(str(e))
         return
 
+    def rate_value(self, field, title, materialized):
+        """
+        Renderer value of a rate: the precomputed field, or the equivalent Arcade expression
+
+        :param field: The rate field, a key of RATE_FIELDS
+        :param title: The expression title
+        :param materialized: True if the layer reads the scratch copy holding the rate fields
+        :return: Renderer properties
+        """
+        if materialized:
+            return {"field": field}
+        numerator, denominator = RATE_FIELDS[field]
+        return {
+            "valueExpressionInfo": {
+                "type": "CIMExpressionInfo",
+                "title": title,
+                "expression": "$feature.{}/$feature.{}".format(numerator, denominator),
+                "returnType": "Default"
+            }
+        }
+
+    def scale_levels(self, lyr_name, definition):
+        """
+        Add simplified copies of a polygon layer drawn at small scales, the layer itself keeping large scales
+
+        :param lyr_name: The layer name
+        :param definition: The layer CIM definition, its scale range is set here
+        """
+        if not self.generalize_polygons or lyr_name not in self.sources:
+            return
+        source, spatial = self.sources[lyr_name]
+        if not spatial or self.catalog.entries[source].geometry_type != "Polygon":
+            return
+        try:
+            levels = self.generalizer.generalize(os.path.join(str(self.workspace), source),
+                                                 self.catalog.token(source), self.geometry(lyr_name))
+        except Exception as e:
+            arcpy.AddWarning("Polygons not generalized, drawing full resolution: " + str(e))
+            return
+
+        self.add_companions(lyr_name, definition, levels)
+
+    def cluster_levels(self, lyr_name, definition):
+        """
+        Add grid clusters of a point layer drawn at small scales, the layer itself keeping large scales
+
+        :param lyr_name: The layer name
+        :param definition: The layer CIM definition, its scale range is set here
+        """
+        if not self.cluster_points or lyr_name not in self.sources:
+            return
+        source, spatial = self.sources[lyr_name]
+        if not spatial or self.catalog.entries[source].geometry_type != "Point":
+            return
+        try:
+            df = self.data_warehouse[lyr_name]
+            xy = self.geometry(lyr_name).centroid()
+            levels = self.clusterer.publish(os.path.join(str(self.workspace), source), self.catalog.token(source),
+                                            xy[:, 0], xy[:, 1],
+                                            {m: df[m].values for m in CLUSTER_MEASURES if m in df.columns},
+                                            df["Date"].values if "Date" in df.columns else None)
+        except Exception as e:
+            arcpy.AddWarning("Points not clustered, drawing every point: " + str(e))
+            return
+
+        self.add_companions(lyr_name, definition, levels)
+
+    def add_companions(self, lyr_name, definition, levels):
+        """
+        Add scale level layers drawn like a layer, which keeps the scales past the last level
+
+        :param lyr_name: The layer name
+        :param definition: The layer CIM definition, its scale range is set here
+        :param levels: List of (feature class path, minScale, maxScale), coarsest first
+        """
+        companions = self.companions.setdefault(lyr_name, [])
+        for path, min_scale, max_scale in levels:
+            level = self.arcpy_calls.add_data(self.active_map, path).result()
+            level_definition = self.arcpy_calls.definition(level)
+            level_definition.renderer = definition.renderer
+            level_definition.labelClasses = definition.labelClasses
+            level_definition.labelVisibility = definition.labelVisibility
+            level_definition.symbolLayerDrawing = definition.symbolLayerDrawing
+            level_definition.featureTable.timeFields = definition.featureTable.timeFields
+            level_definition.featureTable.timeDefinition = definition.featureTable.timeDefinition
+            level_definition.minScale = min_scale
+            level_definition.maxScale = max_scale
+            level_definition.visibility = True
+            self.arcpy_calls.set_definition(level, level_definition)
+            companions.append(level)
+        definition.minScale = levels[-1][2]
+        definition.maxScale = 0
+
     def setTimeCursor(self, lyr_name, time_field):
         """
         Activate the time cursor
@@ -4753,7 +5601,7 @@ class Pivot(wx.Frame):
         """
         try:
             lyr = self.lyr_dict[lyr_name]
-            definition = lyr.getDefinition('V2')
+            definition = self.arcpy_calls.definition(lyr)
 
             definition.featureTable.timeFields = {
                 "type": "CIMTimeTableDefinition",
@@ -4766,17 +5614,23 @@ class Pivot(wx.Frame):
                 "useTime": True,
                 "customTimeExtent": {
                     "type": "TimeExtent",
-                    "start": 1579651200000,
-                    "end": 1594080000000,
+                    **self.time_extent(lyr_name),
                     "empty": False
                 }
             }
 
-            lyr.setDefinition(definition)
-            self.active_map.addLayer(lyr, 'TOP')
+            self.arcpy_calls.set_definition(lyr, definition)
+            self.arcpy_calls.add_layer(self.active_map, lyr, 'TOP')
+
+            # The scale level layers follow the same time cursor
+            for level in self.companions.get(lyr_name, []):
+                level_definition = self.arcpy_calls.definition(level)
+                level_definition.featureTable.timeFields = definition.featureTable.timeFields
+                level_definition.featureTable.timeDefinition = definition.featureTable.timeDefinition
+                self.arcpy_calls.set_definition(level, level_definition)
 
-            self.active_map.removeLayer(lyr)
-            self.lyr_dict = {lyr.name.lower(): lyr for lyr in self.active_map.listLayers()}
+            self.arcpy_calls.remove_layer(self.active_map, lyr)
+            self.lyr_dict = self.map_layers()
         except Exception as e:
             arcpy.AddError(str(e))
         return
@@ -4786,12 +5640,14 @@ class Pivot(wx.Frame):
         Reset all layers
         """
         try:
-            [self.active_map.removeLayer(lyr) for lyr in self.active_map.listLayers()]
+            [self.arcpy_calls.remove_layer(self.active_map, lyr)
+             for lyr in self.arcpy_calls.call(self.active_map.listLayers)]
+            self.companions = {}
 
-            [self.active_map.addLayer(arcpy.MakeFeatureLayer_management(t, t).getOutput(0), 'TOP')
-             for t in arcpy.ListFeatureClasses()]
+            [self.arcpy_calls.add_layer(self.active_map, self.catalog.feature_layer(t, self.arcpy_calls), 'TOP')
+             for t in self.catalog.feature_classes]
 
-            self.lyr_dict = {lyr.name.lower(): lyr for lyr in self.active_map.listLayers()}
+            self.lyr_dict = self.map_layers()
         except Exception as e:
             arcpy.AddError(str(e))
         return
@@ -4804,20 +5660,29 @@ class Pivot(wx.Frame):
         """
         try:
             lyr = self.lyr_dict[lyr_name]
-            definition = lyr.getDefinition('V2')
+            definition = self.arcpy_calls.definition(lyr)
 
             definition.visibility = False
 
-            lyr.setDefinition(definition)
-            self.active_map.addLayer(lyr, 'BOTTOM')
+            self.arcpy_calls.set_definition(lyr, definition)
+            self.arcpy_calls.add_layer(self.active_map, lyr, 'BOTTOM')
 
-            self.active_map.removeLayer(lyr)
-            self.lyr_dict = {lyr.name.lower(): lyr for lyr in self.active_map.listLayers()}
+            self.arcpy_calls.remove_layer(self.active_map, lyr)
+            self.lyr_dict = self.map_layers()
         except Exception as e:
             arcpy.AddError(str(e))
         return
 
 
-app = wx.App()
-Pivot(None, title='Pivot')
-app.MainLoop()
+def main():
+    """
+    Entry point of the script tool: open the session from the tool parameters and run the interface
+    """
+    session = PivotSession.from_parameters()
+    app = wx.App()
+    Pivot(None, title='Pivot', session=session)
+    app.MainLoop()
+
+
+if __name__ == "__main__":
+    main()
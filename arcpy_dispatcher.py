@@ -0,0 +1,232 @@
+"""
+    Tool : Pivot, Source Name : arcpy_dispatcher.py, Author: M'hamed Bendenia.
+"""
+
+import collections
+import concurrent.futures
+import copy
+import threading
+import time
+
+
+class Command(object):
+    """ A queued arcpy call. """
+
+    name = None  #: Command name, e.g. 'setDefinition'
+    target = None  #: Layer or map the command changes, None for none
+    key = None  #: Stable identity of the target, see ArcpyDispatcher.key
+    queued = started = None  #: perf_counter times
+
+    def __init__(self, name, call, args, target=None):
+        """
+        Create the command
+
+        :param name: Command name
+        :param call: The arcpy callable
+        :param args: Its arguments, a list the dispatcher may update before the call
+        :param target: Layer or map the command changes
+        """
+        self.name = name
+        self.call = call
+        self.args = list(args)
+        self.target = target
+        self.key = None if target is None else ArcpyDispatcher.key(target)
+        self.future = concurrent.futures.Future()
+        self.queued = time.perf_counter()
+
+
+class ArcpyDispatcher(object):
+    """ One thread running the arcpy map and layer calls in order, redundant layer definition updates coalesced. """
+
+    max_depth = 0  #: Deepest queue seen
+    coalesced = 0  #: setDefinition calls merged into a pending one
+    on_error = None  #: Callables(command, exception) of the failed commands
+
+    def __init__(self):
+        """
+        Create the dispatcher, its thread starts with the first command
+        """
+        self.on_error = []
+        self._queue = collections.deque()
+        self._last = {}
+        self._latency = {}
+        self._busy = False
+        self._thread = None
+        self._condition = threading.Condition()
+
+    @staticmethod
+    def key(target):
+        """
+        Stable identity of a layer or map: arcpy returns a new wrapper object on each listing, so ids differ
+
+        :param target: The layer or map
+        :return: Its type and long name, URI or name, its id when it has none
+        """
+        for attribute in ("longName", "URI", "name"):
+            value = getattr(target, attribute, None)
+            if value:
+                return type(target).__name__, attribute, value
+        return type(target).__name__, "id", id(target)
+
+    def submit(self, name, call, *args, **kwargs):
+        """
+        Queue an arcpy call
+
+        :param name: Command name, latencies are reported per name
+        :param call: The arcpy callable
+        :param args: Its arguments
+        :param kwargs: target, the layer or map the call changes
+        :return: Future of the call's result
+        """
+        command = Command(name, call, args, kwargs.get("target"))
+        with self._condition:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="ArcpyDispatcher", daemon=True)
+                self._thread.start()
+            if command.key is not None:
+                self._last[command.key] = command
+            self._queue.append(command)
+            self.max_depth = max(self.max_depth, len(self._queue))
+            self._condition.notify()
+        return command.future
+
+    def call(self, call, *args):
+        """
+        Run an arcpy call after the queued ones and wait for its result
+
+        :param call: The arcpy callable
+        :param args: Its arguments
+        :return: The result
+        """
+        if threading.current_thread() is self._thread:
+            return call(*args)
+        return self.submit(getattr(call, "__name__", "call"), call, *args).result()
+
+    def definition(self, target):
+        """
+        CIM definition of a layer or map, a copy of the pending one if a setDefinition is queued
+
+        :param target: The layer or map
+        :return: The definition, passed back to set_definition once edited
+        """
+        with self._condition:
+            pending = self._last.get(self.key(target))
+            if pending is not None and pending.name == "setDefinition":
+                definition = pending.args[0]
+            else:
+                definition = None
+        if definition is not None:
+            # The queued command may run while the caller edits: the caller edits a copy
+            return copy.deepcopy(definition)
+        return self.call(target.getDefinition, "V2")
+
+    def set_definition(self, target, definition):
+        """
+        Queue a setDefinition, merged into the last queued command on the target when it is a setDefinition too
+
+        :param target: The layer or map
+        :param definition: The CIM definition
+        :return: Future of the call
+        """
+        # The caller may keep editing its definition for another layer: queue the state it has now
+        definition = copy.deepcopy(definition)
+        with self._condition:
+            pending = self._last.get(self.key(target))
+            if pending is not None and pending.name == "setDefinition":
+                pending.args[0] = definition
+                self.coalesced += 1
+                return pending.future
+        return self.submit("setDefinition", target.setDefinition, definition, target=target)
+
+    def add_layer(self, map_, layer, position="AUTO_ARRANGE"):
+        """
+        Queue a Map.addLayer
+
+        :param map_: The map
+        :param layer: The layer
+        :param position: 'AUTO_ARRANGE', 'BOTTOM' or 'TOP'
+        :return: Future of the call
+        """
+        return self.submit("addLayer", map_.addLayer, layer, position, target=layer)
+
+    def remove_layer(self, map_, layer):
+        """
+        Queue a Map.removeLayer
+
+        :param map_: The map
+        :param layer: The layer
+        :return: Future of the call
+        """
+        return self.submit("removeLayer", map_.removeLayer, layer, target=layer)
+
+    def add_data(self, map_, path):
+        """
+        Queue a Map.addDataFromPath
+
+        :param map_: The map
+        :param path: Path of the data
+        :return: Future of the new layer
+        """
+        return self.submit("addDataFromPath", map_.addDataFromPath, path)
+
+    def make_feature_layer(self, path, name):
+        """
+        Queue a MakeFeatureLayer
+
+        :param path: The feature class
+        :param name: The layer name
+        :return: Future of the layer
+        """
+        def make(path, name):
+            import arcpy
+
+            return arcpy.MakeFeatureLayer_management(path, name).getOutput(0)
+
+        return self.submit("MakeFeatureLayer", make, path, name)
+
+    def flush(self):
+        """
+        Wait for the queued commands
+        """
+        with self._condition:
+            while self._queue or self._busy:
+                self._condition.wait()
+
+    def metrics(self):
+        """
+        Queue depth and per command counts and latencies
+        """
+        with self._condition:
+            commands = {name: {"count": count, "mean_wait": wait / count, "mean_run": run / count, "max_run": longest}
+                        for name, (count, wait, run, longest) in self._latency.items()}
+            return {"depth": len(self._queue), "max_depth": self.max_depth, "coalesced": self.coalesced,
+                    "commands": commands}
+
+    def _run(self):
+        """
+        Dispatcher thread: run the commands in order
+        """
+        while True:
+            with self._condition:
+                while not self._queue:
+                    self._busy = False
+                    self._condition.notify_all()
+                    self._condition.wait()
+                command = self._queue.popleft()
+                self._busy = True
+                # Commands queued from now on no longer merge into this one
+                if command.key is not None and self._last.get(command.key) is command:
+                    del self._last[command.key]
+            command.started = time.perf_counter()
+            try:
+                command.future.set_result(command.call(*command.args))
+            except Exception as e:
+                command.future.set_exception(e)
+                for callback in self.on_error:
+                    callback(command, e)
+            finished = time.perf_counter()
+            with self._condition:
+                count, wait, run, longest = self._latency.get(command.name, (0, 0.0, 0.0, 0.0))
+                self._latency[command.name] = (count + 1, wait + command.started - command.queued,
+                                               run + finished - command.started,
+                                               max(longest, finished - command.started))
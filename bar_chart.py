@@ -0,0 +1,145 @@
+"""
+    Tool : Pivot, Source Name : bar_chart.py, Author: M'hamed Bendenia.
+"""
+
+import numpy as np
+
+BAR_WIDTH = 0.25  #: Width of one bar, a country spans len(measures) bars
+WINDOW = 40  #: Countries shown at once
+
+
+class VirtualBarChart(object):
+    """ Grouped bar chart drawing only the countries in view: one collection per measure, scrolled with the wheel. """
+
+    labels = None  #: Country of each group
+    heights = None  #: (measures, countries) array of bar heights
+    window = None  #: Countries shown at once
+    start = 0  #: First country shown
+
+    def __init__(self, ax, labels, measures, colors, window=WINDOW, width=BAR_WIDTH):
+        """
+        Draw the first window of bars
+
+        :param ax: The matplotlib axes
+        :param labels: Country of each group
+        :param measures: Ordered mapping of measure name -> heights, one per country
+        :param colors: One color per measure
+        :param window: Countries shown at once
+        :param width: Width of one bar
+        """
+        from matplotlib.collections import PolyCollection
+
+        self.ax = ax
+        self.labels = np.asarray(labels)
+        self.names = list(measures)
+        self.heights = np.vstack([np.asarray(v, dtype="f8") for v in measures.values()]).reshape(
+            len(self.names), len(self.labels))
+        self.window = min(window, len(self.labels))
+        self.width = width
+
+        # Bar left edges, measure-major within each country, sorted for bisection
+        offsets = (np.arange(len(self.names)) - (len(self.names) - 1) / 2) * width - width / 2
+        self.lefts = (np.arange(len(self.labels))[:, None] + offsets[None, :]).ravel()
+
+        self.collections = []
+        for name, color in zip(self.names, colors):
+            collection = PolyCollection([], facecolors=[color], edgecolors="none", label=name)
+            ax.add_collection(collection)
+            self.collections.append(collection)
+        self.annotation = ax.annotate("", xy=(0, 0), xytext=(0, 3), textcoords="offset points",
+                                      ha="center", va="bottom")
+        self.annotation.set_visible(False)
+        self.ax.set_ylim(0, max(np.nanmax(self.heights), 1) * 1.5 if self.heights.size else 1)
+        self.scroll_to(0)
+
+    def scroll_to(self, start):
+        """
+        Show the window of countries beginning at start, an empty axis without countries
+
+        :param start: First country shown
+        """
+        self.start = int(min(max(start, 0), max(len(self.labels) - self.window, 0)))
+        stop = self.start + self.window
+        ind = np.arange(self.start, stop)
+        for m, collection in enumerate(self.collections):
+            left = self.lefts[m::len(self.names)][self.start:stop]
+            top = self.heights[m, self.start:stop]
+            verts = np.stack([np.c_[left, np.zeros_like(top)], np.c_[left, top],
+                              np.c_[left + self.width, top], np.c_[left + self.width, np.zeros_like(top)]], axis=1)
+            collection.set_verts(verts)
+        self.ax.set_xlim(self.start - 0.5, max(stop, self.start + 1) - 0.5)
+        self.ax.set_xticks(ind)
+        self.ax.set_xticklabels(self.labels[self.start:stop], rotation=90)
+        self.annotation.set_visible(False)
+
+    def bar_at(self, x, y=None):
+        """
+        The bar under a data position, found by bisecting the bar left edges
+
+        :param x: Data x
+        :param y: Data y, bars are hit only below their top if given
+        :return: (country index, measure index) or None
+        """
+        i = int(np.searchsorted(self.lefts, x, side="right")) - 1
+        if i < 0 or x > self.lefts[i] + self.width:
+            return None
+        country, measure = divmod(i, len(self.names))
+        if not self.start <= country < self.start + self.window:
+            return None
+        if y is not None and not 0 <= y <= self.heights[measure, country]:
+            return None
+        return country, measure
+
+    def connect(self):
+        """
+        Wire scrolling, hover and click to the figure
+
+        :return: The connection ids
+        """
+        canvas = self.ax.figure.canvas
+        return [canvas.mpl_connect("scroll_event", self.on_scroll),
+                canvas.mpl_connect("key_press_event", self.on_key),
+                canvas.mpl_connect("motion_notify_event", self.on_hover),
+                canvas.mpl_connect("button_press_event", self.on_hover)]
+
+    def on_scroll(self, event):
+        """
+        Scroll a few countries per wheel step
+
+        :param event: The scroll event
+        """
+        self.scroll_to(self.start - int(event.step) * max(self.window // 8, 1))
+        self.ax.figure.canvas.draw_idle()
+
+    def on_key(self, event):
+        """
+        Page with the arrow keys
+
+        :param event: The key event
+        """
+        steps = {"left": -1, "right": 1, "pageup": -1, "pagedown": 1}
+        if event.key in steps:
+            self.scroll_to(self.start + steps[event.key] * self.window)
+            self.ax.figure.canvas.draw_idle()
+
+    def on_hover(self, event):
+        """
+        Show the value of the bar under the mouse
+
+        :param event: The mouse event
+        """
+        if event.inaxes is not self.ax or event.xdata is None:
+            hit = None
+        else:
+            hit = self.bar_at(event.xdata, event.ydata)
+        if hit is None:
+            if self.annotation.get_visible():
+                self.annotation.set_visible(False)
+                self.ax.figure.canvas.draw_idle()
+            return
+        country, measure = hit
+        height = self.heights[measure, country]
+        self.annotation.xy = (self.lefts[country * len(self.names) + measure] + self.width / 2, height)
+        self.annotation.set_text("{}: {:,.0f}".format(self.names[measure], height))
+        self.annotation.set_visible(True)
+        self.ax.figure.canvas.draw_idle()
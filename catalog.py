@@ -0,0 +1,187 @@
+"""
+    Tool : Pivot, Source Name : catalog.py, Author: M'hamed Bendenia.
+"""
+
+import hashlib
+import os
+
+from watcher import table_signatures
+
+
+def gdb_fingerprint(workspace):
+    """
+    Fingerprint of a file geodatabase: names, sizes and write times of its files
+
+    :param workspace: The gdb path
+    :return: A hex digest, None if the folder can't be read
+    """
+    digest = hashlib.md5()
+    try:
+        entries = sorted(os.scandir(str(workspace)), key=lambda e: e.name)
+    except OSError:
+        return None
+    for entry in entries:
+        # Lock files come and go with every reader, including ours
+        if not entry.is_file() or entry.name.endswith(".lock"):
+            continue
+        stat = entry.stat()
+        digest.update("{}:{}:{};".format(entry.name, stat.st_size, stat.st_mtime_ns).encode())
+    return digest.hexdigest()
+
+
+class CatalogEntry(object):
+    """ Cached description of one feature class or table. """
+
+    def __init__(self, name, spatial, fields, geometry_type, rows, spatial_reference, dsid=None):
+        """
+        Create the entry
+
+        :param name: The feature class or table name
+        :param spatial: True for a feature class
+        :param fields: List of (field name, field type)
+        :param geometry_type: Shape type, None for a table
+        :param rows: Row count
+        :param spatial_reference: Spatial reference name, None for a table
+        :param dsid: Dataset id, the number in the file gdb's table file names
+        """
+        self.dsid = dsid
+        self.name = name
+        self.spatial = spatial
+        self.fields = fields
+        self.geometry_type = geometry_type
+        self.rows = rows
+        self.spatial_reference = spatial_reference
+
+    def field_names(self):
+        """
+        The entry's field names
+        """
+        return [name for name, _ in self.fields]
+
+
+class Catalog(object):
+    """ Workspace catalog read once from arcpy and re-read only when the gdb fingerprint changes. """
+
+    workspace = None  #: The gdb path
+    fingerprint = None  #: Fingerprint the entries were read at
+    entries = None  #: Name -> CatalogEntry
+    signatures = None  #: Table id -> signature of its files, at the same time
+
+    def __init__(self, workspace):
+        """
+        Read the workspace catalog
+
+        :param workspace: The gdb path
+        """
+        self.workspace = workspace
+        self.entries = {}
+        self.signatures = {}
+        self._layers = {}
+        self.refresh()
+
+    @property
+    def feature_classes(self):
+        """
+        Feature class names, in workspace order
+        """
+        return [e.name for e in self.entries.values() if e.spatial]
+
+    @property
+    def tables(self):
+        """
+        Table names, in workspace order
+        """
+        return [e.name for e in self.entries.values() if not e.spatial]
+
+    def refresh(self, force=False, names=None):
+        """
+        Re-read the catalog if the gdb changed
+
+        :param force: Re-read even if the fingerprint did not change
+        :param names: Re-describe only these known feature classes or tables, the schema being unchanged
+        :return: True if the catalog was re-read
+        """
+        fingerprint = gdb_fingerprint(self.workspace)
+        if names is not None and self.entries:
+            for name in names:
+                if name in self.entries:
+                    self.entries[name] = self._describe(name, self.entries[name].spatial)
+                    self._layers.pop(name, None)
+            self.fingerprint = fingerprint
+            self.signatures = table_signatures(self.workspace)
+            return True
+        if not force and self.entries and fingerprint is not None and fingerprint == self.fingerprint:
+            return False
+
+        import arcpy
+
+        entries = {}
+        for name in arcpy.ListFeatureClasses() or []:
+            entries[name] = self._describe(name, spatial=True)
+        for name in arcpy.ListTables() or []:
+            entries[name] = self._describe(name, spatial=False)
+        self.entries = entries
+        self.fingerprint = fingerprint
+        self.signatures = table_signatures(self.workspace)
+        self._layers = {}
+        return True
+
+    def name_of(self, table_id):
+        """
+        Feature class or table stored in a table id's files
+
+        :param table_id: The table id
+        :return: The name, None if unknown
+        """
+        for entry in self.entries.values():
+            if entry.dsid == table_id:
+                return entry.name
+        return None
+
+    def token(self, name):
+        """
+        Change token of a feature class or table: its row count and the signature of its own files, or the
+        whole gdb fingerprint when its files are unknown
+
+        :param name: The feature class or table name
+        """
+        entry = self.entries.get(name)
+        if entry is None:
+            return None, self.fingerprint
+        signature = self.signatures.get(entry.dsid)
+        return entry.rows, signature if signature is not None else self.fingerprint
+
+    def feature_layer(self, name, dispatcher=None):
+        """
+        Feature layer of a feature class, made once per catalog version
+
+        :param name: The feature class name
+        :param dispatcher: ArcpyDispatcher to make it on, the calling thread if None
+        """
+        if name not in self._layers:
+            if dispatcher is not None:
+                self._layers[name] = dispatcher.make_feature_layer(name, name).result()
+            else:
+                import arcpy
+
+                self._layers[name] = arcpy.MakeFeatureLayer_management(name, name).getOutput(0)
+        return self._layers[name]
+
+    def _describe(self, name, spatial):
+        """
+        Describe one feature class or table
+
+        :param name: The feature class or table name
+        :param spatial: True for a feature class
+        """
+        import arcpy
+
+        fields = [(f.name, f.type) for f in arcpy.ListFields(name)]
+        rows = int(arcpy.management.GetCount(name).getOutput(0))
+        desc = arcpy.Describe(name)
+        geometry_type = spatial_reference = None
+        if spatial:
+            geometry_type = desc.shapeType
+            spatial_reference = desc.spatialReference.name
+        return CatalogEntry(name, spatial, fields, geometry_type, rows, spatial_reference,
+                            getattr(desc, "DSID", None))
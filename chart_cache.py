@@ -0,0 +1,169 @@
+"""
+    Tool : Pivot, Source Name : chart_cache.py, Author: M'hamed Bendenia.
+"""
+
+import collections
+import hashlib
+import os
+import threading
+
+import numpy as np
+
+from result_cache import sizeof
+
+ARRAYS = "arrays"  #: Entry kind of the prepared plotting arrays, images are keyed by their format
+
+
+class ChartCache(object):
+    """ Memory and disk cache of prepared chart arrays and rendered chart images, least recently used first out. """
+
+    folder = None  #: Disk cache folder
+    max_bytes = None  #: Memory ceiling
+    max_disk_bytes = None  #: Disk ceiling
+    resident_bytes = 0  #: Memory held by the cached entries
+    hits = disk_hits = misses = evictions = 0  #: Counters
+
+    def __init__(self, folder, max_bytes=64 * 1024 ** 2, max_disk_bytes=256 * 1024 ** 2):
+        """
+        Create the cache
+
+        :param folder: Disk cache folder
+        :param max_bytes: Memory ceiling in bytes
+        :param max_disk_bytes: Disk ceiling in bytes
+        """
+        self.folder = folder
+        self.max_bytes = max_bytes
+        self.max_disk_bytes = max_disk_bytes
+        os.makedirs(folder, exist_ok=True)
+        self._entries = collections.OrderedDict()
+        self._lock = threading.RLock()
+
+    def path(self, key, kind):
+        """
+        File of an entry
+
+        :param key: The chart key, its repr must be stable across sessions
+        :param kind: ARRAYS or an image format
+        """
+        digest = hashlib.sha1(repr(key).encode("utf-8")).hexdigest()
+        return os.path.join(self.folder, "{}.{}".format(digest, "npz" if kind == ARRAYS else kind))
+
+    def get(self, key, kind):
+        """
+        Look an entry up, in memory then on disk
+
+        :param key: The chart key
+        :param kind: ARRAYS or an image format
+        :return: Ordered mapping of name -> array, image bytes, or None on a miss
+        """
+        with self._lock:
+            if (key, kind) in self._entries:
+                self._entries.move_to_end((key, kind))
+                self.hits += 1
+                return self._entries[(key, kind)][0]
+        path = self.path(key, kind)
+        try:
+            if kind == ARRAYS:
+                with np.load(path) as npz:
+                    value = collections.OrderedDict((name, npz[name]) for name in npz.files)
+            else:
+                with open(path, "rb") as f:
+                    value = f.read()
+            os.utime(path)
+        except (OSError, ValueError):
+            with self._lock:
+                self.misses += 1
+            return None
+        with self._lock:
+            self.disk_hits += 1
+        self._remember(key, kind, value)
+        return value
+
+    def put(self, key, kind, value):
+        """
+        Store an entry in memory and on disk
+
+        :param key: The chart key
+        :param kind: ARRAYS or an image format
+        :param value: Mapping of name -> array, or image bytes
+        :return: The value
+        """
+        if kind == ARRAYS:
+            value = collections.OrderedDict((name, a.astype(str) if a.dtype == object else a)
+                                            for name, a in value.items())
+        self._remember(key, kind, value)
+        path = self.path(key, kind)
+        temp = "{}.{}.tmp".format(path, threading.get_ident())
+        try:
+            # Written aside then renamed, readers never see a partial file
+            with open(temp, "wb") as f:
+                if kind == ARRAYS:
+                    np.savez(f, **value)
+                else:
+                    f.write(value)
+            os.replace(temp, path)
+        except OSError:
+            return value
+        self._trim_disk()
+        return value
+
+    def lookup(self, key, kind, compute):
+        """
+        Get an entry, computing and storing it on a miss
+
+        :param key: The chart key
+        :param kind: ARRAYS or an image format
+        :param compute: Callable producing the value
+        """
+        value = self.get(key, kind)
+        if value is None:
+            value = self.put(key, kind, compute())
+        return value
+
+    def stats(self):
+        """
+        Hit, miss and eviction counters
+        """
+        lookups = self.hits + self.disk_hits + self.misses
+        return {"hits": self.hits, "disk_hits": self.disk_hits, "misses": self.misses, "evictions": self.evictions,
+                "hit_rate": (self.hits + self.disk_hits) / lookups if lookups else 0.0,
+                "entries": len(self._entries), "resident_bytes": self.resident_bytes}
+
+    def _remember(self, key, kind, value):
+        """
+        Keep an entry in memory, evicting the least recently used ones past the ceiling
+
+        :param key: The chart key
+        :param kind: ARRAYS or an image format
+        :param value: The value
+        """
+        size = len(value) if isinstance(value, bytes) else sizeof(value)
+        with self._lock:
+            if (key, kind) in self._entries:
+                self.resident_bytes -= self._entries.pop((key, kind))[1]
+            if size > self.max_bytes:
+                return
+            self._entries[(key, kind)] = (value, size)
+            self.resident_bytes += size
+            while self.resident_bytes > self.max_bytes:
+                self.resident_bytes -= self._entries.popitem(last=False)[1][1]
+                self.evictions += 1
+
+    def _trim_disk(self):
+        """
+        Delete the least recently used files past the disk ceiling
+        """
+        files = []
+        for entry in os.scandir(self.folder):
+            if entry.is_file():
+                stat = entry.stat()
+                files.append((stat.st_mtime, stat.st_size, entry.path))
+        total = sum(size for _, size, _ in files)
+        for _, size, path in sorted(files):
+            if total <= self.max_disk_bytes:
+                break
+            try:
+                os.remove(path)
+                total -= size
+            except OSError:
+                pass
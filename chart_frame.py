@@ -0,0 +1,49 @@
+"""
+    Tool : Pivot, Source Name : chart_frame.py, Author: M'hamed Bendenia.
+"""
+
+import io
+
+import wx
+
+PNG_SIGNATURE = b"\x89PNG\r\n\x1a\n"  #: First bytes of a PNG file
+
+
+class ChartFrame(wx.Frame):
+    """ Window showing a chart rendered out of process, as a bitmap. """
+
+    data = None  #: The PNG or SVG bytes
+
+    def __init__(self, parent, title, data):
+        """
+        Show the chart
+
+        :param parent: The parent window
+        :param title: The window title
+        :param data: PNG or SVG bytes
+        """
+        super(ChartFrame, self).__init__(parent, title=title)
+        self.data = data
+        bitmap = self.bitmap(data)
+        panel = wx.ScrolledWindow(self)
+        panel.SetScrollRate(10, 10)
+        panel.SetVirtualSize(bitmap.GetSize())
+        wx.StaticBitmap(panel, bitmap=bitmap)
+        display = wx.GetClientDisplayRect()
+        self.SetClientSize(min(bitmap.GetWidth(), display.width), min(bitmap.GetHeight(), display.height))
+        self.Show()
+
+    @staticmethod
+    def bitmap(data):
+        """
+        Decode a rendered chart
+
+        :param data: PNG or SVG bytes
+        :return: A wx.Bitmap
+        """
+        if data.startswith(PNG_SIGNATURE):
+            return wx.Bitmap(wx.Image(io.BytesIO(data), wx.BITMAP_TYPE_PNG))
+        from wx.svg import SVGimage  # wxPython 4.1+
+
+        image = SVGimage.CreateFromBytes(data)
+        return image.ConvertToBitmap(width=int(image.width), height=int(image.height))
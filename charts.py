@@ -0,0 +1,137 @@
+"""
+    Tool : Pivot, Source Name : charts.py, Author: M'hamed Bendenia.
+"""
+
+import collections
+
+import numpy as np
+
+from decimate import lttb_union
+
+COLORS = {
+    "Confirmed": (0.95, 0.62, 0.07, 1),
+    "Recovred": (0.12, 0.52, 0.29, 1),
+    "Deaths": (1, 0, 0, 1),
+}  #: Color of each measure
+CHARTS = {
+    "rate": {"title": "Deaths and Recovred rates.", "styles": {"Deaths": "r--", "Recovred": "g--"}, "marker": "o"},
+    "line": {"title": "Confirmed, Deaths and Recovred cases developement by Date.",
+             "styles": {"Deaths": "r--", "Recovred": "g--", "Confirmed": "y--"}, "marker": None},
+    "new": {"title": "Confirmed, Deaths and Recovred new cases per day by Date, 7-day trailing mean.",
+            "styles": {"Deaths": "r--", "Recovred": "g--", "Confirmed": "y--"}, "marker": None},
+    "stack": {"title": "Confirmed, Deaths and Recovred cases stack by Date."},
+    "bar": {"title": "Confirmed, Recovred and Deaths numbers by Country_Re."},
+}  #: Title and styles of each chart kind
+FORMATS = ("png", "svg")  #: Rendered image formats, both shown by ChartFrame
+
+
+def chart_spec(kind, series, figsize, dpi=100, fmt="png"):
+    """
+    Compact, picklable description of a chart, its arrays travel separately
+
+    :param kind: A key of CHARTS
+    :param series: Names of the plotted arrays, in drawing order
+    :param figsize: Figure size in inches, None for a bar chart as wide as its groups
+    :param dpi: Resolution
+    :param fmt: 'png' or 'svg'
+    :return: The spec dict
+    """
+    if fmt not in FORMATS:
+        raise ValueError("Unsupported chart format: " + fmt)
+    return {"kind": kind, "title": CHARTS[kind]["title"], "series": list(series), "figsize": figsize and tuple(figsize),
+            "dpi": dpi, "format": fmt}
+
+
+def figure_size(spec, arrays):
+    """
+    Figure size of a chart, a bar chart without one gets every group at once: the bitmap scrolls instead of the axes
+
+    :param spec: The chart_spec
+    :param arrays: Its arrays
+    :return: (width, height) in inches
+    """
+    return spec["figsize"] or (max(20, len(arrays["x"]) * 0.15), 6)
+
+
+def series_renderer(kind):
+    """
+    Function drawing the series of a time chart
+
+    :param kind: 'rate', 'line', 'new' or 'stack'
+    :return: Callable(ax, x, ys) returning the artists
+    """
+    if kind == "stack":
+        def render(ax, x, ys):
+            return ax.stackplot(x, *ys.values(), labels=list(ys), colors=[COLORS[name] for name in ys])
+    else:
+        styles, marker = CHARTS[kind]["styles"], CHARTS[kind]["marker"]
+
+        def render(ax, x, ys):
+            return [ax.plot(x, y, styles[name], marker=marker, label=name)[0] for name, y in ys.items()]
+    return render
+
+
+def decorate(ax, kind):
+    """
+    Grid, legend, title and ticks of a time chart
+
+    :param ax: The axes
+    :param kind: 'rate', 'line', 'new' or 'stack'
+    """
+    ax.grid(True)
+    ax.legend(loc=2)
+    ax.set_title(CHARTS[kind]["title"])
+    if kind == "rate":
+        ax.set_yticks(ax.get_yticks())
+        ax.set_yticklabels(['{:.1f}%'.format(y * 100) for y in ax.get_yticks()])
+    ax.tick_params(axis="x", labelrotation=70)
+    if kind != "stack":
+        ax.tick_params(axis="y", labelrotation=60)
+
+
+def draw_bars(ax, labels, measures, width=0.25):
+    """
+    Grouped bars of every country, one collection per measure
+
+    :param ax: The axes
+    :param labels: Country of each group
+    :param measures: Ordered mapping of measure name -> heights
+    :param width: Width of one bar
+    """
+    from matplotlib.collections import PolyCollection
+
+    ind = np.arange(len(labels))
+    for m, (name, heights) in enumerate(measures.items()):
+        left = ind + (m - (len(measures) - 1) / 2) * width - width / 2
+        top = np.asarray(heights, dtype="f8")
+        bottom = np.zeros_like(top)
+        verts = np.stack([np.c_[left, bottom], np.c_[left, top], np.c_[left + width, top],
+                          np.c_[left + width, bottom]], axis=1)
+        ax.add_collection(PolyCollection(verts, facecolors=[COLORS[name]], edgecolors="none", label=name))
+    ax.set_yscale("symlog")
+    ax.set_xlim(-0.5, max(len(labels), 1) - 0.5)
+    ax.set_ylim(0, max([np.nanmax(v) for v in measures.values() if len(v)] + [1]) * 1.5)
+    ax.set_xticks(ind)
+    ax.set_xticklabels(labels, rotation=90, fontsize=6)
+    ax.set_title(CHARTS["bar"]["title"])
+    ax.legend(loc=1)
+
+
+def draw(figure, spec, arrays):
+    """
+    Draw a chart on a figure, time series decimated to the figure width
+
+    :param figure: A matplotlib Figure
+    :param spec: The chart_spec
+    :param arrays: Name -> array: 'x' (dates or countries) and the series
+    """
+    ax = figure.add_subplot(111)
+    ys = [(name, arrays[name]) for name in spec["series"]]
+    if spec["kind"] == "bar":
+        draw_bars(ax, arrays["x"], collections.OrderedDict(ys))
+    else:
+        x = arrays["x"]
+        idx = lttb_union(x, [y for _, y in ys], int(spec["figsize"][0] * spec["dpi"]))
+        series_renderer(spec["kind"])(ax, x[idx], collections.OrderedDict((name, y[idx]) for name, y in ys))
+        decorate(ax, spec["kind"])
+    figure.tight_layout()
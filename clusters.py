@@ -0,0 +1,133 @@
+"""
+    Tool : Pivot, Source Name : clusters.py, Author: M'hamed Bendenia.
+"""
+
+import os
+
+import numpy as np
+
+from generalize import meters_per_unit, scale_ranges, tolerance_for_scale
+from lazy import lazy_import
+
+pd = lazy_import("pandas")
+
+CLUSTER_BREAKS = (50000000, 12500000, 3125000)  #: Scales where point layers switch to a finer grid, coarsest first
+CLUSTER_PIXELS = 60  #: Cell size on screen at the most detailed scale of a level
+CLUSTER_MEASURES = ("Confirmed", "Deaths", "Recovred")  #: Fields summed per cell
+
+
+def grid_cluster(ix, iy, measures, groups=None):
+    """
+    Aggregate points sharing a grid cell, and a group if given
+
+    :param ix: Cell column of each point
+    :param iy: Cell row of each point
+    :param measures: Field name -> values of each point, summed per cell
+    :param groups: Group code of each point, e.g. factorized dates, None for one group
+    :return: (inverse, dict of per cell arrays with Point_Count and the sums, first point of each cell)
+    """
+    key = iy * (int(ix.max()) + 1 if len(ix) else 1) + ix
+    if groups is not None:
+        key = key * (int(groups.max()) + 1 if len(groups) else 1) + groups
+    cells, first, inverse = np.unique(key, return_index=True, return_inverse=True)
+    out = {"Point_Count": np.bincount(inverse, minlength=len(cells))}
+    for name, values in measures.items():
+        out[name] = np.bincount(inverse, weights=np.nan_to_num(np.asarray(values, dtype="f8")),
+                                minlength=len(cells))
+    return inverse, out, first
+
+
+class ClusterPyramid(object):
+    """ Grid clusters of point feature classes in the scratch gdb, one feature class per scale level. """
+
+    scratch = None  #: Scratch gdb path
+    breaks = None  #: Switch scales, coarsest first
+    levels = None  #: Source path -> (change token, [(scratch path, minScale, maxScale)])
+    cells = None  #: (source path, level) -> DataFrame of the cells
+
+    def __init__(self, scratch=None, breaks=CLUSTER_BREAKS):
+        """
+        Create the pyramid
+
+        :param scratch: Scratch gdb path, arcpy.env.scratchGDB by default
+        :param breaks: Switch scales, coarsest first
+        """
+        self.scratch = scratch
+        self.breaks = breaks
+        self.levels = {}
+        self.cells = {}
+
+    def build(self, x, y, measures, time=None, unit_meters=1.0):
+        """
+        Cells of every level; coarser grids are whole multiples of the finest so the levels nest
+
+        :param x: Point x coordinates
+        :param y: Point y coordinates
+        :param measures: Field name -> values, summed per cell
+        :param time: Time of each point, cells are split by time if given
+        :param unit_meters: Ground size of one coordinate unit
+        :return: List of DataFrames with X, Y (mean position), Point_Count, the sums and the time, coarsest first
+        """
+        x, y = np.asarray(x, dtype="f8"), np.asarray(y, dtype="f8")
+        valid = ~(np.isnan(x) | np.isnan(y))
+        x, y = x[valid], y[valid]
+        measures = {name: np.asarray(values)[valid] for name, values in measures.items()}
+        groups = labels = None
+        if time is not None:
+            groups, labels = pd.factorize(np.asarray(time)[valid], sort=True)
+
+        finest = tolerance_for_scale(self.breaks[-1], unit_meters, pixels=CLUSTER_PIXELS)
+        ix = np.floor((x - x.min()) / finest).astype("i8") if len(x) else np.zeros(0, dtype="i8")
+        iy = np.floor((y - y.min()) / finest).astype("i8") if len(y) else np.zeros(0, dtype="i8")
+        frames = []
+        for scale in self.breaks:
+            factor = max(int(round(scale / self.breaks[-1])), 1)
+            inverse, sums, first = grid_cluster(ix // factor, iy // factor, measures, groups)
+            count = sums["Point_Count"]
+            frame = pd.DataFrame({"X": np.bincount(inverse, weights=x) / count,
+                                  "Y": np.bincount(inverse, weights=y) / count})
+            for name, values in sums.items():
+                frame[name] = values
+            if groups is not None:
+                frame["Date"] = np.asarray(labels)[groups[first]]
+            frames.append(frame)
+        return frames
+
+    def publish(self, source, token, x, y, measures, time=None):
+        """
+        Scratch point feature classes of every level, rebuilt only when the token changes
+
+        :param source: Path of the point feature class
+        :param token: Change token of the source
+        :param x: Point x coordinates
+        :param y: Point y coordinates
+        :param measures: Field name -> values, summed per cell
+        :param time: Time of each point, None for untimed clusters
+        :return: List of (scratch path, minScale, maxScale), coarsest first
+        """
+        import arcpy
+
+        known = self.levels.get(source)
+        if known is not None and known[0] == token and all(arcpy.Exists(p) for p, _, _ in known[1]):
+            return known[1]
+
+        spatial_reference = arcpy.Describe(source).spatialReference
+        frames = self.build(x, y, measures, time, meters_per_unit(spatial_reference))
+
+        scratch = self.scratch or arcpy.env.scratchGDB
+        levels = []
+        for level, (frame, (min_scale, max_scale)) in enumerate(zip(frames, scale_ranges(self.breaks))):
+            out = os.path.join(scratch, "{}_c{}".format(os.path.basename(source), level))
+            if arcpy.Exists(out):
+                arcpy.management.Delete(out)
+            array = frame.to_records(index=False)
+            if "Date" in frame.columns:
+                array = array.astype([(n, "<M8[us]" if n == "Date" else array.dtype[n]) for n in array.dtype.names])
+            arcpy.da.NumPyArrayToFeatureClass(array, out, ("X", "Y"), spatial_reference)
+            self.cells[(source, level)] = frame
+            levels.append((out, min_scale, max_scale))
+            arcpy.AddMessage("{} level {}: {} clusters of {} points".format(
+                os.path.basename(source), level, len(frame), len(x)))
+
+        self.levels[source] = (token, levels)
+        return levels
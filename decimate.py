@@ -0,0 +1,213 @@
+"""
+    Tool : Pivot, Source Name : decimate.py, Author: M'hamed Bendenia.
+"""
+
+import collections
+import threading
+import time
+
+import numpy as np
+
+POINTS_PER_PIXEL = 1  #: LTTB output points per horizontal pixel
+
+
+def _numeric(x):
+    """
+    Float view of x values, dates as days
+
+    :param x: Array of numbers or datetime64
+    """
+    x = np.asarray(x)
+    if np.issubdtype(x.dtype, np.datetime64):
+        return x.astype("datetime64[us]").astype("f8") / 86400e6
+    return x.astype("f8")
+
+
+def lttb(x, y, n_out):
+    """
+    Largest-Triangle-Three-Buckets: keep the point of each bucket making the largest triangle with the point kept
+    in the previous bucket and the mean of the next one
+
+    :param x: Sorted x values, numbers or datetime64
+    :param y: y values
+    :param n_out: Number of points to keep
+    :return: Sorted indices of the kept points
+    """
+    n = len(x)
+    if n_out >= n or n_out < 3:
+        return np.arange(n)
+    x, y = _numeric(x), np.nan_to_num(np.asarray(y, dtype="f8"))
+
+    # n_out - 2 buckets over the inner points, the ends are always kept
+    edges = np.linspace(1, n - 1, n_out - 1).astype("i8")
+    cx, cy = np.concatenate([[0.0], np.cumsum(x)]), np.concatenate([[0.0], np.cumsum(y)])
+    counts = np.maximum(edges[1:] - edges[:-1], 1)
+    mean_x = np.append((cx[edges[1:]] - cx[edges[:-1]]) / counts, x[-1])
+    mean_y = np.append((cy[edges[1:]] - cy[edges[:-1]]) / counts, y[-1])
+
+    out = np.empty(n_out, dtype="i8")
+    out[0], out[-1] = 0, n - 1
+    a = 0
+    for b in range(n_out - 2):
+        lo, hi = edges[b], max(edges[b + 1], edges[b] + 1)
+        bx, by = x[lo:hi], y[lo:hi]
+        area = np.abs((x[a] - mean_x[b + 1]) * (by - y[a]) - (x[a] - bx) * (mean_y[b + 1] - y[a]))
+        a = lo + int(np.argmax(area))
+        out[b + 1] = a
+    return out
+
+
+def lttb_union(x, ys, n_out):
+    """
+    LTTB of several series sharing x, keeping the points any of them needs
+
+    :param x: Sorted x values
+    :param ys: Iterable of y arrays
+    :param n_out: Points to keep per series
+    :return: Sorted indices
+    """
+    indices = [lttb(x, y, n_out) for y in ys]
+    return np.unique(np.concatenate(indices)) if indices else np.arange(len(x))
+
+
+class Decimator(object):
+    """ LTTB indices cached per (series key, width in pixels), least recently used first out. """
+
+    max_entries = None  #: Cached index arrays
+    hits = misses = 0  #: Counters
+
+    def __init__(self, max_entries=256):
+        """
+        Create the cache
+
+        :param max_entries: Cached index arrays
+        """
+        self.max_entries = max_entries
+        self._cache = collections.OrderedDict()
+        self._lock = threading.Lock()
+
+    def indices(self, key, x, ys, width, points_per_pixel=POINTS_PER_PIXEL):
+        """
+        Points to draw of series sharing x
+
+        :param key: Hashable identity of the series and of the x range
+        :param x: Sorted x values
+        :param ys: Iterable of y arrays
+        :param width: Plot width in pixels
+        :param points_per_pixel: Output points per pixel
+        :return: Sorted indices
+        """
+        width = int(width)
+        with self._lock:
+            if (key, width) in self._cache:
+                self._cache.move_to_end((key, width))
+                self.hits += 1
+                return self._cache[(key, width)]
+        idx = lttb_union(x, ys, max(int(width * points_per_pixel), 3))
+        with self._lock:
+            self.misses += 1
+            self._cache[(key, width)] = idx
+            while len(self._cache) > self.max_entries:
+                self._cache.popitem(last=False)
+        return idx
+
+
+class ZoomDecimator(object):
+    """ Draws decimated series on an axes, decimating the visible range again when the x limits change. """
+
+    def __init__(self, ax, x, ys, render, decimator, key):
+        """
+        Draw the whole range
+
+        :param ax: The matplotlib axes
+        :param x: Sorted x values, numbers or datetime64
+        :param ys: Ordered mapping of series name -> y values
+        :param render: Callable(ax, x, ys) drawing the series and returning the artists
+        :param decimator: The Decimator caching the indices
+        :param key: Identity of the series, e.g. (table, version, grain, chart)
+        """
+        self.ax = ax
+        self.x = np.asarray(x)
+        self.ys = collections.OrderedDict((name, np.asarray(y)) for name, y in ys.items())
+        self.render = render
+        self.decimator = decimator
+        self.key = key
+        self.artists = []
+        self.range = None
+        if np.issubdtype(self.x.dtype, np.datetime64):
+            from matplotlib.dates import date2num
+
+            # Searched against the axes limits, in matplotlib date units
+            self._x = date2num(self.x)
+        else:
+            self._x = self.x.astype("f8")
+        self.draw(0, len(self.x))
+        if len(self._x) > 1:
+            ax.set_xlim(self._x[0], self._x[-1])
+        ax.callbacks.connect("xlim_changed", self.on_xlim)
+
+    def draw(self, start, stop):
+        """
+        Draw the decimated points between two indices
+
+        :param start: First index
+        :param stop: Index after the last one
+        """
+        if self.range == (start, stop):
+            return
+        self.range = (start, stop)
+        ys = [y[start:stop] for y in self.ys.values()]
+        idx = start + self.decimator.indices((self.key, start, stop), self.x[start:stop], ys,
+                                             self.ax.bbox.width)
+        for artist in self.artists:
+            artist.remove()
+        self.artists = self.render(self.ax, self.x[idx],
+                                   collections.OrderedDict((n, y[idx]) for n, y in self.ys.items()))
+        self.ax.set_autoscalex_on(False)
+
+    def on_xlim(self, ax):
+        """
+        Decimate the visible points again, one point of margin on each side
+
+        :param ax: The axes
+        """
+        x0, x1 = ax.get_xlim()
+        start = max(int(np.searchsorted(self._x, x0, side="left")) - 1, 0)
+        stop = min(int(np.searchsorted(self._x, x1, side="right")) + 1, len(self.x))
+        self.draw(start, stop)
+
+
+def benchmark(x=None, y=None, n=200000, width=1600, repeat=3):
+    """
+    Time drawing a series whole and decimated on an off-screen canvas
+
+    :param x: Sorted x values, a random walk of n points if None
+    :param y: y values
+    :param n: Points of the random walk
+    :param width: Figure width in pixels
+    :param repeat: Runs per case, the fastest is kept
+    :return: Dict of point counts and seconds
+    """
+    from matplotlib.backends.backend_agg import FigureCanvasAgg
+    from matplotlib.figure import Figure
+
+    if x is None:
+        x = np.arange(n, dtype="f8")
+        y = np.cumsum(np.random.standard_normal(n))
+
+    def draw(xs, ys):
+        best = float("inf")
+        for _ in range(repeat):
+            figure = Figure(figsize=(width / 100, 4), dpi=100)
+            canvas = FigureCanvasAgg(figure)
+            figure.add_subplot(111).plot(xs, ys)
+            start = time.perf_counter()
+            canvas.draw()
+            best = min(best, time.perf_counter() - start)
+        return best
+
+    start = time.perf_counter()
+    idx = lttb(x, y, width)
+    decimate_seconds = time.perf_counter() - start
+    return {"points": len(x), "decimated_points": len(idx), "decimate_seconds": decimate_seconds,
+            "full_draw_seconds": draw(x, y), "decimated_draw_seconds": draw(np.asarray(x)[idx], np.asarray(y)[idx])}
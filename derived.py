@@ -0,0 +1,116 @@
+"""
+    Tool : Pivot, Source Name : derived.py, Author: M'hamed Bendenia.
+"""
+
+import numpy as np
+
+from lazy import lazy_import
+from matrix_store import MatrixStore
+
+pd = lazy_import("pandas")
+
+
+def period_days(freq):
+    """
+    Length of a period in days
+
+    :param freq: A pandas frequency, None for days
+    """
+    if not freq:
+        return 1
+    period = pd.Period("2020-01-06", freq)
+    return max(1, int(round((period.end_time - period.start_time) / pd.Timedelta(days=1))))
+
+
+def forward_fill(plane):
+    """
+    Carry each country's last known value over the periods it has no row for
+
+    :param plane: A countries x periods array
+    :return: A new array
+    """
+    known = ~np.isnan(plane)
+    index = np.where(known, np.arange(plane.shape[1]), 0)
+    np.maximum.accumulate(index, axis=1, out=index)
+    filled = plane[np.arange(plane.shape[0])[:, None], index]
+    # Periods before a country's first row stay missing
+    filled[~np.maximum.accumulate(known, axis=1)] = np.nan
+    return filled
+
+
+def first_difference(plane):
+    """
+    Per-period increments of a cumulative plane, missing for the first period
+
+    :param plane: A countries x periods array
+    """
+    out = np.full(plane.shape, np.nan)
+    out[:, 1:] = plane[:, 1:] - plane[:, :-1]
+    return out
+
+
+def rolling_mean(plane, window):
+    """
+    Trailing mean over a window of periods, ignoring missing values
+
+    :param plane: A countries x periods array
+    :param window: Number of periods
+    """
+    valid = ~np.isnan(plane)
+    sums = np.cumsum(np.where(valid, plane, 0), axis=1)
+    counts = np.cumsum(valid, axis=1)
+    sums[:, window:] = sums[:, window:] - sums[:, :-window]
+    counts[:, window:] = counts[:, window:] - counts[:, :-window]
+    out = np.full(plane.shape, np.nan)
+    np.divide(sums, counts, out=out, where=counts > 0)
+    return out
+
+
+def growth_rate(plane, window):
+    """
+    Mean logarithmic growth per period over a trailing window
+
+    :param plane: A cumulative countries x periods array
+    :param window: Number of periods
+    """
+    out = np.full(plane.shape, np.nan)
+    now, before = plane[:, window:], plane[:, :-window]
+    ok = (now > 0) & (before > 0)
+    np.divide(np.log(np.where(ok, now, 1)) - np.log(np.where(ok, before, 1)), window,
+              out=out[:, window:], where=ok)
+    return out
+
+
+def doubling_time(growth):
+    """
+    Periods needed to double at a growth rate, missing when not growing
+
+    :param growth: A growth rate array
+    """
+    out = np.full(growth.shape, np.nan)
+    np.divide(np.log(2), growth, out=out, where=growth > 0)
+    return out
+
+
+def derive(store, window=7):
+    """
+    New cases, their trailing mean, growth rate and doubling time of every measure, in one pass; rates are per day
+    whatever the period grain
+
+    :param store: A MatrixStore of cumulative measures
+    :param window: Trailing window in days, rounded down to whole periods, at least one
+    :return: A MatrixStore on the same axes, planes named '<measure>_new' (per period), '<measure>_avg' (per day),
+             '<measure>_growth' (per day) and '<measure>_doubling' (in days)
+    """
+    days = period_days(store.freq)
+    periods = max(1, window // days)
+    planes = {}
+    for measure, plane in store.planes.items():
+        cumulative = forward_fill(plane)
+        new = first_difference(cumulative)
+        growth = growth_rate(cumulative, periods) / days
+        planes[measure + "_new"] = new
+        planes[measure + "_avg"] = rolling_mean(new, periods) / days
+        planes[measure + "_growth"] = growth
+        planes[measure + "_doubling"] = doubling_time(growth)
+    return MatrixStore(store.countries, store.periods, planes, store.freq)
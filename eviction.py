@@ -0,0 +1,293 @@
+"""
+    Tool : Pivot, Source Name : eviction.py, Author: M'hamed Bendenia.
+"""
+
+import collections
+import itertools
+import os
+import pickle
+import shutil
+import threading
+
+import numpy as np
+
+from lazy import lazy_import
+from result_cache import sizeof
+from snapshots import LazyTable
+
+pd = lazy_import("pandas")
+
+GEOMETRY_COLUMNS = ("SHAPE",)  #: Columns dropped first when only geometries are evicted
+
+
+class ColumnarCache(object):
+    """ On-disk copy of DataFrames, one file per column: .npy for NumPy dtypes, pickles for the rest. """
+
+    folder = None  #: Cache folder
+
+    def __init__(self, folder):
+        """
+        Create the cache folder
+
+        :param folder: Cache folder
+        """
+        self.folder = folder
+        os.makedirs(folder, exist_ok=True)
+
+    def path(self, key):
+        """
+        Folder of one table
+
+        :param key: The table key
+        """
+        return os.path.join(self.folder, str(key))
+
+    def has(self, key, columns=None):
+        """
+        Check if a table, or some of its columns, is on disk
+
+        :param key: The table key
+        :param columns: Required columns, all by default
+        """
+        index = os.path.join(self.path(key), "columns.pkl")
+        if not os.path.exists(index):
+            return False
+        if columns is None:
+            return True
+        with open(index, "rb") as f:
+            return set(columns) <= set(pickle.load(f))
+
+    def write(self, key, df):
+        """
+        Store a table
+
+        :param key: The table key
+        :param df: The DataFrame
+        """
+        folder = self.path(key)
+        os.makedirs(folder, exist_ok=True)
+        for i, column in enumerate(df.columns):
+            values = df[column].values
+            if isinstance(values, np.ndarray) and values.dtype != object:
+                np.save(os.path.join(folder, "{}.npy".format(i)), values)
+            else:
+                with open(os.path.join(folder, "{}.pkl".format(i)), "wb") as f:
+                    pickle.dump(df[column], f, pickle.HIGHEST_PROTOCOL)
+        with open(os.path.join(folder, "columns.pkl"), "wb") as f:
+            pickle.dump(list(df.columns), f, pickle.HIGHEST_PROTOCOL)
+
+    def read(self, key, columns=None):
+        """
+        Load a table, or some of its columns
+
+        :param key: The table key
+        :param columns: Columns to read, all by default
+        :return: A DataFrame
+        """
+        folder = self.path(key)
+        with open(os.path.join(folder, "columns.pkl"), "rb") as f:
+            stored = pickle.load(f)
+        data = collections.OrderedDict()
+        for i, column in enumerate(stored):
+            if columns is not None and column not in columns:
+                continue
+            npy = os.path.join(folder, "{}.npy".format(i))
+            if os.path.exists(npy):
+                data[column] = np.load(npy)
+            else:
+                with open(os.path.join(folder, "{}.pkl".format(i)), "rb") as f:
+                    data[column] = pickle.load(f).values
+        return pd.DataFrame(data)
+
+    def remove(self, key):
+        """
+        Delete a table
+
+        :param key: The table key
+        """
+        shutil.rmtree(self.path(key), ignore_errors=True)
+
+
+class ResidentTable(LazyTable):
+    """ A DW table that can be evicted from memory and transparently reloaded. """
+
+    _ids = itertools.count()
+
+    def __init__(self, name, df, budget, reload):
+        """
+        Wrap a loaded table
+
+        :param name: The table name
+        :param df: The DataFrame
+        :param budget: The TableBudget it counts against
+        :param reload: Callable reading the table again from the gdb
+        """
+        self.name = name
+        self.key = "{}_{}".format(name, next(self._ids))
+        self.budget = budget
+        self.reload = reload
+        self.nbytes = 0
+        self.evicted_columns = None
+        self.spilled = False
+        self._df = df
+        self._lock = threading.RLock()
+
+    @property
+    def resident(self):
+        """
+        True if the whole table is in memory
+        """
+        return self._df is not None and self.evicted_columns is None
+
+    def load(self):
+        """
+        The DataFrame, reloaded from the columnar cache or the gdb if it was evicted
+        """
+        reloaded = False
+        with self._lock:
+            if self._df is None:
+                if self.spilled and self.budget.disk.has(self.key):
+                    self._df = self.budget.disk.read(self.key)
+                else:
+                    self._df = self.reload()
+                self.evicted_columns = None
+                self.budget.reloads += 1
+                reloaded = True
+            elif self.evicted_columns is not None:
+                if self.spilled and self.budget.disk.has(self.key, self.evicted_columns):
+                    restored = self.budget.disk.read(self.key, self.evicted_columns)
+                else:
+                    restored = self.reload()[self.evicted_columns]
+                self._df = self._df.assign(**{c: restored[c].values for c in self.evicted_columns})
+                self.evicted_columns = None
+                self.budget.reloads += 1
+                reloaded = True
+            df = self._df
+        # Only a reload changes the size, plain reads just move the table up the LRU
+        self.budget.touch(self, measure=reloaded)
+        return df
+
+    def evict(self, geometry_only=False):
+        """
+        Drop the table, or just its geometry columns, from memory
+
+        :param geometry_only: Keep the attributes, nothing is freed if the geometry is already gone
+        :return: Bytes freed
+        """
+        with self._lock:
+            if self._df is None:
+                return 0
+            geometry = [c for c in GEOMETRY_COLUMNS if c in self._df.columns]
+            if geometry_only and not geometry:
+                return 0
+            if not self.spilled:
+                try:
+                    self.budget.disk.write(self.key, self._df)
+                    self.spilled = True
+                except (OSError, pickle.PicklingError):
+                    # The gdb is still there to reload from
+                    self.budget.disk.remove(self.key)
+            before = self.nbytes
+            if geometry_only:
+                self._df = self._df.drop(columns=geometry)
+                self.evicted_columns = geometry
+            else:
+                self._df = None
+                self.evicted_columns = None
+            self.nbytes = sizeof(self._df) if self._df is not None else 0
+            return before - self.nbytes
+
+
+class TableBudget(object):
+    """ Memory ceiling of the DW tables, evicting the least recently used ones. """
+
+    max_bytes = None  #: Memory ceiling
+    geometry_first = None  #: Evict geometry columns before whole tables
+    disk = None  #: ColumnarCache tables spill to
+    evictions = reloads = 0  #: Counters
+
+    def __init__(self, max_bytes, folder, geometry_first=True):
+        """
+        Create the budget
+
+        :param max_bytes: Memory ceiling in bytes
+        :param folder: Folder of the on-disk columnar cache
+        :param geometry_first: Evict geometry columns before whole tables
+        """
+        self.max_bytes = max_bytes
+        self.geometry_first = geometry_first
+        self.disk = ColumnarCache(folder)
+        self._lru = collections.OrderedDict()
+        self._lock = threading.RLock()
+
+    def track(self, name, df, reload):
+        """
+        Count a loaded table against the budget
+
+        :param name: The table name
+        :param df: The DataFrame
+        :param reload: Callable reading the table again from the gdb
+        :return: The ResidentTable to publish
+        """
+        table = ResidentTable(name, df, self, reload)
+        self.touch(table, measure=True)
+        return table
+
+    def touch(self, table, measure=False):
+        """
+        Mark a table as just used; after a load, re-measure it and evict others past the ceiling
+
+        :param table: The ResidentTable
+        :param measure: True if the table was just loaded or reloaded
+        """
+        with self._lock:
+            if measure:
+                table.nbytes = sizeof(table._df) if table._df is not None else 0
+            self._lru[table.key] = table
+            self._lru.move_to_end(table.key)
+            if measure:
+                self._enforce(keep=table)
+
+    def forget(self, table):
+        """
+        Stop tracking a retired table and delete its columnar copy
+
+        :param table: The ResidentTable
+        """
+        with self._lock:
+            self._lru.pop(table.key, None)
+        table._df = None
+        self.disk.remove(table.key)
+
+    def resident_bytes(self):
+        """
+        Memory held by the tracked tables
+        """
+        return sum(t.nbytes for t in self._lru.values())
+
+    def metrics(self):
+        """
+        Resident bytes per table and counters
+        """
+        per_table = {}
+        for table in self._lru.values():
+            per_table[table.name] = per_table.get(table.name, 0) + table.nbytes
+        return {"resident_bytes": per_table, "total_bytes": self.resident_bytes(), "max_bytes": self.max_bytes,
+                "evictions": self.evictions, "reloads": self.reloads}
+
+    def _enforce(self, keep):
+        """
+        Evict in LRU order until under the ceiling, geometry columns first
+
+        :param keep: Table not to evict, the one being used
+        """
+        passes = (True, False) if self.geometry_first else (False,)
+        for geometry_only in passes:
+            # Whole tables go only if dropping every geometry column was not enough
+            for table in list(self._lru.values()):
+                if self.resident_bytes() <= self.max_bytes:
+                    return
+                if table is keep or table.nbytes == 0:
+                    continue
+                if table.evict(geometry_only):
+                    self.evictions += 1
@@ -0,0 +1,219 @@
+"""
+    Tool : Pivot, Source Name : generalize.py, Author: M'hamed Bendenia.
+"""
+
+import os
+
+import numpy as np
+
+from geometry_store import GeometryStore
+
+SCALE_BREAKS = (25000000, 5000000)  #: Scales where polygon layers switch to a finer level, coarsest first
+PIXEL_TOLERANCE = 0.5  #: Allowed vertex shift, in pixels
+DPI = 96  #: Screen resolution the tolerances are computed for
+METERS_PER_DEGREE = 111319.49  #: At the equator, for geographic coordinate systems
+
+
+def meters_per_unit(spatial_reference):
+    """
+    Ground size of one coordinate unit
+
+    :param spatial_reference: An arcpy SpatialReference
+    """
+    if spatial_reference.type == "Geographic":
+        return METERS_PER_DEGREE
+    return spatial_reference.metersPerUnit or 1.0
+
+
+def tolerance_for_scale(scale, unit_meters, dpi=DPI, pixels=PIXEL_TOLERANCE):
+    """
+    Simplification tolerance invisible at a map scale
+
+    :param scale: Scale denominator
+    :param unit_meters: Ground size of one coordinate unit
+    :param dpi: Screen resolution
+    :param pixels: Allowed vertex shift in pixels
+    :return: The tolerance in coordinate units
+    """
+    return scale * 0.0254 / dpi * pixels / unit_meters
+
+
+def scale_ranges(breaks=SCALE_BREAKS):
+    """
+    CIM (minScale, maxScale) of each level then of the full resolution layer, 0 meaning no limit
+
+    :param breaks: Switch scales, coarsest first
+    """
+    bounds = (0,) + tuple(breaks) + (0,)
+    return [(bounds[i], bounds[i + 1]) for i in range(len(breaks) + 1)]
+
+
+def _segment_distances(points, a, b):
+    """
+    Distances of points to the segment a-b
+
+    :param points: (n, 2) array
+    :param a: Segment start
+    :param b: Segment end
+    """
+    ab = b - a
+    length = ab.dot(ab)
+    if length == 0:
+        return np.hypot(*(points - a).T)
+    t = np.clip((points - a).dot(ab) / length, 0, 1)
+    return np.hypot(*(points - a - t[:, None] * ab).T)
+
+
+def vertex_importance(store, floor=0.0):
+    """
+    Douglas-Peucker tolerance below which each vertex survives, so one pass serves every level
+
+    :param store: A GeometryStore
+    :param floor: Smallest tolerance of interest, splitting stops below it
+    :return: One value per coordinate: inf for kept ends, 0 for vertices dropped at the floor
+    """
+    importance = np.zeros(len(store.coords))
+    if store.kind == "point":
+        importance[:] = np.inf
+        return importance
+    first, last = store.ring_offsets[:-1], store.ring_offsets[1:] - 1
+    importance[first[last >= first]] = np.inf
+    importance[last[last >= first]] = np.inf
+    for start, end in zip(first.tolist(), last.tolist()):
+        stack = [(start, end, np.inf)]
+        while stack:
+            i, j, parent = stack.pop()
+            if j - i < 2:
+                continue
+            distances = _segment_distances(store.coords[i + 1:j], store.coords[i], store.coords[j])
+            k = int(np.argmax(distances))
+            # A vertex cannot outlive the one that split its segment
+            d = min(distances[k], parent)
+            if d <= floor:
+                continue
+            importance[i + 1 + k] = d
+            stack.append((i, i + 1 + k, d))
+            stack.append((i + 1 + k, j, d))
+    if store.kind == "polygon":
+        # The outer ring of each part keeps a triangle, so small countries stay on the map
+        for r in store.part_offsets[:-1].tolist():
+            start, end = store.ring_offsets[r], store.ring_offsets[r + 1] - 1
+            if end - start > 3:
+                top = start + 1 + np.argsort(importance[start + 1:end])[-2:]
+                importance[top] = np.inf
+    return importance
+
+
+def simplify(store, tolerance, importance=None):
+    """
+    Keep the vertices whose importance reaches the tolerance
+
+    :param store: A GeometryStore
+    :param tolerance: Tolerance in coordinate units
+    :param importance: vertex_importance of the store, computed if None
+    :return: A new GeometryStore, with the same features
+    """
+    if store.kind == "point" or not len(store.coords):
+        return store
+    if importance is None:
+        importance = vertex_importance(store, tolerance)
+    keep = importance >= tolerance
+
+    ring_counts = np.diff(np.concatenate([[0], np.cumsum(keep)])[store.ring_offsets])
+    ring_keep = ring_counts >= (4 if store.kind == "polygon" else 2)
+    if store.kind == "polygon":
+        # Holes go with their outer ring
+        ring_keep &= np.repeat(ring_keep[store.part_offsets[:-1]], np.diff(store.part_offsets))
+    keep &= np.repeat(ring_keep, np.diff(store.ring_offsets))
+
+    ring_offsets = np.concatenate([[0], np.cumsum(ring_counts[ring_keep])])
+    part_counts = np.diff(np.concatenate([[0], np.cumsum(ring_keep)])[store.part_offsets])
+    part_keep = part_counts > 0
+    part_offsets = np.concatenate([[0], np.cumsum(part_counts[part_keep])])
+    feature_offsets = np.concatenate([[0], np.cumsum(part_keep)])[store.feature_offsets]
+    return GeometryStore(np.ascontiguousarray(store.coords[keep]), ring_offsets.astype("i8"),
+                         part_offsets.astype("i8"), feature_offsets.astype("i8"), store.ids, store.kind)
+
+
+class Generalizer(object):
+    """ Simplified copies of polygon feature classes in the scratch gdb, one per scale level. """
+
+    scratch = None  #: Scratch gdb path
+    breaks = None  #: Switch scales, coarsest first
+    levels = None  #: Source path -> (change token, [(scratch path, minScale, maxScale)])
+    stores = None  #: (source path, level) -> simplified GeometryStore
+
+    def __init__(self, scratch=None, breaks=SCALE_BREAKS):
+        """
+        Create the generalizer
+
+        :param scratch: Scratch gdb path, arcpy.env.scratchGDB by default
+        :param breaks: Switch scales, coarsest first
+        """
+        self.scratch = scratch
+        self.breaks = breaks
+        self.levels = {}
+        self.stores = {}
+
+    def generalize(self, source, token, store):
+        """
+        Scratch feature classes of every level, rebuilt only when the token changes
+
+        :param source: Path of the feature class
+        :param token: Change token of the source
+        :param store: GeometryStore of the source features
+        :return: List of (scratch path, minScale, maxScale), coarsest first
+        """
+        import arcpy
+
+        known = self.levels.get(source)
+        if known is not None and known[0] == token and all(arcpy.Exists(p) for p, _, _ in known[1]):
+            return known[1]
+
+        spatial_reference = arcpy.Describe(source).spatialReference
+        unit_meters = meters_per_unit(spatial_reference)
+        tolerances = [tolerance_for_scale(scale, unit_meters) for scale in self.breaks]
+        importance = vertex_importance(store, min(tolerances))
+
+        scratch = self.scratch or arcpy.env.scratchGDB
+        levels = []
+        for level, (tolerance, (min_scale, max_scale)) in enumerate(zip(tolerances, scale_ranges(self.breaks))):
+            simplified = simplify(store, tolerance, importance)
+            out = os.path.join(scratch, "{}_g{}".format(os.path.basename(source), level))
+            self.write(source, out, simplified, spatial_reference)
+            self.stores[(source, level)] = simplified
+            levels.append((out, min_scale, max_scale))
+            arcpy.AddMessage("{} level {}: {} of {} vertices".format(
+                os.path.basename(source), level, len(simplified.coords), len(store.coords)))
+
+        self.levels[source] = (token, levels)
+        return levels
+
+    @staticmethod
+    def write(source, out, store, spatial_reference):
+        """
+        Copy a feature class with simplified shapes
+
+        :param source: Path of the feature class
+        :param out: Path of the copy
+        :param store: Simplified GeometryStore, ids being the source object IDs
+        :param spatial_reference: Spatial reference of the source
+        """
+        import arcpy
+
+        if arcpy.Exists(out):
+            arcpy.management.Delete(out)
+        arcpy.management.CreateFeatureclass(os.path.dirname(out), os.path.basename(out), "POLYGON",
+                                            template=source, spatial_reference=spatial_reference)
+        fields = [f.name for f in arcpy.ListFields(source) if f.editable and f.type not in ("OID", "Geometry")]
+        with arcpy.da.SearchCursor(source, ["OID@"] + fields) as rows, \
+                arcpy.da.InsertCursor(out, ["SHAPE@"] + fields) as cursor:
+            for row in rows:
+                f = store.index_of(row[0])[0]
+                parts = arcpy.Array()
+                for p in range(store.feature_offsets[f], store.feature_offsets[f + 1]):
+                    for r in range(store.part_offsets[p], store.part_offsets[p + 1]):
+                        ring = store.coords[store.ring_offsets[r]:store.ring_offsets[r + 1]]
+                        parts.add(arcpy.Array([arcpy.Point(x, y) for x, y in ring.tolist()]))
+                shape = arcpy.Polygon(parts, spatial_reference) if parts.count else None
+                cursor.insertRow((shape,) + tuple(row[1:]))
@@ -0,0 +1,312 @@
+"""
+    Tool : Pivot, Source Name : geometry_store.py, Author: M'hamed Bendenia.
+"""
+
+import numpy as np
+
+
+def _parts_of(geometry):
+    """
+    Split an Esri JSON geometry into parts, each a list of rings
+
+    :param geometry: An arcgis Geometry or Esri JSON dict
+    :return: (list of parts, kind) with kind in 'point', 'line', 'polygon'
+    """
+    if geometry is None:
+        return [], None
+    if "rings" in geometry:
+        parts = []
+        for ring in geometry["rings"]:
+            ring = np.asarray(ring, dtype="f8")[:, :2]
+            # Esri outer rings are clockwise, holes counter-clockwise and follow their outer ring
+            signed = np.sum(ring[:-1, 0] * ring[1:, 1] - ring[1:, 0] * ring[:-1, 1])
+            if signed <= 0 or not parts:
+                parts.append([ring])
+            else:
+                parts[-1].append(ring)
+        return parts, "polygon"
+    if "paths" in geometry:
+        return [[np.asarray(path, dtype="f8")[:, :2]] for path in geometry["paths"]], "line"
+    if "points" in geometry:
+        return [[np.asarray([p], dtype="f8")[:, :2]] for p in geometry["points"]], "point"
+    if geometry.get("x") is not None:
+        return [[np.array([[geometry["x"], geometry["y"]]], dtype="f8")]], "point"
+    return [], None
+
+
+class GeometryStore(object):
+    """ Geometries as contiguous coordinates with feature, part and ring offsets (GeoArrow layout). """
+
+    coords = None  #: (n, 2) float64 coordinates of every ring, rings closed
+    ring_offsets = None  #: Start of each ring in coords, plus the end
+    part_offsets = None  #: Start of each part in ring_offsets, plus the end
+    feature_offsets = None  #: Start of each feature in part_offsets, plus the end
+    ids = None  #: Feature IDs
+    kind = None  #: 'point', 'line' or 'polygon'
+
+    def __init__(self, coords, ring_offsets, part_offsets, feature_offsets, ids, kind):
+        """
+        Wrap prebuilt buffers
+
+        :param coords: Coordinates
+        :param ring_offsets: Ring offsets into coords
+        :param part_offsets: Part offsets into ring_offsets
+        :param feature_offsets: Feature offsets into part_offsets
+        :param ids: Feature IDs
+        :param kind: 'point', 'line' or 'polygon'
+        """
+        self.coords = coords
+        self.ring_offsets = ring_offsets
+        self.part_offsets = part_offsets
+        self.feature_offsets = feature_offsets
+        self.ids = np.asarray(ids)
+        self.kind = kind
+        self._index = None
+        self._bbox = None
+
+    @classmethod
+    def from_geometries(cls, geometries, ids=None):
+        """
+        Build the buffers from Esri JSON geometries
+
+        :param geometries: Iterable of arcgis Geometry or dicts, None for empty features
+        :param ids: Feature IDs, positions by default
+        """
+        rings, ring_offsets, part_offsets, feature_offsets = [], [0], [0], [0]
+        kind = None
+        for geometry in geometries:
+            parts, geometry_kind = _parts_of(geometry)
+            kind = kind or geometry_kind
+            for part in parts:
+                for ring in part:
+                    rings.append(ring)
+                    ring_offsets.append(ring_offsets[-1] + len(ring))
+                part_offsets.append(part_offsets[-1] + len(part))
+            feature_offsets.append(feature_offsets[-1] + len(parts))
+        coords = np.concatenate(rings) if rings else np.empty((0, 2))
+        if ids is None:
+            ids = np.arange(len(feature_offsets) - 1)
+        return cls(np.ascontiguousarray(coords), np.asarray(ring_offsets, dtype="i8"),
+                   np.asarray(part_offsets, dtype="i8"), np.asarray(feature_offsets, dtype="i8"), ids, kind)
+
+    @classmethod
+    def from_spatial_df(cls, df, id_field="OBJECTID", geometry_field="SHAPE"):
+        """
+        Build the buffers from a spatially enabled DataFrame
+
+        :param df: The DataFrame
+        :param id_field: Feature ID column
+        :param geometry_field: Geometry column
+        """
+        ids = df[id_field].values if id_field in df.columns else None
+        return cls.from_geometries(df[geometry_field].values, ids)
+
+    def __len__(self):
+        return len(self.feature_offsets) - 1
+
+    def nbytes(self):
+        """
+        Memory held by the buffers
+        """
+        return int(self.coords.nbytes + self.ring_offsets.nbytes + self.part_offsets.nbytes +
+                   self.feature_offsets.nbytes + self.ids.nbytes)
+
+    def index_of(self, ids):
+        """
+        Positions of feature IDs
+
+        :param ids: Feature IDs
+        """
+        if self._index is None:
+            self._index = {fid: i for i, fid in enumerate(self.ids.tolist())}
+        return np.array([self._index[fid] for fid in np.atleast_1d(ids).tolist()], dtype="i8")
+
+    def slice(self, start, stop):
+        """
+        Features start to stop, sharing the buffers (zero copy)
+
+        :param start: First position
+        :param stop: Position after the last one
+        """
+        return GeometryStore(self.coords, self.ring_offsets, self.part_offsets,
+                             self.feature_offsets[start:stop + 1], self.ids[start:stop], self.kind)
+
+    def take(self, ids):
+        """
+        Features by ID: a zero-copy slice when they are contiguous, a compacted copy otherwise
+
+        :param ids: Feature IDs
+        """
+        positions = self.index_of(ids)
+        if len(positions) and np.array_equal(positions, np.arange(positions[0], positions[0] + len(positions))):
+            return self.slice(positions[0], positions[0] + len(positions))
+        rings, ring_offsets, part_offsets, feature_offsets = [], [0], [0], [0]
+        for f in positions:
+            for p in range(self.feature_offsets[f], self.feature_offsets[f + 1]):
+                for r in range(self.part_offsets[p], self.part_offsets[p + 1]):
+                    rings.append(self.coords[self.ring_offsets[r]:self.ring_offsets[r + 1]])
+                    ring_offsets.append(ring_offsets[-1] + len(rings[-1]))
+                part_offsets.append(len(ring_offsets) - 1)
+            feature_offsets.append(len(part_offsets) - 1)
+        coords = np.concatenate(rings) if rings else np.empty((0, 2))
+        return GeometryStore(coords, np.asarray(ring_offsets, dtype="i8"), np.asarray(part_offsets, dtype="i8"),
+                             np.asarray(feature_offsets, dtype="i8"), self.ids[positions], self.kind)
+
+    def _coord_ranges(self):
+        """
+        First and past-the-end coordinate of each feature
+        """
+        rings = self.part_offsets[self.feature_offsets]
+        coords = self.ring_offsets[rings]
+        return coords[:-1], coords[1:]
+
+    def _ring_ranges(self):
+        """
+        First and past-the-end ring of each feature
+        """
+        rings = self.part_offsets[self.feature_offsets]
+        return rings[:-1], rings[1:]
+
+    def bbox(self):
+        """
+        Bounding box of each feature
+
+        :return: (n, 4) array of xmin, ymin, xmax, ymax, NaN for empty features
+        """
+        if self._bbox is None:
+            start, stop = self._coord_ranges()
+            out = np.full((len(self), 4), np.nan)
+            full = stop > start
+            if full.any():
+                # Non-empty features are back to back, so each segment ends where the next starts
+                starts, coords = start[full], self.coords[:stop[full][-1]]
+                out[full, :2] = np.minimum.reduceat(coords, starts, axis=0)
+                out[full, 2:] = np.maximum.reduceat(coords, starts, axis=0)
+            self._bbox = out
+        return self._bbox
+
+    def _ring_sums(self, values):
+        """
+        Sum of a per-edge quantity over each ring
+
+        :param values: Values of the edges from each coordinate to the next, length len(coords) - 1
+        """
+        cumulative = np.concatenate([[0.0], np.cumsum(values)])
+        start, stop = self.ring_offsets[:-1], self.ring_offsets[1:]
+        # A closed ring of n coordinates has n - 1 edges
+        return cumulative[np.maximum(stop - 1, start)] - cumulative[start]
+
+    def _feature_sums(self, ring_values):
+        """
+        Sum of a per-ring quantity over each feature
+
+        :param ring_values: One value per ring
+        """
+        cumulative = np.concatenate([[0.0], np.cumsum(ring_values)])
+        start, stop = self._ring_ranges()
+        return cumulative[stop] - cumulative[start]
+
+    def area(self):
+        """
+        Area of each feature, holes removed; 0 for points and lines
+        """
+        if self.kind != "polygon" or not len(self.coords):
+            return np.zeros(len(self))
+        x, y = self.coords[:, 0], self.coords[:, 1]
+        cross = x[:-1] * y[1:] - x[1:] * y[:-1]
+        return np.abs(self._feature_sums(self._ring_sums(cross))) / 2
+
+    def centroid(self):
+        """
+        Centroid of each feature: area centroid for polygons, vertex mean otherwise
+
+        :return: (n, 2) array, NaN for empty features
+        """
+        out = np.full((len(self), 2), np.nan)
+        if not len(self.coords):
+            return out
+        x, y = self.coords[:, 0], self.coords[:, 1]
+        if self.kind == "polygon":
+            cross = x[:-1] * y[1:] - x[1:] * y[:-1]
+            signed = self._feature_sums(self._ring_sums(cross))
+            cx = self._feature_sums(self._ring_sums((x[:-1] + x[1:]) * cross))
+            cy = self._feature_sums(self._ring_sums((y[:-1] + y[1:]) * cross))
+            ok = signed != 0
+            out[ok, 0] = cx[ok] / (3 * signed[ok])
+            out[ok, 1] = cy[ok] / (3 * signed[ok])
+            return out
+        start, stop = self._coord_ranges()
+        cumulative = np.concatenate([[[0.0, 0.0]], np.cumsum(self.coords, axis=0)])
+        counts = stop - start
+        ok = counts > 0
+        out[ok] = (cumulative[stop[ok]] - cumulative[start[ok]]) / counts[ok, None]
+        return out
+
+    def contains(self, x, y):
+        """
+        Spatial join of points to polygons: the first feature containing each point
+
+        :param x: Point x coordinates
+        :param y: Point y coordinates
+        :return: Feature positions, -1 for points outside every feature
+        """
+        x, y = np.asarray(x, dtype="f8"), np.asarray(y, dtype="f8")
+        out = np.full(len(x), -1, dtype="i8")
+        if self.kind != "polygon":
+            return out
+        boxes = self.bbox()
+        for f in range(len(self)):
+            xmin, ymin, xmax, ymax = boxes[f]
+            candidates = np.flatnonzero((out < 0) & (x >= xmin) & (x <= xmax) & (y >= ymin) & (y <= ymax))
+            if not len(candidates):
+                continue
+            inside = np.zeros(len(candidates), dtype=bool)
+            px, py = x[candidates], y[candidates]
+            for r in range(self.part_offsets[self.feature_offsets[f]], self.part_offsets[self.feature_offsets[f + 1]]):
+                ring = self.coords[self.ring_offsets[r]:self.ring_offsets[r + 1]]
+                x0, y0, x1, y1 = ring[:-1, 0], ring[:-1, 1], ring[1:, 0], ring[1:, 1]
+                # Even-odd crossing test, points x edges at once
+                crosses = (y0[None, :] > py[:, None]) != (y1[None, :] > py[:, None])
+                with np.errstate(divide="ignore", invalid="ignore"):
+                    at = x0[None, :] + (py[:, None] - y0[None, :]) * (x1 - x0)[None, :] / (y1 - y0)[None, :]
+                inside ^= (np.count_nonzero(crosses & (px[:, None] < at), axis=1) % 2).astype(bool)
+            out[candidates[inside]] = f
+        return out
+
+    def rings(self):
+        """
+        Every ring as a view on the coordinates, with its feature position
+
+        :return: (list of (n, 2) arrays, array of feature positions)
+        """
+        start, stop = self._ring_ranges()
+        owners = np.repeat(np.arange(len(self)), stop - start)
+        first = start[0] if len(start) else 0
+        views = [self.coords[self.ring_offsets[r]:self.ring_offsets[r + 1]]
+                 for r in range(first, first + len(owners))]
+        return views, owners
+
+    def preview(self, ax, values=None, cmap="viridis"):
+        """
+        Draw the features on a matplotlib axes, without ArcGIS
+
+        :param ax: The axes
+        :param values: One value per feature to color by
+        :param cmap: Colormap name
+        :return: The added collection
+        """
+        from matplotlib.collections import LineCollection, PolyCollection
+
+        views, owners = self.rings()
+        if self.kind == "point":
+            xy = self.centroid()
+            return ax.scatter(xy[:, 0], xy[:, 1], c=values, cmap=cmap, s=4)
+        if self.kind == "line":
+            collection = LineCollection(views, cmap=cmap)
+        else:
+            collection = PolyCollection(views, cmap=cmap, edgecolor="0.4", linewidth=0.2)
+        if values is not None:
+            collection.set_array(np.asarray(values, dtype="f8")[owners])
+        ax.add_collection(collection)
+        ax.autoscale_view()
+        return collection
@@ -0,0 +1,237 @@
+"""
+    Tool : Pivot, Source Name : hexbin.py, Author: M'hamed Bendenia.
+"""
+
+import os
+
+import numpy as np
+
+from clusters import grid_cluster
+from generalize import meters_per_unit, tolerance_for_scale
+from lazy import lazy_import
+
+pd = lazy_import("pandas")
+
+HEX_PIXELS = 30  #: Default hexagon size on screen at the map reference scale
+HEX_CLASSES = 5  #: Class breaks of the hexbin renderer
+SQRT3 = np.sqrt(3)
+
+
+def hex_cells(x, y, size):
+    """
+    Axial coordinates of the pointy-top hexagons holding the points, in one vectorized pass
+
+    :param x: Point x coordinates
+    :param y: Point y coordinates
+    :param size: Hexagon circumradius, in coordinate units
+    :return: (q, r) int64 arrays
+    """
+    q = (SQRT3 / 3 * x - y / 3) / size
+    r = (2 / 3 * y) / size
+    # Cube rounding, fixing the coordinate with the largest rounding error
+    s = -q - r
+    rq, rr, rs = np.round(q), np.round(r), np.round(s)
+    dq, dr, ds = np.abs(rq - q), np.abs(rr - r), np.abs(rs - s)
+    fix_q = (dq > dr) & (dq > ds)
+    fix_r = ~fix_q & (dr > ds)
+    rq = np.where(fix_q, -rr - rs, rq)
+    rr = np.where(fix_r, -rq - rs, rr)
+    return rq.astype("i8"), rr.astype("i8")
+
+
+def hex_centers(q, r, size):
+    """
+    Centers of hexagons
+
+    :param q: Axial column
+    :param r: Axial row
+    :param size: Hexagon circumradius
+    :return: (x, y) arrays
+    """
+    return size * SQRT3 * (q + r / 2), size * 1.5 * r
+
+
+def hex_rings(x, y, size):
+    """
+    Closed clockwise rings of hexagons
+
+    :param x: Center x coordinates
+    :param y: Center y coordinates
+    :param size: Hexagon circumradius
+    :return: (n, 7, 2) array
+    """
+    angles = np.radians(90 - 60 * np.arange(7))
+    return np.stack([x[:, None] + size * np.cos(angles), y[:, None] + size * np.sin(angles)], axis=-1)
+
+
+def hexbin(x, y, measures, size, time=None):
+    """
+    Aggregate points per hexagon, and per time if given
+
+    :param x: Point x coordinates
+    :param y: Point y coordinates
+    :param measures: Field name -> values, summed per hexagon
+    :param size: Hexagon circumradius
+    :param time: Time of each point, None for one aggregate per hexagon
+    :return: DataFrame of Q, R, X, Y (center), Point_Count, the sums and the time
+    """
+    x, y = np.asarray(x, dtype="f8"), np.asarray(y, dtype="f8")
+    valid = ~(np.isnan(x) | np.isnan(y))
+    x, y = x[valid], y[valid]
+    measures = {name: np.asarray(values)[valid] for name, values in measures.items()}
+    groups = labels = None
+    if time is not None:
+        groups, labels = pd.factorize(np.asarray(time)[valid], sort=True)
+
+    q, r = hex_cells(x, y, size)
+    if not len(q):
+        return pd.DataFrame(columns=["Q", "R", "X", "Y", "Point_Count"] + list(measures))
+    _, sums, first = grid_cluster(q - q.min(), r - r.min(), measures, groups)
+    frame = pd.DataFrame({"Q": q[first], "R": r[first]})
+    frame["X"], frame["Y"] = hex_centers(frame.Q.values, frame.R.values, size)
+    for name, values in sums.items():
+        frame[name] = values
+    if groups is not None:
+        frame["Date"] = np.asarray(labels)[groups[first]]
+    return frame
+
+
+def quantile_breaks(values, classes=HEX_CLASSES):
+    """
+    Distinct upper bounds splitting the values in classes of similar counts
+
+    :param values: The values
+    :param classes: Number of classes
+    """
+    values = np.asarray(values, dtype="f8")
+    if not len(values):
+        return np.array([0.0])
+    return np.unique(np.quantile(values, np.linspace(0, 1, classes + 1)[1:]))
+
+
+def class_breaks_renderer(field, breaks):
+    """
+    CIM class breaks renderer of polygons, on the yellow to red ramp of the Z layer renderer
+
+    :param field: The classified field
+    :param breaks: Upper bounds, ascending
+    :return: The renderer dict
+    """
+    def symbol(hue):
+        return {
+            "type": "CIMSymbolReference",
+            "symbol": {
+                "type": "CIMPolygonSymbol",
+                "symbolLayers": [
+                    {
+                        "type": "CIMSolidStroke",
+                        "enable": True,
+                        "width": 0.4,
+                        "color": {"type": "CIMRGBColor", "values": [110, 110, 110, 100]}
+                    },
+                    {
+                        "type": "CIMSolidFill",
+                        "enable": True,
+                        "color": {"type": "CIMHSVColor", "values": [hue, 100, 96, 100]}
+                    }
+                ]
+            }
+        }
+
+    hues = np.linspace(60, 0, len(breaks)) if len(breaks) > 1 else np.array([0.0])
+    lower = 0
+    classes = []
+    for hue, upper in zip(hues.tolist(), np.asarray(breaks).tolist()):
+        classes.append({
+            "type": "CIMClassBreak",
+            "label": "{:,.0f} - {:,.0f}".format(lower, upper),
+            "patch": "Default",
+            "symbol": symbol(hue),
+            "upperBound": upper
+        })
+        lower = upper
+    return {
+        "type": "CIMClassBreaksRenderer",
+        "barrierWeight": "High",
+        "breaks": classes,
+        "classBreakType": "GraduatedColor",
+        "classificationMethod": "Quantile",
+        "field": field,
+        "minimumBreak": 0,
+        "showInAscendingOrder": True,
+        "heading": field,
+        "sampleSize": 10000,
+        "useDefaultSymbol": False,
+        "useExclusionSymbol": False
+    }
+
+
+class HexbinCache(object):
+    """ Hexbin polygon feature classes in the scratch gdb, cached per source and resolution. """
+
+    scratch = None  #: Scratch gdb path
+    layers = None  #: (source path, size) -> (change token, scratch path, cells DataFrame)
+
+    def __init__(self, scratch=None):
+        """
+        Create the cache
+
+        :param scratch: Scratch gdb path, arcpy.env.scratchGDB by default
+        """
+        self.scratch = scratch
+        self.layers = {}
+
+    @staticmethod
+    def default_size(source, scale, pixels=HEX_PIXELS):
+        """
+        Hexagon size showing as some pixels at a scale
+
+        :param source: Path of the point feature class
+        :param scale: Scale denominator, the map reference scale
+        :param pixels: Size on screen
+        """
+        import arcpy
+
+        return tolerance_for_scale(scale, meters_per_unit(arcpy.Describe(source).spatialReference), pixels=pixels)
+
+    def publish(self, source, token, size, x, y, measures, time=None):
+        """
+        Scratch polygon feature class of the hexagons, rebuilt only when the token changes
+
+        :param source: Path of the point feature class
+        :param token: Change token of the source
+        :param size: Hexagon circumradius, in coordinate units
+        :param x: Point x coordinates
+        :param y: Point y coordinates
+        :param measures: Field name -> values, summed per hexagon
+        :param time: Time of each point, None for untimed hexagons
+        :return: (scratch path, cells DataFrame)
+        """
+        import arcpy
+
+        known = self.layers.get((source, size))
+        if known is not None and known[0] == token and arcpy.Exists(known[1]):
+            return known[1], known[2]
+
+        cells = hexbin(x, y, measures, size, time)
+        out = known[1] if known is not None else os.path.join(
+            self.scratch or arcpy.env.scratchGDB, "{}_hex{}".format(os.path.basename(source), len(self.layers)))
+        if arcpy.Exists(out):
+            arcpy.management.Delete(out)
+        spatial_reference = arcpy.Describe(source).spatialReference
+        arcpy.management.CreateFeatureclass(os.path.dirname(out), os.path.basename(out), "POLYGON",
+                                            spatial_reference=spatial_reference)
+        fields = [c for c in cells.columns if c not in ("X", "Y")]
+        for field in fields:
+            arcpy.management.AddField(out, field, "DATE" if field == "Date" else
+                                      "LONG" if cells[field].dtype.kind == "i" else "DOUBLE")
+
+        rings = hex_rings(cells.X.values, cells.Y.values, size)
+        with arcpy.da.InsertCursor(out, ["SHAPE@"] + fields) as cursor:
+            for ring, row in zip(rings.tolist(), cells[fields].itertuples(index=False)):
+                shape = arcpy.Polygon(arcpy.Array([arcpy.Point(px, py) for px, py in ring]), spatial_reference)
+                cursor.insertRow([shape] + [v.to_pydatetime() if isinstance(v, pd.Timestamp) else v for v in row])
+
+        self.layers[(source, size)] = (token, out, cells)
+        arcpy.AddMessage("{}: {} hexagons of {} points".format(os.path.basename(source), len(cells), len(x)))
+        return out, cells
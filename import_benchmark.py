@@ -0,0 +1,133 @@
+"""
+    Tool : Pivot, Source Name : import_benchmark.py, Author: M'hamed Bendenia.
+
+    Measures the cost of importing Pivot in a fresh interpreter and appends it to a history file, one entry per release:
+
+        python import_benchmark.py --release 1.2
+"""
+
+import argparse
+import datetime
+import json
+import os
+import subprocess
+import sys
+
+HEAVY_MODULES = ("arcpy", "arcgis", "matplotlib", "matplotlib.pyplot", "wx", "pandas")  #: Modules worth deferring
+HISTORY = os.path.join(os.environ.get("LOCALAPPDATA") or os.path.join(os.path.expanduser("~"), ".local", "share"),
+                       "Pivot", "import_times.json")  #: Default history file, in the user data folder
+
+PROBE = """
+import json, sys, time
+start = time.perf_counter()
+import {module}
+total = time.perf_counter() - start
+loaded = [m for m in {heavy!r} if sys.modules.get(m) is not None]
+print(json.dumps([total, loaded]))
+"""
+
+
+def parse_importtime(stderr):
+    """
+    Parse python -X importtime output
+
+    :param stderr: The interpreter's stderr
+    :return: List of (module, self us, cumulative us)
+    """
+    rows = []
+    for line in stderr.splitlines():
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+        self_us, cumulative_us, module = line[len("import time:"):].split("|")
+        rows.append((module.strip(), int(self_us), int(cumulative_us)))
+    return rows
+
+
+def measure(module="Pivot", repeat=5, top=10):
+    """
+    Import a module in fresh interpreters
+
+    :param module: The module to import
+    :param repeat: Interpreters to start, the fastest run is kept
+    :param top: Number of slowest imports to report, from -X importtime on Python 3.7+
+    :return: Dict of seconds, heavy modules loaded by the import (with their cumulative us when -X importtime runs)
+             and slowest imports
+    """
+    folder = os.path.dirname(os.path.abspath(__file__))
+    code = PROBE.format(module=module, heavy=HEAVY_MODULES)
+    runs = []
+    for _ in range(repeat):
+        out = subprocess.run([sys.executable, "-c", code], cwd=folder, stdout=subprocess.PIPE,
+                             stderr=subprocess.PIPE, universal_newlines=True, check=True)
+        runs.append(json.loads(out.stdout.strip().splitlines()[-1]))
+    seconds, loaded = min(runs)
+
+    slowest = []
+    loaded = dict.fromkeys(loaded)
+    if sys.version_info >= (3, 7):
+        out = subprocess.run([sys.executable, "-X", "importtime", "-c", "import " + module], cwd=folder,
+                             stdout=subprocess.PIPE, stderr=subprocess.PIPE, universal_newlines=True, check=True)
+        rows = parse_importtime(out.stderr)
+        slowest = sorted(rows, key=lambda row: row[2], reverse=True)[:top]
+        loaded.update((name, cumulative_us) for name, _, cumulative_us in rows if name in loaded)
+    return {"seconds": seconds, "loaded_heavy_modules": loaded, "slowest": slowest}
+
+
+def release_name():
+    """
+    Current release, from git tags
+    """
+    try:
+        out = subprocess.run(["git", "describe", "--tags", "--always"], cwd=os.path.dirname(os.path.abspath(__file__)),
+                             stdout=subprocess.PIPE, stderr=subprocess.DEVNULL, universal_newlines=True, check=True)
+        return out.stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+
+def record(result, release, history=HISTORY):
+    """
+    Append a measure to the history, replacing an earlier one of the same release
+
+    :param result: The measure() result
+    :param release: The release name
+    :param history: The history file
+    :return: The whole history
+    """
+    entries = []
+    if os.path.exists(history):
+        with open(history) as f:
+            entries = json.load(f)
+    entries = [e for e in entries if e["release"] != release]
+    entries.append(dict(result, release=release, python=sys.version.split()[0],
+                        date=datetime.date.today().isoformat()))
+    folder = os.path.dirname(os.path.abspath(history))
+    if not os.path.isdir(folder):
+        os.makedirs(folder)
+    with open(history, "w") as f:
+        json.dump(entries, f, indent=2)
+    return entries
+
+
+def main():
+    """
+    Measure, record and print the history
+    """
+    parser = argparse.ArgumentParser(description="Import time of Pivot, tracked over releases.")
+    parser.add_argument("--module", default="Pivot")
+    parser.add_argument("--release", default=None, help="Release name, git describe by default")
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--history", default=HISTORY)
+    args = parser.parse_args()
+
+    result = measure(args.module, args.repeat)
+    for module, self_us, cumulative_us in result["slowest"]:
+        print("{:>10} us  {}".format(cumulative_us, module))
+    for module, cumulative_us in sorted(result["loaded_heavy_modules"].items()):
+        print("Loaded at import: {}{}".format(module, "" if cumulative_us is None else ", {} us".format(cumulative_us)))
+    for entry in record(result, args.release or release_name(), args.history):
+        print("{release:>16}  {seconds:8.3f} s  Python {python}  {date}".format(**entry))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,176 @@
+"""
+    Tool : Pivot, Source Name : ingest.py, Author: M'hamed Bendenia.
+"""
+
+import numpy as np
+
+from lazy import lazy_import
+from view_selection import MEASURES, week_key
+
+pd = lazy_import("pandas")
+
+CONFIRMED_BREAKS = (10, 100, 1000, 5000, 50000, 100000, 150000, 1000000, 4620444)  #: Renderers' Confirmed bounds
+
+
+def merge_max(current, delta):
+    """
+    Fold a delta aggregate into a current one, both indexed by their group key, keeping the max: the delta's keys
+    are looked up in the current index, only the touched rows are written
+
+    :param current: Current aggregate, None if empty
+    :param delta: Aggregate of the appended rows
+    :return: The merged aggregate, current updated in place unless new keys were added
+    """
+    if current is None:
+        return delta.sort_index()
+    positions = current.index.get_indexer(delta.index)
+    found = positions >= 0
+    if found.any():
+        rows = positions[found]
+        current.iloc[rows] = np.fmax(current.values[rows], delta.values[found])
+    if not found.all():
+        # New keys are mostly later dates, appended at the end without re-sorting
+        current = pd.concat([current, delta[~found]])
+        if not current.index.is_monotonic_increasing:
+            current = current.sort_index()
+    return current
+
+
+class IncrementalAggregates(object):
+    """ Daily, weekly and per-country maxima, time extent and class counts, updated in O(delta). """
+
+    daily = weekly = countries = None  #: Max of the measures by Date, Week and Country_Re
+    extent = None  #: (first, last) Date
+    class_counts = None  #: Measure -> rows per class of the Confirmed breaks
+    upper_bounds = None  #: Class upper bounds
+
+    def __init__(self, df, upper_bounds=CONFIRMED_BREAKS):
+        """
+        Aggregate a whole table once
+
+        :param df: The table's DataFrame
+        :param upper_bounds: Class upper bounds of the class counts
+        """
+        self.upper_bounds = np.asarray(upper_bounds, dtype="f8")
+        self.measures = [m for m in MEASURES if m in df.columns]
+        self.class_counts = {m: np.zeros(len(self.upper_bounds) + 1, dtype="i8") for m in self.measures}
+        self.update(df)
+
+    def update(self, delta):
+        """
+        Fold appended rows in
+
+        :param delta: DataFrame of the appended rows
+        """
+        if not len(delta) or not self.measures:
+            return
+        if "Date" in delta.columns:
+            dates = pd.to_datetime(delta["Date"])
+            daily = delta[self.measures].groupby(dates.dt.normalize().values).max()
+            self.daily = merge_max(self.daily, daily)
+            weekly = daily.groupby(week_key(pd.Series(daily.index)).values).max()
+            self.weekly = merge_max(self.weekly, weekly)
+            first, last = dates.min(), dates.max()
+            if self.extent is not None:
+                first, last = min(first, self.extent[0]), max(last, self.extent[1])
+            self.extent = (first, last)
+        if "Country_Re" in delta.columns:
+            self.countries = merge_max(self.countries, delta.groupby("Country_Re")[self.measures].max())
+        for m in self.measures:
+            values = delta[m].values.astype("f8")
+            values = values[~np.isnan(values)]
+            self.class_counts[m] += np.bincount(np.searchsorted(self.upper_bounds, values, side="left"),
+                                                minlength=len(self.upper_bounds) + 1)
+
+    def cardinality(self):
+        """
+        Distinct Country_Re, Date and Week values seen, for the table profile
+
+        :return: Dimension -> count
+        """
+        counts = {}
+        for dim, current in (("Country_Re", self.countries), ("Date", self.daily), ("Week", self.weekly)):
+            if current is not None:
+                counts[dim] = len(current)
+        return counts
+
+    def frame(self, group_by):
+        """
+        An aggregate shaped like Pivot.aggregate results
+
+        :param group_by: ('Date',), ('Week',) or ('Country_Re',)
+        :return: A DataFrame, None for other group-bys
+        """
+        current = {("Date",): self.daily, ("Week",): self.weekly, ("Country_Re",): self.countries}.get(tuple(group_by))
+        if current is None:
+            return None
+        return current.rename_axis(group_by[0]).reset_index()
+
+    def time_extent(self):
+        """
+        Time extent in epoch milliseconds, for CIM time definitions
+
+        :return: (start, end), None without dates
+        """
+        if self.extent is None:
+            return None
+        return tuple(int(pd.Timestamp(t).value // 10 ** 6) for t in self.extent)
+
+
+class Ingestor(object):
+    """ Detects rows appended to the DW tables by OBJECTID high-water mark and reads only those. """
+
+    states = None  #: Table name -> (OID field, high-water mark, row count)
+    aggregates = None  #: Table name -> IncrementalAggregates
+
+    def __init__(self):
+        """
+        Create an empty tracker
+        """
+        self.states = {}
+        self.aggregates = {}
+
+    def track(self, name, df, oid_field):
+        """
+        Start tracking a freshly (re)loaded table
+
+        :param name: The DW table name
+        :param df: The table's DataFrame
+        :param oid_field: The OID field name
+        """
+        if oid_field not in df.columns:
+            self.states.pop(name, None)
+            self.aggregates.pop(name, None)
+            return
+        hwm = int(df[oid_field].max()) if len(df) else 0
+        self.states[name] = (oid_field, hwm, len(df))
+        self.aggregates[name] = IncrementalAggregates(df)
+
+    def append(self, name, path, spatial, df, rows):
+        """
+        Read the rows appended since the high-water mark and fold them into the aggregates
+
+        :param name: The DW table name
+        :param path: Path of the feature class or table
+        :param spatial: True for a feature class
+        :param df: The resident DataFrame
+        :param rows: Current row count of the source
+        :return: The grown DataFrame, None if the change is not a pure append and needs a rebuild
+        """
+        if name not in self.states:
+            return None
+        oid_field, hwm, known = self.states[name]
+        if rows <= known:
+            return None
+        where = "{} > {}".format(oid_field, hwm)
+        if spatial:
+            delta = pd.DataFrame.spatial.from_featureclass(path, where_clause=where)
+        else:
+            delta = pd.DataFrame.spatial.from_table(path, where_clause=where)
+        # Any other edit (deletes, updates) breaks the count
+        if known + len(delta) != rows:
+            return None
+        grown = pd.concat([df, delta], ignore_index=True)
+        self.states[name] = (oid_field, int(delta[oid_field].max()), rows)
+        self.aggregates[name].update(delta)
+        return grown
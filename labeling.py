@@ -0,0 +1,201 @@
+"""
+    Tool : Pivot, Source Name : labeling.py, Author: M'hamed Bendenia.
+"""
+
+import os
+
+import numpy as np
+
+LABEL_PROFILES = ("maplex", "fast")  #: makeLabel profiles: full Maplex placement, or Standard engine on anchors
+
+
+def part_areas(store):
+    """
+    Area of each part, holes removed
+
+    :param store: A polygon GeometryStore
+    """
+    x, y = store.coords[:, 0], store.coords[:, 1]
+    cross = np.concatenate([[0.0], np.cumsum(x[:-1] * y[1:] - x[1:] * y[:-1])])
+    start, stop = store.ring_offsets[:-1], store.ring_offsets[1:]
+    rings = np.concatenate([[0.0], np.cumsum(cross[np.maximum(stop - 1, start)] - cross[start])])
+    return np.abs(rings[store.part_offsets[1:]] - rings[store.part_offsets[:-1]]) / 2
+
+
+def interior_point(rings):
+    """
+    A point inside a part: its centroid when inside, else the middle of the widest span on a horizontal line
+
+    :param rings: The part's closed rings, outer ring first
+    :return: (x, y)
+    """
+    outer = rings[0]
+    x, y = outer[:, 0], outer[:, 1]
+    cross = x[:-1] * y[1:] - x[1:] * y[:-1]
+    area = cross.sum()
+    if area == 0:
+        return float(x.mean()), float(y.mean())
+    cx = ((x[:-1] + x[1:]) * cross).sum() / (3 * area)
+    cy = ((y[:-1] + y[1:]) * cross).sum() / (3 * area)
+
+    # Crossings of the horizontal line through the centroid, over every ring
+    crossings = []
+    for ring in rings:
+        x0, y0, x1, y1 = ring[:-1, 0], ring[:-1, 1], ring[1:, 0], ring[1:, 1]
+        hit = (y0 > cy) != (y1 > cy)
+        crossings.append(x0[hit] + (cy - y0[hit]) * (x1[hit] - x0[hit]) / (y1[hit] - y0[hit]))
+    crossings = np.sort(np.concatenate(crossings))
+    if len(crossings) < 2:
+        return float(cx), float(cy)
+    starts, ends = crossings[0::2], crossings[1::2]
+    starts = starts[:len(ends)]
+    inside = (starts <= cx) & (cx <= ends)
+    if inside.any():
+        return float(cx), float(cy)
+    widest = int(np.argmax(ends - starts))
+    return float((starts[widest] + ends[widest]) / 2), float(cy)
+
+
+def label_anchors(store):
+    """
+    Label anchor of each feature: the interior point of its largest part
+
+    :param store: A GeometryStore
+    :return: (n, 2) array, NaN for empty features
+    """
+    if store.kind != "polygon":
+        return store.centroid()
+    out = np.full((len(store), 2), np.nan)
+    areas = part_areas(store)
+    for f in range(len(store)):
+        first, last = store.feature_offsets[f], store.feature_offsets[f + 1]
+        if last == first:
+            continue
+        p = first + int(np.argmax(areas[first:last]))
+        rings = [store.coords[store.ring_offsets[r]:store.ring_offsets[r + 1]]
+                 for r in range(store.part_offsets[p], store.part_offsets[p + 1])]
+        out[f] = interior_point(rings)
+    return out
+
+
+def top_n_where(df, label_field, measure, n):
+    """
+    SQL filter keeping the labels of the N features with the highest measure
+
+    :param df: The layer's DataFrame
+    :param label_field: The labeled field
+    :param measure: The ranking field
+    :param n: Number of labels, None or 0 for all
+    :return: A where clause, empty for all
+    """
+    if not n or measure not in df.columns or label_field not in df.columns:
+        return ""
+    top = df.groupby(label_field)[measure].max().nlargest(n).index
+    values = ", ".join("'{}'".format(str(v).replace("'", "''")) for v in top)
+    return "{} IN ({})".format(label_field, values) if values else ""
+
+
+def standard_label_class(field_name, where=""):
+    """
+    Standard engine label class of anchor points: one label on top of each point, no conflict strategies
+
+    :param field_name: The labeled field
+    :param where: SQL filter of the labeled features
+    :return: The CIMLabelClass dict
+    """
+    return {
+        "type": "CIMLabelClass",
+        "expression": "$feature." + field_name,
+        "expressionEngine": "Arcade",
+        "featuresToLabel": "AllVisibleFeatures",
+        "maximumScale": "NaN",
+        "minimumScale": "NaN",
+        "name": "Class 1",
+        "priority": -1,
+        "whereClause": where,
+        "standardLabelPlacementProperties": {
+            "type": "CIMStandardLabelPlacementProperties",
+            "featureType": "Point",
+            "featureWeight": "None",
+            "labelWeight": "Low",
+            "numLabelsOption": "OneLabelPerFeature",
+            "pointPlacementMethod": "OnTopPoint",
+            "rotationType": "Arithmetic"
+        },
+        "textSymbol": {
+            "type": "CIMSymbolReference",
+            "symbol": {
+                "type": "CIMTextSymbol",
+                "fontFamilyName": "Tahoma",
+                "fontStyleName": "Regular",
+                "height": 10,
+                "horizontalAlignment": "Center",
+                "verticalAlignment": "Center",
+                "symbol": {
+                    "type": "CIMPolygonSymbol",
+                    "symbolLayers": [
+                        {
+                            "type": "CIMSolidFill",
+                            "enable": True,
+                            "color": {"type": "CIMRGBColor", "values": [0, 0, 0, 100]}
+                        }
+                    ]
+                }
+            }
+        },
+        "useCodedValue": True,
+        "visibility": True,
+        "iD": -1
+    }
+
+
+class LabelAnchors(object):
+    """ Point feature classes of precomputed label anchors in the scratch gdb. """
+
+    scratch = None  #: Scratch gdb path
+    anchors = None  #: (source path, label field) -> (change token, scratch path)
+
+    def __init__(self, scratch=None):
+        """
+        Create the cache
+
+        :param scratch: Scratch gdb path, arcpy.env.scratchGDB by default
+        """
+        self.scratch = scratch
+        self.anchors = {}
+
+    def publish(self, source, token, store, df, field_name, measures=()):
+        """
+        Scratch point feature class of the anchors, rebuilt only when the token changes
+
+        :param source: Path of the polygon feature class
+        :param token: Change token of the source
+        :param store: GeometryStore of the features
+        :param df: DataFrame of the features, in the store's order
+        :param field_name: The labeled field
+        :param measures: Fields copied for label filters
+        :return: Path of the scratch feature class
+        """
+        import arcpy
+
+        known = self.anchors.get((source, field_name))
+        if known is not None and known[0] == token and arcpy.Exists(known[1]):
+            return known[1]
+
+        xy = label_anchors(store)
+        valid = ~np.isnan(xy[:, 0])
+        labels = df[field_name].astype(str).values[valid]
+        dtype = [("X", "f8"), ("Y", "f8"), (field_name, "<U{}".format(max([len(v) for v in labels] + [1])))]
+        dtype += [(m, "f8") for m in measures if m in df.columns]
+        array = np.empty(int(valid.sum()), dtype=dtype)
+        array["X"], array["Y"], array[field_name] = xy[valid, 0], xy[valid, 1], labels
+        for m, _ in dtype[3:]:
+            array[m] = df[m].values[valid]
+
+        out = os.path.join(self.scratch or arcpy.env.scratchGDB,
+                           "{}_anchors_{}".format(os.path.basename(source), field_name))
+        if arcpy.Exists(out):
+            arcpy.management.Delete(out)
+        arcpy.da.NumPyArrayToFeatureClass(array, out, ("X", "Y"), arcpy.Describe(source).spatialReference)
+        self.anchors[(source, field_name)] = (token, out)
+        return out
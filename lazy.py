@@ -0,0 +1,45 @@
+"""
+    Tool : Pivot, Source Name : lazy.py, Author: M'hamed Bendenia.
+"""
+
+import importlib
+import sys
+
+
+class LazyModule(object):
+    """ Stand-in of a module, imported on its first attribute access: nothing is looked up or loaded before. """
+
+    def __init__(self, name):
+        """
+        Create the stand-in
+
+        :param name: The module name, e.g. 'matplotlib.pyplot'
+        """
+        self._name = name
+        self._module = None
+
+    def _load(self):
+        """
+        The module, imported on first use; a missing module raises ImportError here
+        """
+        if self._module is None:
+            self._module = importlib.import_module(self._name)
+        return self._module
+
+    def __getattr__(self, attribute):
+        return getattr(self._load(), attribute)
+
+    def __repr__(self):
+        return "<lazy module '{}'{}>".format(self._name, "" if self._module is None else " (loaded)")
+
+
+def lazy_import(name):
+    """
+    A module that is only imported on its first attribute access
+
+    :param name: The module name, e.g. 'matplotlib.pyplot'
+    :return: The module if it was already imported, else a LazyModule
+    """
+    if name in sys.modules:
+        return sys.modules[name]
+    return LazyModule(name)
@@ -0,0 +1,158 @@
+"""
+    Tool : Pivot, Source Name : matrix_store.py, Author: M'hamed Bendenia.
+"""
+
+import numpy as np
+
+from lazy import lazy_import
+from view_selection import MEASURES, WEEK_FREQ
+
+pd = lazy_import("pandas")
+
+
+class MatrixStore(object):
+    """ Dense countries x periods matrices, one plane per measure, built from a long Country_Re x Date table. """
+
+    countries = None  #: Country labels, row order
+    periods = None  #: Period labels (datetime64), column order
+    planes = None  #: Measure -> 2D float64 array, NaN where a country has no row in a period
+    freq = None  #: Period grain, a pandas frequency, None for days
+
+    def __init__(self, countries, periods, planes, freq=None):
+        """
+        Wrap prebuilt matrices
+
+        :param countries: Country labels
+        :param periods: Period labels
+        :param planes: Measure -> countries x periods array
+        :param freq: Period grain
+        """
+        self.countries = np.asarray(countries)
+        self.periods = np.asarray(periods, dtype="datetime64[ns]")
+        self.planes = planes
+        self.freq = freq
+        self._country_codes = {c: i for i, c in enumerate(self.countries)}
+        self._period_codes = {p: i for i, p in enumerate(self.periods)}
+
+    @classmethod
+    def build(cls, df, freq=WEEK_FREQ, measures=MEASURES, country="Country_Re", date="Date"):
+        """
+        Build the matrices, keeping each measure's max per country and period
+
+        :param df: The long-form DataFrame
+        :param freq: Period grain, a pandas frequency, None for days
+        :param measures: Measures to store
+        :param country: Country column
+        :param date: Date column
+        """
+        dates = pd.to_datetime(df[date])
+        if freq:
+            dates = dates.dt.to_period(freq).dt.end_time.dt.normalize()
+        else:
+            dates = dates.dt.normalize()
+        country_codes, countries = pd.factorize(df[country], sort=True)
+        period_codes, periods = pd.factorize(dates, sort=True)
+        valid = (country_codes >= 0) & (period_codes >= 0)
+        country_codes, period_codes = country_codes[valid], period_codes[valid]
+
+        # One flat cell index per row, reduced with a single groupby
+        cells = country_codes.astype("i8") * len(periods) + period_codes
+        measures = [m for m in measures if m in df.columns]
+        maxima = pd.DataFrame({m: df[m].values[valid] for m in measures}).groupby(cells).max()
+        planes = {}
+        for m in measures:
+            plane = np.full(len(countries) * len(periods), np.nan)
+            plane[maxima.index.values] = maxima[m].values
+            planes[m] = plane.reshape(len(countries), len(periods))
+        return cls(np.asarray(countries), np.asarray(periods), planes, freq)
+
+    def country_code(self, country):
+        """
+        Row of a country
+
+        :param country: The country label
+        """
+        return self._country_codes[country]
+
+    def period_code(self, period):
+        """
+        Column of a period
+
+        :param period: The period label, anything pandas reads as a date
+        """
+        return self._period_codes[np.datetime64(pd.Timestamp(period), "ns")]
+
+    def period(self, period, measure):
+        """
+        One period for every country, a view on the plane
+
+        :param period: The period label
+        :param measure: The measure
+        """
+        return self.planes[measure][:, self.period_code(period)]
+
+    def series(self, country, measure):
+        """
+        A country's time series, a view on the plane
+
+        :param country: The country label
+        :param measure: The measure
+        """
+        return self.planes[measure][self.country_code(country)]
+
+    def totals(self, measure):
+        """
+        Max over the countries of each period
+
+        :param measure: The measure
+        """
+        plane = self.planes[measure]
+        out = np.full(plane.shape[1], np.nan)
+        seen = ~np.isnan(plane).all(axis=0)
+        out[seen] = np.nanmax(plane[:, seen], axis=0)
+        return out
+
+    def sums(self, measure):
+        """
+        Sum over the countries of each period, missing where no country has a value
+
+        :param measure: The measure
+        """
+        plane = self.planes[measure]
+        out = np.full(plane.shape[1], np.nan)
+        seen = ~np.isnan(plane).all(axis=0)
+        out[seen] = np.nansum(plane[:, seen], axis=0)
+        return out
+
+    def class_counts(self, measure, period, upper_bounds):
+        """
+        Number of countries per class of a class breaks renderer in a period
+
+        :param measure: The measure
+        :param period: The period label
+        :param upper_bounds: Sorted class upper bounds, a value equal to a bound falls in its class
+        :return: Counts per class, plus a last one for values above the last bound
+        """
+        values = self.period(period, measure)
+        values = values[~np.isnan(values)]
+        classes = np.searchsorted(np.asarray(upper_bounds, dtype="f8"), values, side="left")
+        return np.bincount(classes, minlength=len(upper_bounds) + 1)
+
+    def nbytes(self):
+        """
+        Memory held by the matrices and code maps
+        """
+        labels = self.countries.nbytes + self.periods.nbytes + sum(len(str(c)) for c in self.countries)
+        return int(sum(p.nbytes for p in self.planes.values()) + labels)
+
+    def memory_report(self, df):
+        """
+        Memory of the matrices against the long-form DataFrame
+
+        :param df: The long-form DataFrame the store was built from
+        :return: A dict with both sizes and their ratio
+        """
+        long_bytes = int(df.memory_usage(deep=True).sum())
+        matrix_bytes = self.nbytes()
+        return {"matrix_bytes": matrix_bytes, "long_bytes": long_bytes,
+                "ratio": matrix_bytes / long_bytes if long_bytes else 0.0}
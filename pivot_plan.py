@@ -0,0 +1,150 @@
+"""
+    Tool : Pivot, Source Name : pivot_plan.py, Author: M'hamed Bendenia.
+"""
+
+import collections
+import concurrent.futures
+import time
+
+CPU = "cpu"  #: Step run on the pool, concurrently with the others
+SERIAL = "serial"  #: Step run on the dispatching thread, one at a time in plan order: arcpy, wx and pyplot calls
+
+
+class Step(object):
+    """ One step of a pivot plan and its timing. """
+
+    name = None  #: Step name, unique in its plan
+    kind = None  #: CPU or SERIAL
+    after = ()  #: Names of the steps it depends on
+    start = end = None  #: perf_counter times
+    error = None  #: Exception raised by the step
+
+    def __init__(self, name, run, after=(), kind=CPU):
+        """
+        Create the step
+
+        :param name: Step name
+        :param run: Callable doing the step
+        :param after: Names of the steps it depends on
+        :param kind: CPU or SERIAL
+        """
+        self.name = name
+        self.run = run
+        self.after = tuple(after)
+        self.kind = kind
+
+    @property
+    def seconds(self):
+        """
+        Duration of the step, 0 if it did not run
+        """
+        return self.end - self.start if self.end is not None else 0.0
+
+    def __call__(self):
+        self.start = time.perf_counter()
+        try:
+            self.run()
+        except Exception as e:
+            self.error = e
+        finally:
+            self.end = time.perf_counter()
+
+
+class PivotPlan(object):
+    """ Steps of a pivot as a dependency graph: CPU steps on a pool, SERIAL steps in order on the calling thread. """
+
+    name = None  #: Plan name, e.g. the pivot position
+    steps = None  #: Step name -> Step, in plan order
+    start = end = None  #: perf_counter times of the run
+
+    def __init__(self, name=""):
+        """
+        Create an empty plan
+
+        :param name: Plan name
+        """
+        self.name = name
+        self.steps = collections.OrderedDict()
+        self._last_serial = None
+
+    def add(self, name, run, after=(), kind=CPU):
+        """
+        Add a step, a SERIAL one also depends on the SERIAL step added before it: layer order and visibility changes
+        keep the order of the plan even when an earlier step waits on a CPU step
+
+        :param name: Step name
+        :param run: Callable doing the step
+        :param after: Names of earlier steps it depends on
+        :param kind: CPU or SERIAL
+        :return: The Step
+        """
+        if name in self.steps:
+            raise ValueError("Duplicate pivot step: " + name)
+        missing = [n for n in after if n not in self.steps]
+        if missing:
+            raise ValueError("Pivot step {} depends on unknown steps: {}".format(name, ", ".join(missing)))
+        if kind == SERIAL:
+            if self._last_serial is not None and self._last_serial not in after:
+                after = tuple(after) + (self._last_serial,)
+            self._last_serial = name
+        self.steps[name] = Step(name, run, after, kind)
+        return self.steps[name]
+
+    def run(self, pool):
+        """
+        Run the plan: ready CPU steps go to the pool, ready SERIAL steps run here in plan order
+
+        :param pool: A concurrent.futures executor
+        :return: The steps that failed
+        """
+        self.start = time.perf_counter()
+        done, running = set(), {}
+        pending = list(self.steps.values())
+        while pending or running:
+            ready = [s for s in pending if all(n in done for n in s.after)]
+            for step in [s for s in ready if s.kind == CPU]:
+                running[pool.submit(step)] = step
+                pending.remove(step)
+            serial = [s for s in ready if s.kind == SERIAL]
+            if serial:
+                serial[0]()
+                done.add(serial[0].name)
+                pending.remove(serial[0])
+            elif running:
+                finished, _ = concurrent.futures.wait(running, return_when=concurrent.futures.FIRST_COMPLETED)
+                for future in finished:
+                    done.add(running.pop(future).name)
+            else:
+                break
+            # Collect CPU steps finished meanwhile without blocking the serial ones
+            for future in [f for f in running if f.done()]:
+                done.add(running.pop(future).name)
+        self.end = time.perf_counter()
+        return [s for s in self.steps.values() if s.error is not None]
+
+    def critical_path(self):
+        """
+        Longest chain of dependent steps, by measured duration
+
+        :return: (seconds, step names)
+        """
+        longest = {}
+        for step in self.steps.values():
+            before = max([longest[n] for n in step.after], key=lambda path: path[0], default=(0.0, []))
+            longest[step.name] = (before[0] + step.seconds, before[1] + [step.name])
+        return max(longest.values(), key=lambda path: path[0], default=(0.0, []))
+
+    def report(self):
+        """
+        Timing summary: wall time, summed step time and critical path
+
+        :return: A list of lines
+        """
+        seconds, path = self.critical_path()
+        wall = self.end - self.start if self.end is not None else 0.0
+        lines = ["Pivot {}: {:.3f} s, steps {:.3f} s, critical path {:.3f} s: {}".format(
+            self.name, wall, sum(s.seconds for s in self.steps.values()), seconds, " > ".join(path))]
+        for step in self.steps.values():
+            lines.append("  {:<8} {:8.3f} s  {}{}".format(step.kind, step.seconds, step.name,
+                                                           "  failed: {}".format(step.error) if step.error else ""))
+        return lines
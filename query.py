@@ -0,0 +1,343 @@
+"""
+    Tool : Pivot, Source Name : query.py, Author: M'hamed Bendenia.
+"""
+
+import collections
+import os
+import time
+
+import numpy as np
+
+from lazy import lazy_import
+from view_selection import distinct_estimate
+
+pd = lazy_import("pandas")
+
+AGGREGATES = ("MIN", "MAX", "SUM")  #: Aggregate functions both paths can run
+OPERATORS = ("=", "<>", "<", "<=", ">", ">=", "IN", "IS NULL", "IS NOT NULL")  #: Filter operators
+
+# Rough per-unit costs in seconds, used to compare the two paths
+FETCH_ROW_COST = 5e-6  #: Moving one row out of a cursor into Python
+SCAN_ROW_COST = 5e-8  #: Scanning one row of a resident DataFrame
+GROUP_ROW_COST = 1e-7  #: Hashing one row per group-by field in a pandas groupby
+GDB_SCAN_ROW_COST = 1e-8  #: Scanning one row inside the gdb, in native code
+CURSOR_OVERHEAD = 0.02  #: Opening a SearchCursor
+TOOL_OVERHEAD = 0.3  #: Running a geoprocessing tool (Statistics)
+
+
+class PivotQuery(object):
+    """ A simple pivot operation: filters, GROUP BY with MIN/MAX/SUM, DISTINCT and ORDER BY. """
+
+    def __init__(self, table, fields=None, where=(), group_by=(), aggregates=None, distinct=False, order_by=()):
+        """
+        Describe the query
+
+        :param table: The feature class or table name
+        :param fields: Selected fields when there are no aggregates
+        :param where: AND-ed conditions; each one a (field, operator, value) tuple or a list of OR-ed tuples
+        :param group_by: Group-by fields
+        :param aggregates: List of (field, function) with function in MIN, MAX, SUM
+        :param distinct: Drop duplicate rows
+        :param order_by: Sort fields, ascending
+        """
+        self.table = table
+        self.fields = tuple(fields or ())
+        self.where = tuple(tuple(c) if isinstance(c, list) else (c,) for c in where)
+        self.group_by = tuple(group_by)
+        self.aggregates = tuple((f, fn.upper()) for f, fn in (aggregates or ()))
+        self.distinct = distinct
+        self.order_by = tuple(order_by)
+        for _, fn in self.aggregates:
+            if fn not in AGGREGATES:
+                raise ValueError("Unsupported aggregate: " + fn)
+        for clause in self.where:
+            for _, op, _ in clause:
+                if op.upper() not in OPERATORS:
+                    raise ValueError("Unsupported operator: " + op)
+
+    def key(self):
+        """
+        Hashable identity of the query, for caching
+        """
+        where = tuple(tuple((f, op, tuple(v) if isinstance(v, (list, tuple)) else v) for f, op, v in c)
+                      for c in self.where)
+        return self.table, self.fields, where, self.group_by, self.aggregates, self.distinct, self.order_by
+
+    def output_fields(self):
+        """
+        Fields of the result, group-by fields first
+        """
+        if self.aggregates:
+            return list(self.group_by) + [f for f, _ in self.aggregates]
+        return list(self.fields)
+
+    def where_clause(self, delimit=lambda name: name):
+        """
+        SQL where clause of the filters
+
+        :param delimit: Field name delimiter, e.g. arcpy.AddFieldDelimiters bound to the workspace
+        :return: The clause, None without filters
+        """
+        ands = []
+        for clause in self.where:
+            ors = []
+            for field, op, value in clause:
+                op = op.upper()
+                if op in ("IS NULL", "IS NOT NULL"):
+                    ors.append("{} {}".format(delimit(field), op))
+                elif op == "IN":
+                    ors.append("{} IN ({})".format(delimit(field), ", ".join(_literal(v) for v in value)))
+                else:
+                    ors.append("{} {} {}".format(delimit(field), op, _literal(value)))
+            ands.append(ors[0] if len(ors) == 1 else "(" + " OR ".join(ors) + ")")
+        return " AND ".join(ands) or None
+
+    def sql_clause(self):
+        """
+        SearchCursor sql_clause of the query, without aggregates
+
+        :return: (prefix, postfix)
+        """
+        prefix = "DISTINCT" if self.distinct else None
+        postfix = []
+        if self.group_by:
+            postfix.append("GROUP BY " + ", ".join(self.group_by))
+        if self.order_by:
+            postfix.append("ORDER BY " + ", ".join(self.order_by))
+        return prefix, " ".join(postfix) or None
+
+    def run_in_memory(self, df):
+        """
+        Run the query with pandas
+
+        :param df: The table's DataFrame
+        :return: A DataFrame
+        """
+        mask = np.ones(len(df), dtype=bool)
+        for clause in self.where:
+            any_mask = np.zeros(len(df), dtype=bool)
+            for field, op, value in clause:
+                any_mask |= _compare(df[field], op.upper(), value)
+            mask &= any_mask
+        result = df[mask]
+        if self.aggregates:
+            funcs = {"MIN": "min", "MAX": "max", "SUM": "sum"}
+            agg = {f: funcs[fn] for f, fn in self.aggregates}
+            if self.group_by:
+                result = result.groupby(list(self.group_by))[list(agg)].agg(agg).reset_index()
+            else:
+                result = result[list(agg)].agg(agg).to_frame().T
+        else:
+            result = result[list(self.fields)]
+        if self.distinct:
+            result = result.drop_duplicates()
+        if self.order_by:
+            result = result.sort_values(list(self.order_by))
+        return result.reset_index(drop=True)[self.output_fields()]
+
+    def run_pushdown(self, workspace):
+        """
+        Run the query inside the geodatabase
+
+        :param workspace: The gdb path
+        :return: A DataFrame
+        """
+        import arcpy
+
+        path = os.path.join(str(workspace), self.table)
+        where = self.where_clause(lambda name: arcpy.AddFieldDelimiters(path, name))
+        if not self.aggregates:
+            with arcpy.da.SearchCursor(path, list(self.fields), where_clause=where,
+                                       sql_clause=self.sql_clause()) as cursor:
+                return pd.DataFrame.from_records(list(cursor), columns=list(self.fields))
+
+        # Cursors can't compute aggregates: the Statistics tool groups inside the engine
+        view = arcpy.management.MakeTableView(path, "pivot_query_view", where).getOutput(0)
+        out = "memory\\pivot_query"
+        try:
+            arcpy.analysis.Statistics(view, out, [[f, fn] for f, fn in self.aggregates],
+                                      list(self.group_by) or None)
+            names = list(self.group_by) + ["{}_{}".format(fn, f) for f, fn in self.aggregates]
+            with arcpy.da.SearchCursor(out, names) as cursor:
+                result = pd.DataFrame.from_records(list(cursor), columns=self.output_fields())
+        finally:
+            arcpy.management.Delete(view)
+            arcpy.management.Delete(out)
+        if self.order_by:
+            result = result.sort_values(list(self.order_by)).reset_index(drop=True)
+        return result
+
+
+class QueryExecutor(object):
+    """ Runs pivot queries in the geodatabase or in memory, whichever is estimated cheaper. """
+
+    workspace = None  #: The gdb path
+    catalog = None  #: Workspace catalog, for row counts
+    capabilities = None  #: Set of the SQL features the workspace runs
+    log = None  #: Last (table, path, estimated seconds, measured seconds) runs
+
+    def __init__(self, workspace, catalog, capabilities=None):
+        """
+        Probe the workspace
+
+        :param workspace: The gdb path
+        :param catalog: The workspace catalog
+        :param capabilities: The SQL features the workspace runs, probed if None
+        """
+        self.workspace = workspace
+        self.catalog = catalog
+        self.log = collections.deque(maxlen=100)
+        if capabilities is not None:
+            self.capabilities = set(capabilities)
+            return
+
+        import arcpy
+
+        workspace_type = arcpy.Describe(str(workspace)).workspaceType
+        if workspace_type in ("LocalDatabase", "RemoteDatabase"):
+            self.capabilities = {"WHERE", "DISTINCT", "ORDER BY", "GROUP BY", "STATISTICS"}
+        else:
+            # Shapefiles and dBASE tables honour where clauses only
+            self.capabilities = {"WHERE", "STATISTICS"}
+
+    def supports(self, query):
+        """
+        Check if the workspace can run a query
+
+        :param query: A PivotQuery
+        """
+        needs = set()
+        if query.where:
+            needs.add("WHERE")
+        if query.distinct:
+            needs.add("DISTINCT")
+        if query.order_by and not query.aggregates:
+            needs.add("ORDER BY")
+        if query.group_by and not query.aggregates:
+            needs.add("GROUP BY")
+        if query.aggregates:
+            needs.add("STATISTICS")
+        return needs <= self.capabilities
+
+    @staticmethod
+    def groups(query, rows, df=None, profile=None):
+        """
+        Estimated row count of a grouped query, from the cardinalities of its group-by fields
+
+        :param query: A PivotQuery
+        :param rows: Rows of the table
+        :param df: The resident DataFrame, None if the table is not loaded
+        :param profile: The table's view_selection.TableProfile, None if unknown
+        :return: The estimated number of groups
+        """
+        if not query.group_by:
+            return 1
+        if profile is not None and all(f in profile.cardinality for f in query.group_by):
+            return int(profile.view_rows(query.group_by))
+        if df is not None and all(f in df.columns for f in query.group_by):
+            domain = 1
+            for field in query.group_by:
+                domain *= max(1, int(df[field].nunique()))
+            return int(distinct_estimate(domain, rows))
+        # Nothing known of the fields, guess a tenth of the rows
+        return max(1, rows // 10)
+
+    def estimate(self, query, df=None, profile=None):
+        """
+        Estimated seconds of each path
+
+        :param query: A PivotQuery
+        :param df: The resident DataFrame, None if the table is not loaded
+        :param profile: The table's view_selection.TableProfile, None if unknown
+        :return: (pushdown seconds or None, in-memory seconds)
+        """
+        entry = self.catalog.entries.get(query.table)
+        rows = entry.rows if entry else (len(df) if df is not None else 0)
+        in_memory = rows * SCAN_ROW_COST * max(1, len(query.where))
+        if query.aggregates and query.group_by:
+            in_memory += rows * GROUP_ROW_COST * len(query.group_by)
+        if df is None:
+            in_memory += CURSOR_OVERHEAD + rows * FETCH_ROW_COST
+        if not self.supports(query):
+            return None, in_memory
+        if query.aggregates:
+            groups = self.groups(query, rows, df, profile)
+            pushdown = TOOL_OVERHEAD + CURSOR_OVERHEAD + rows * GDB_SCAN_ROW_COST + groups * FETCH_ROW_COST
+        else:
+            pushdown = CURSOR_OVERHEAD + rows * FETCH_ROW_COST
+        return pushdown, in_memory
+
+    def path(self, query, df=None, profile=None):
+        """
+        The path a query runs on
+
+        :param query: A PivotQuery
+        :param df: The resident DataFrame, None if the table is not loaded
+        :param profile: The table's view_selection.TableProfile, None if unknown
+        :return: ('pushdown' or 'memory', its estimated seconds)
+        """
+        pushdown, in_memory = self.estimate(query, df, profile)
+        if pushdown is not None and (df is None or pushdown < in_memory):
+            return "pushdown", pushdown
+        return "memory", in_memory
+
+    def execute(self, query, df=None, profile=None):
+        """
+        Run a query on the cheaper path, falling back to memory when the workspace can't run it
+
+        :param query: A PivotQuery
+        :param df: The resident DataFrame, None if the table is not loaded
+        :param profile: The table's view_selection.TableProfile, None if unknown
+        :return: A DataFrame
+        """
+        path, estimate = self.path(query, df, profile)
+        start = time.perf_counter()
+        if path == "pushdown":
+            try:
+                result = query.run_pushdown(self.workspace)
+                self.log.append((query.table, "pushdown", estimate, time.perf_counter() - start))
+                return result
+            except Exception:
+                if df is None:
+                    raise
+                start = time.perf_counter()
+                estimate = self.estimate(query, df, profile)[1]
+        if df is None:
+            entry = self.catalog.entries.get(query.table)
+            path = os.path.join(str(self.workspace), query.table)
+            if entry is not None and entry.spatial:
+                df = pd.DataFrame.spatial.from_featureclass(path)
+            else:
+                df = pd.DataFrame.spatial.from_table(path)
+        result = query.run_in_memory(df)
+        self.log.append((query.table, "memory", estimate, time.perf_counter() - start))
+        return result
+
+
+def _literal(value):
+    """
+    SQL literal of a value
+
+    :param value: A number or a string
+    """
+    if isinstance(value, str):
+        return "'" + value.replace("'", "''") + "'"
+    return repr(value)
+
+
+def _compare(series, op, value):
+    """
+    Boolean mask of a filter on a Series
+
+    :param series: The field's values
+    :param op: The operator
+    :param value: The compared value
+    """
+    if op == "IS NULL":
+        return series.isna().values
+    if op == "IS NOT NULL":
+        return series.notna().values
+    if op == "IN":
+        return series.isin(value).values
+    ops = {"=": series.eq, "<>": series.ne, "<": series.lt, "<=": series.le, ">": series.gt, ">=": series.ge}
+    return ops[op](value).values
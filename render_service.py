@@ -0,0 +1,138 @@
+"""
+    Tool : Pivot, Source Name : render_service.py, Author: M'hamed Bendenia.
+"""
+
+import concurrent.futures
+import io
+import multiprocessing
+import os
+import sys
+import threading
+
+from shared_arrays import attach, detach, release, share
+from shared_warehouse import attach_table, detach_table
+
+
+def query_arrays(spec, columns, query):
+    """
+    Plotting arrays of a chart computed from a table: the query's first group-by field and the spec series
+
+    :param spec: The charts.chart_spec
+    :param columns: Column name -> array of the table
+    :param query: A query.PivotQuery grouping the table
+    :return: Name -> array
+    """
+    import pandas as pd
+
+    result = query.run_in_memory(pd.DataFrame(columns, copy=False))
+    arrays = {"x": result[query.group_by[0]].values}
+    arrays.update((name, result[name].values) for name in spec["series"])
+    return arrays
+
+
+def render(spec, descriptor, query=None):
+    """
+    Worker entry point: draw a chart off-screen
+
+    :param spec: The charts.chart_spec
+    :param descriptor: The shared_arrays.share() descriptor of its arrays, or with a query the
+                       shared_warehouse descriptor of the table the query runs on
+    :param query: A query.PivotQuery computing the arrays from the shared table, None for shared arrays
+    :return: PNG or SVG bytes
+    """
+    from matplotlib.backends.backend_agg import FigureCanvasAgg
+    from matplotlib.figure import Figure
+
+    from charts import draw, figure_size
+
+    if query is None:
+        arrays, block = attach(descriptor)
+    else:
+        # Attached to the warehouse copy, nothing of the table is pickled; the query result owns its arrays
+        columns, table = attach_table(descriptor)
+        try:
+            arrays = query_arrays(spec, columns, query)
+        finally:
+            del columns
+            detach_table(descriptor, table)
+        block = None
+    try:
+        figure = Figure(figsize=figure_size(spec, arrays), dpi=spec["dpi"])
+        canvas = FigureCanvasAgg(figure)
+        draw(figure, spec, arrays)
+        out = io.BytesIO()
+        canvas.print_figure(out, format=spec["format"], dpi=spec["dpi"])
+        return out.getvalue()
+    finally:
+        del arrays
+        if block is not None:
+            detach(descriptor, block)
+
+
+class ChartRenderer(object):
+    """ Pool of chart rendering processes: the caller never imports matplotlib, several charts render at once. """
+
+    workers = None  #: Rendering processes
+    pool = None  #: The process pool, started on first submit
+
+    def __init__(self, workers=2):
+        """
+        Create the renderer
+
+        :param workers: Rendering processes
+        """
+        self.workers = workers
+        self._lock = threading.Lock()
+
+    def start(self):
+        """
+        Start the pool, with a python interpreter when embedded in ArcGIS Pro
+        """
+        with self._lock:
+            if self.pool is not None:
+                return self.pool
+            if not os.path.basename(sys.executable).lower().startswith("python"):
+                # Inside ArcGISPro.exe, workers must not start another ArcGIS Pro
+                multiprocessing.set_executable(os.path.join(sys.exec_prefix, "pythonw.exe"))
+            kwargs = {"mp_context": multiprocessing.get_context("spawn")} if sys.version_info >= (3, 7) else {}
+            self.pool = concurrent.futures.ProcessPoolExecutor(self.workers, **kwargs)
+            return self.pool
+
+    def submit(self, spec, arrays):
+        """
+        Render a chart in a worker
+
+        :param spec: The charts.chart_spec
+        :param arrays: Name -> array, copied once into shared memory
+        :return: Future of the image bytes
+        """
+        descriptor, block = share(arrays)
+        try:
+            future = self.start().submit(render, spec, descriptor)
+        except Exception:
+            release(descriptor, block)
+            raise
+        future.add_done_callback(lambda f: release(descriptor, block))
+        return future
+
+    def submit_query(self, spec, descriptor, query):
+        """
+        Render a chart in a worker from a query on a shared DW table, the worker attaches to the table
+
+        :param spec: The charts.chart_spec, a None figsize sizes bar charts to their groups
+        :param descriptor: The SnapshotStore.descriptor of the table, its snapshot pinned until the future is done
+        :param query: The query.PivotQuery computing the arrays
+        :return: Future of the image bytes
+        """
+        return self.start().submit(render, spec, descriptor, query)
+
+    def shutdown(self, wait=False):
+        """
+        Stop the workers
+
+        :param wait: Wait for the running charts
+        """
+        with self._lock:
+            if self.pool is not None:
+                self.pool.shutdown(wait=wait)
+                self.pool = None
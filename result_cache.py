@@ -0,0 +1,186 @@
+"""
+    Tool : Pivot, Source Name : result_cache.py, Author: M'hamed Bendenia.
+"""
+
+import collections
+import sys
+import threading
+
+import numpy as np
+
+from lazy import lazy_import
+
+pd = lazy_import("pandas")
+
+
+def sizeof(value):
+    """
+    Memory size of a cached result
+
+    :param value: A DataFrame, Series, NumPy array, container of them, or any object with an nbytes() method
+    :return: Size in bytes
+    """
+    if isinstance(value, pd.DataFrame):
+        return int(value.memory_usage(deep=True, index=True).sum())
+    if isinstance(value, pd.Series):
+        return int(value.memory_usage(deep=True, index=True))
+    if isinstance(value, np.ndarray):
+        return int(value.nbytes)
+    if isinstance(value, (tuple, list)):
+        return sys.getsizeof(value) + sum(sizeof(v) for v in value)
+    if isinstance(value, dict):
+        return sys.getsizeof(value) + sum(sizeof(v) for v in value.values())
+    if callable(getattr(value, "nbytes", None)):
+        return int(value.nbytes())
+    return sys.getsizeof(value)
+
+
+class ResultCache(object):
+    """ Byte-bounded LRU cache of pivot query results, keyed on (table, version, operation, parameters). """
+
+    max_bytes = None  #: Memory ceiling
+    resident_bytes = 0  #: Memory held by the cached results
+    hits = misses = evictions = 0  #: Counters
+
+    def __init__(self, max_bytes):
+        """
+        Create an empty cache
+
+        :param max_bytes: Memory ceiling in bytes
+        """
+        self.max_bytes = max_bytes
+        self._entries = collections.OrderedDict()
+        self._versions = {}
+        self._tokens = {}
+        self._lock = threading.RLock()
+
+    def version(self, table):
+        """
+        Current data version of a table
+
+        :param table: The table name
+        """
+        return self._versions.get(table, 0)
+
+    def token(self, table):
+        """
+        Change token a table was last loaded with
+
+        :param table: The table name
+        :return: The token, None for an unknown table
+        """
+        return self._tokens.get(table)
+
+    def set_version(self, table, token):
+        """
+        Record a table's change token, invalidating its results when the token changed
+
+        :param table: The table name
+        :param token: Any comparable change token
+        :return: True if the table changed
+        """
+        with self._lock:
+            if table in self._tokens and self._tokens[table] == token:
+                return False
+            changed = table in self._tokens
+            self._tokens[table] = token
+            if changed:
+                self.invalidate(table)
+            return changed
+
+    def invalidate(self, table):
+        """
+        Move a table to a new version and drop its results
+
+        :param table: The table name
+        """
+        with self._lock:
+            self._versions[table] = self.version(table) + 1
+            for key in [k for k in self._entries if k[0] == table]:
+                self._drop(key)
+
+    def discard(self, table, version):
+        """
+        Drop the results of one version of a table
+
+        :param table: The table name
+        :param version: The retired version
+        """
+        with self._lock:
+            for key in [k for k in self._entries if k[0] == table and k[1] == version]:
+                self._drop(key)
+
+    def get(self, table, operation, params, version=None):
+        """
+        Look a result up
+
+        :param table: The table name
+        :param operation: The operation name
+        :param params: Hashable operation parameters
+        :param version: Data version the result is computed from, the table's current version by default
+        :return: The result, None on a miss
+        """
+        key = (table, self.version(table) if version is None else version, operation, params)
+        with self._lock:
+            if key in self._entries:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return self._entries[key][0]
+            self.misses += 1
+            return None
+
+    def put(self, table, operation, params, value, version=None):
+        """
+        Store a result, evicting the least recently used ones past the ceiling
+
+        :param table: The table name
+        :param operation: The operation name
+        :param params: Hashable operation parameters
+        :param value: The result
+        :param version: Data version the result is computed from, the table's current version by default
+        """
+        key = (table, self.version(table) if version is None else version, operation, params)
+        size = sizeof(value)
+        with self._lock:
+            if key in self._entries:
+                self._drop(key)
+            if size > self.max_bytes:
+                return value
+            self._entries[key] = (value, size)
+            self.resident_bytes += size
+            while self.resident_bytes > self.max_bytes:
+                self._drop(next(iter(self._entries)))
+                self.evictions += 1
+        return value
+
+    def lookup(self, table, operation, params, compute, version=None):
+        """
+        Get a result, computing and storing it on a miss
+
+        :param table: The table name
+        :param operation: The operation name
+        :param params: Hashable operation parameters
+        :param compute: Callable producing the result
+        :param version: Data version the result is computed from, the table's current version by default
+        """
+        value = self.get(table, operation, params, version)
+        if value is None:
+            value = self.put(table, operation, params, compute(), version)
+        return value
+
+    def stats(self):
+        """
+        Hit, miss and eviction counters
+        """
+        lookups = self.hits + self.misses
+        return {"hits": self.hits, "misses": self.misses, "evictions": self.evictions,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+                "entries": len(self._entries), "resident_bytes": self.resident_bytes}
+
+    def _drop(self, key):
+        """
+        Remove one entry
+
+        :param key: The entry key
+        """
+        self.resident_bytes -= self._entries.pop(key)[1]
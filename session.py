@@ -0,0 +1,76 @@
+"""
+    Tool : Pivot, Source Name : session.py, Author: M'hamed Bendenia.
+"""
+
+import os
+
+REFERENCE_SCALE = 59467124.861567564  #: Map reference scale, a world view
+
+
+class PivotSession(object):
+    """ The ArcGIS Pro state a Pivot works on: project, map and workspace, opened by the entry point. """
+
+    aprx = None  #: Current project
+    active_map = None  #: Current map
+    workspace = None  #: Gdb path
+    workfolder = None  #: Gdb folder path
+
+    def __init__(self, aprx, active_map, workspace, workfolder=None):
+        """
+        Wrap an opened project
+
+        :param aprx: The ArcGISProject
+        :param active_map: The map to pivot
+        :param workspace: The gdb path
+        :param workfolder: The gdb folder path, the gdb parent by default
+        """
+        self.aprx = aprx
+        self.active_map = active_map
+        self.workspace = workspace
+        self.workfolder = workfolder or os.path.dirname(str(workspace))
+
+    @classmethod
+    def from_parameters(cls):
+        """
+        Open the current project with the script tool parameters: the gdb (0) and the map (1), both optional
+        """
+        import arcpy
+
+        aprx = arcpy.mp.ArcGISProject("CURRENT")
+
+        # Define default GDB if parameter is Null
+        if len(arcpy.GetParameterAsText(0)) == 0:
+            workspace = arcpy.env.workspace
+        else:
+            workspace = arcpy.GetParameter(0)
+            arcpy.env.workspace = workspace
+
+        # Define current map if parameter is Null
+        if len(arcpy.GetParameterAsText(1)) == 0:
+            active_map = aprx.listMaps()[0]
+        else:
+            active_map = aprx.listMaps(arcpy.GetParameter(1))[0]
+        return cls(aprx, active_map, workspace, os.path.dirname(arcpy.env.workspace))
+
+    @property
+    def scratch_folder(self):
+        """
+        Scratch folder of the session
+        """
+        import arcpy
+
+        return arcpy.env.scratchFolder
+
+    def setup_map(self, reference_scale=REFERENCE_SCALE):
+        """
+        Prepare the map for pivoting
+
+        :param reference_scale: Map reference scale
+        """
+        self.active_map.referenceScale = reference_scale
+
+    def layers(self):
+        """
+        The map layers by lower case name
+        """
+        return {lyr.name.lower(): lyr for lyr in self.active_map.listLayers()}
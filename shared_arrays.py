@@ -0,0 +1,102 @@
+"""
+    Tool : Pivot, Source Name : shared_arrays.py, Author: M'hamed Bendenia.
+"""
+
+import os
+import tempfile
+import uuid
+
+import numpy as np
+
+try:
+    from multiprocessing import shared_memory
+except ImportError:  # Python < 3.8, arrays go through a memory-mapped temp file
+    shared_memory = None
+
+ALIGN = 64  #: Byte alignment of each array in a shared block
+
+
+def _layout(arrays):
+    """
+    Place arrays one after the other in a block
+
+    :param arrays: Name -> array
+    :return: (fields [(name, dtype str, shape, offset)], total bytes)
+    """
+    fields, offset = [], 0
+    for name, array in arrays.items():
+        fields.append((name, array.dtype.str, array.shape, offset))
+        offset += -(-array.nbytes // ALIGN) * ALIGN
+    return fields, max(offset, 1)
+
+
+def share(arrays):
+    """
+    Copy arrays into one shared block
+
+    :param arrays: Name -> array, object arrays are stored as fixed width strings
+    :return: (descriptor, handle), the descriptor is what a worker attaches to, the handle is released by the owner
+    """
+    arrays = {name: np.ascontiguousarray(a.astype(str) if a.dtype == object else a) for name, a in arrays.items()}
+    fields, size = _layout(arrays)
+    if shared_memory is not None:
+        block = shared_memory.SharedMemory(create=True, size=size)
+        descriptor = {"kind": "shm", "name": block.name, "fields": fields}
+        buffer = block.buf
+    else:
+        path = os.path.join(tempfile.gettempdir(), "pivot_chart_{}.bin".format(uuid.uuid4().hex))
+        buffer = np.memmap(path, dtype="u1", mode="w+", shape=(size,))
+        descriptor = {"kind": "file", "name": path, "fields": fields}
+    for name, dtype, shape, offset in fields:
+        np.ndarray(shape, dtype=dtype, buffer=buffer, offset=offset)[...] = arrays[name]
+    if shared_memory is None:
+        # Unmapped at once, Windows cannot delete a mapped file
+        buffer.flush()
+        del buffer
+        block = None
+    return descriptor, block
+
+
+def attach(descriptor):
+    """
+    Views of the arrays of a shared block, without copying
+
+    :param descriptor: The share() descriptor
+    :return: (name -> array, the block, to close once the arrays are no longer used)
+    """
+    if descriptor["kind"] == "shm":
+        block = shared_memory.SharedMemory(name=descriptor["name"])
+        buffer = block.buf
+    else:
+        block = buffer = np.memmap(descriptor["name"], dtype="u1", mode="r")
+    arrays = {name: np.ndarray(tuple(shape), dtype=dtype, buffer=buffer, offset=offset)
+              for name, dtype, shape, offset in descriptor["fields"]}
+    return arrays, block
+
+
+def release(descriptor, block):
+    """
+    Free a shared block, owner side
+
+    :param descriptor: The share() descriptor
+    :param block: The share() handle, None for a file
+    """
+    if descriptor["kind"] == "shm":
+        block.close()
+        block.unlink()
+    else:
+        try:
+            os.remove(descriptor["name"])
+        except OSError:
+            pass
+
+
+def detach(descriptor, block):
+    """
+    Close a block attached to, worker side, once its arrays are no longer used
+
+    :param descriptor: The share() descriptor
+    :param block: The attach() block
+    """
+    if descriptor["kind"] == "shm":
+        block.close()
@@ -0,0 +1,115 @@
+"""
+    Tool : Pivot, Source Name : shared_warehouse.py, Author: M'hamed Bendenia.
+"""
+
+import collections
+import threading
+
+import numpy as np
+
+from eviction import GEOMETRY_COLUMNS
+from shared_arrays import attach, detach, release, share
+
+
+class SharedWarehouse(object):
+    """ DW table versions copied to shared memory, for worker processes to attach to instead of unpickling. """
+
+    segments = None  #: (table name, version) -> (descriptor, handle)
+    offers = None  #: (table name, version) -> callable returning the DataFrame, for the published versions
+
+    def __init__(self):
+        """
+        Create an empty registry
+        """
+        self.segments = {}
+        self.offers = {}
+        self._lock = threading.Lock()
+
+    def offer(self, name, version, load):
+        """
+        Register a published table version, copied to shared memory when a worker first asks for it
+
+        :param name: The table name
+        :param version: The table version
+        :param load: Callable returning the DataFrame
+        """
+        with self._lock:
+            self.offers[(name, version)] = load
+
+    def lookup(self, name, version, load=None):
+        """
+        Descriptor of a table version, its columns copied to shared memory on first use
+
+        :param name: The table name
+        :param version: The table version
+        :param load: Callable returning the DataFrame, the offered one by default
+        :return: The descriptor, picklable and small
+        """
+        with self._lock:
+            if (name, version) in self.segments:
+                return self.segments[(name, version)][0]
+            df = (load or self.offers[(name, version)])()
+            columns = collections.OrderedDict()
+            for column in df.columns:
+                # Geometries stay in this process, text columns are shared as fixed width strings
+                if column not in GEOMETRY_COLUMNS:
+                    columns[column] = df[column].to_numpy()
+            descriptor, block = share(columns)
+            descriptor.update(table=name, version=version, rows=len(df))
+            self.segments[(name, version)] = (descriptor, block)
+            return descriptor
+
+    def release(self, name, version):
+        """
+        Free the segment of a retired table version
+
+        :param name: The table name
+        :param version: The table version
+        """
+        with self._lock:
+            self.offers.pop((name, version), None)
+            segment = self.segments.pop((name, version), None)
+        if segment is not None:
+            release(*segment)
+
+    def close(self):
+        """
+        Free every segment
+        """
+        for name, version in list(self.segments):
+            self.release(name, version)
+
+    def nbytes(self):
+        """
+        Shared memory held by the segments
+        """
+        total = 0
+        for descriptor, _ in self.segments.values():
+            for _, dtype, shape, _ in descriptor["fields"]:
+                total += np.dtype(dtype).itemsize * int(np.prod(shape))
+        return total
+
+
+def attach_table(descriptor):
+    """
+    Columns of a shared table version, worker side, without copying
+
+    :param descriptor: A SharedWarehouse.lookup descriptor
+    :return: (column name -> read-only array, the block, to detach once the arrays are no longer used)
+    """
+    arrays, block = attach(descriptor)
+    columns = collections.OrderedDict()
+    for name, _, _, _ in descriptor["fields"]:
+        columns[name] = arrays[name]
+        columns[name].flags.writeable = False
+    return columns, block
+
+
+def detach_table(descriptor, block):
+    """
+    Close a shared table version, worker side
+
+    :param descriptor: A SharedWarehouse.lookup descriptor
+    :param block: The attach_table block
+    """
+    detach(descriptor, block)
@@ -0,0 +1,207 @@
+"""
+    Tool : Pivot, Source Name : snapshots.py, Author: M'hamed Bendenia.
+"""
+
+import threading
+
+try:
+    from collections.abc import Mapping
+except ImportError:
+    from collections import Mapping
+
+
+class LazyTable(object):
+    """ Snapshot value standing for a DataFrame that may not be resident. """
+
+    def load(self):
+        """
+        The DataFrame, loaded if needed
+        """
+        raise NotImplementedError
+
+
+class Snapshot(Mapping):
+    """ Immutable version of the data warehouse: table name -> DataFrame, with per-table versions. """
+
+    def __init__(self, number, tables, versions):
+        """
+        Create the snapshot
+
+        :param number: Snapshot number
+        :param tables: Table name -> DataFrame
+        :param versions: Table name -> table version
+        """
+        self.number = number
+        self._tables = dict(tables)
+        self._versions = dict(versions)
+        self._refs = 0
+
+    def __getitem__(self, name):
+        value = self._tables[name]
+        return value.load() if isinstance(value, LazyTable) else value
+
+    def __contains__(self, name):
+        return name in self._tables
+
+    def __iter__(self):
+        return iter(self._tables)
+
+    def __len__(self):
+        return len(self._tables)
+
+    def raw(self, name):
+        """
+        A table as stored, without loading lazy tables
+
+        :param name: The table name
+        """
+        return self._tables.get(name)
+
+    def version_of(self, name):
+        """
+        Version of a table in this snapshot
+
+        :param name: The table name
+        """
+        return self._versions.get(name, 0)
+
+
+class SnapshotStore(object):
+    """ Double-buffered warehouse: readers pin a snapshot, writers publish a new one with an atomic swap. """
+
+    current = None  #: Latest published snapshot
+    on_retire = None  #: Callables(snapshot, name, version) called for each table version a retired snapshot frees
+    shared = None  #: SharedWarehouse the published table versions are offered to, None to keep them private
+
+    def __init__(self, shared=None):
+        """
+        Start with an empty snapshot
+
+        :param shared: A shared_warehouse.SharedWarehouse, for worker processes to attach to the tables
+        """
+        self.shared = shared
+        self._lock = threading.Lock()
+        self._writer = threading.Lock()
+        self._table_refs = {}
+        self.current = Snapshot(0, {}, {})
+        self.current._refs = 1
+        self.on_retire = []
+
+    def acquire(self, snapshot=None):
+        """
+        Pin the current snapshot, or pin again a snapshot already pinned
+
+        :param snapshot: The pinned snapshot, None for the current one
+        :return: A context manager giving the snapshot, released on exit
+        """
+        with self._lock:
+            snapshot = self.current if snapshot is None else snapshot
+            snapshot._refs += 1
+        return _Pin(self, snapshot)
+
+    def release(self, snapshot):
+        """
+        Unpin a snapshot, retiring it when nobody reads it any more
+
+        :param snapshot: The snapshot
+        """
+        with self._lock:
+            snapshot._refs -= 1
+            retired = snapshot._refs == 0
+        if retired:
+            self._retire(snapshot)
+
+    def publish(self, updates=None, removed=()):
+        """
+        Publish a new snapshot made of the current one plus updated tables
+
+        :param updates: Table name -> new DataFrame or LazyTable
+        :param removed: Names of the tables to drop
+        :return: The new snapshot
+        """
+        updates = updates or {}
+        with self._writer:
+            old = self.current
+            tables = {n: df for n, df in old._tables.items() if n not in removed}
+            versions = {n: v for n, v in old._versions.items() if n not in removed}
+            for name, df in updates.items():
+                tables[name] = df
+                versions[name] = old.version_of(name) + 1
+            snapshot = Snapshot(old.number + 1, tables, versions)
+            snapshot._refs = 1
+            with self._lock:
+                for key in versions.items():
+                    self._table_refs[key] = self._table_refs.get(key, 0) + 1
+                self.current = snapshot
+            if self.shared is not None:
+                for name, df in updates.items():
+                    self.shared.offer(name, versions[name],
+                                      df.load if isinstance(df, LazyTable) else (lambda df=df: df))
+        self.release(old)
+        return snapshot
+
+    def descriptor(self, snapshot, name):
+        """
+        Shared memory descriptor of a table of a snapshot, for worker processes: the columns are copied once per
+        table version and freed when the version retires, so keep the snapshot pinned until the workers are done
+
+        :param snapshot: A pinned snapshot
+        :param name: The table name
+        :return: The descriptor, worker processes open it with shared_warehouse.attach_table
+        """
+        return self.shared.lookup(name, snapshot.version_of(name), lambda: snapshot[name])
+
+    def refresh_async(self, build, callback=None):
+        """
+        Build updated tables on a worker thread and publish them
+
+        :param build: Callable(snapshot) returning (updates, removed) from the snapshot it read
+        :param callback: Called with the new snapshot once published, None when nothing changed
+        :return: The worker thread
+        """
+        def run():
+            with self.acquire() as snapshot:
+                updates, removed = build(snapshot)
+            published = self.publish(updates, removed) if updates or removed else None
+            if callback is not None:
+                callback(published)
+
+        thread = threading.Thread(target=run, name="SnapshotRefresh", daemon=True)
+        thread.start()
+        return thread
+
+    def _retire(self, snapshot):
+        """
+        Drop a snapshot's references so its old tables can be freed
+
+        :param snapshot: The unreferenced snapshot
+        """
+        freed = []
+        with self._lock:
+            # A table version lives as long as one snapshot holds it
+            for key in snapshot._versions.items():
+                self._table_refs[key] -= 1
+                if not self._table_refs[key]:
+                    del self._table_refs[key]
+                    freed.append(key)
+        for name, version in freed:
+            if self.shared is not None:
+                self.shared.release(name, version)
+            for callback in self.on_retire:
+                callback(snapshot, name, version)
+        snapshot._tables.clear()
+
+
+class _Pin(object):
+    """ Context manager of a pinned snapshot. """
+
+    def __init__(self, store, snapshot):
+        self.store = store
+        self.snapshot = snapshot
+
+    def __enter__(self):
+        return self.snapshot
+
+    def __exit__(self, *exc):
+        self.store.release(self.snapshot)
+        return False
@@ -0,0 +1,9 @@
+"""
+    Tool : Pivot, Source Name : conftest.py, Author: M'hamed Bendenia.
+"""
+
+import os
+import sys
+
+# The modules live at the repository root, next to Pivot.py
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
@@ -0,0 +1,69 @@
+"""
+    Tool : Pivot, Source Name : test_query.py, Author: M'hamed Bendenia.
+"""
+
+import numpy as np
+import pandas as pd
+
+from query import PivotQuery, QueryExecutor
+from view_selection import TableProfile
+
+
+class Entry(object):
+    """ Catalog entry stand-in: only the row count is read. """
+
+    def __init__(self, rows):
+        self.rows = rows
+
+
+class Catalog(object):
+    """ Catalog stand-in. """
+
+    def __init__(self, **rows):
+        self.entries = {name: Entry(count) for name, count in rows.items()}
+
+
+def covid_cases(rows, countries=200):
+    """
+    A Country_Re x Date table
+    """
+    rng = np.random.default_rng(0)
+    return pd.DataFrame({"Country_Re": rng.integers(0, countries, rows).astype(str),
+                         "Date": pd.Timestamp("2020-01-22") + pd.to_timedelta(rng.integers(0, 170, rows), "D"),
+                         "Confirmed": rng.random(rows), "Deaths": rng.random(rows), "Recovred": rng.random(rows)})
+
+
+def bar_query():
+    return PivotQuery("covid_cases", group_by=("Country_Re",), order_by=("Country_Re",),
+                      aggregates=[(m, "MAX") for m in ("Confirmed", "Deaths", "Recovred")],
+                      where=[[(m, "<>", 0) for m in ("Confirmed", "Deaths", "Recovred")]])
+
+
+def test_small_table_runs_in_memory():
+    df = covid_cases(1000)
+    executor = QueryExecutor("covid.gdb", Catalog(covid_cases=len(df)), capabilities={"WHERE", "STATISTICS"})
+    path, _ = executor.path(bar_query(), df, TableProfile(df))
+    assert path == "memory"
+
+
+def test_large_table_groups_in_the_gdb():
+    df = covid_cases(10000)
+    profile = TableProfile(df)
+    # Same countries, a thousand times the rows
+    profile.rows = 10 ** 7
+    executor = QueryExecutor("covid.gdb", Catalog(covid_cases=profile.rows), capabilities={"WHERE", "STATISTICS"})
+    assert executor.groups(bar_query(), profile.rows, df, profile) == 200
+    path, _ = executor.path(bar_query(), df, profile)
+    assert path == "pushdown"
+
+
+def test_group_count_from_the_resident_table():
+    df = covid_cases(5000, countries=50)
+    executor = QueryExecutor("covid.gdb", Catalog(covid_cases=len(df)), capabilities={"WHERE", "STATISTICS"})
+    assert executor.groups(bar_query(), len(df), df) == 50
+
+
+def test_unsupported_query_runs_in_memory():
+    df = covid_cases(1000)
+    executor = QueryExecutor("covid.gdb", Catalog(covid_cases=10 ** 8), capabilities={"WHERE"})
+    assert executor.path(bar_query(), df) == ("memory", executor.estimate(bar_query(), df)[1])
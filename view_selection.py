@@ -0,0 +1,320 @@
+"""
+    Tool : Pivot, Source Name : view_selection.py, Author: M'hamed Bendenia.
+"""
+
+import collections
+import itertools
+import json
+import os
+
+from lazy import lazy_import
+
+pd = lazy_import("pandas")
+
+DIMENSIONS = ("Country_Re", "Date", "Week")  #: Cube dimensions a view can be grouped by
+MEASURES = ("Confirmed", "Deaths", "Recovred")  #: Cube measures
+WEEK_FREQ = "W-MON"  #: Week grain, same bins as the plots' pd.Grouper
+
+
+def week_key(dates):
+    """
+    Map dates to the Monday closing their 'W-MON' week
+
+    :param dates: A Series of dates
+    :return: A Series of week labels
+    """
+    return pd.to_datetime(dates).dt.to_period(WEEK_FREQ).dt.end_time.dt.normalize()
+
+
+def distinct_estimate(domain, rows):
+    """
+    Expected number of distinct group keys when drawing rows from a domain (Cardenas' formula)
+
+    :param domain: Number of possible group keys
+    :param rows: Number of rows in the source
+    :return: The estimated number of groups
+    """
+    if domain <= 0 or rows <= 0:
+        return 1
+    return min(rows, domain * (1 - (1 - 1 / domain) ** rows))
+
+
+def answers(view, query):
+    """
+    Check if a view can answer a query by roll-up
+
+    :param view: The view's group-by dimensions
+    :param query: The query's group-by dimensions
+    """
+    view = set(view)
+    if "Date" in view:
+        view.add("Week")
+    return set(query) <= view
+
+
+class UsageStats(object):
+    """ Group-by frequencies recorded from past pivots. """
+
+    path = None  #: JSON file the statistics persist to
+    counts = None  #: Counter of (table, group_by) keys
+    dirty = False  #: Queries recorded since the last save
+
+    def __init__(self, path=None):
+        """
+        Load the recorded statistics
+
+        :param path: JSON file the statistics persist to, None to keep them in memory
+        """
+        self.path = path
+        self.counts = collections.Counter()
+        if path and os.path.exists(path):
+            try:
+                with open(path) as f:
+                    for table, group_by, count in json.load(f):
+                        self.counts[(table, tuple(group_by))] = count
+            except (OSError, ValueError):
+                self.counts.clear()
+
+    def record(self, table, group_by):
+        """
+        Count one query
+
+        :param table: The table name
+        :param group_by: The query's group-by dimensions
+        """
+        self.counts[(table, tuple(group_by))] += 1
+        self.dirty = True
+
+    def frequencies(self, table):
+        """
+        Query frequencies of a table
+
+        :param table: The table name
+        :return: A dict of group_by -> count
+        """
+        return {group_by: count for (name, group_by), count in self.counts.items() if name == table}
+
+    def save(self):
+        """
+        Persist the statistics, if queries were recorded since the last save
+        """
+        if not self.path or not self.dirty:
+            return
+        with open(self.path, "w") as f:
+            json.dump([[table, list(group_by), count] for (table, group_by), count in self.counts.items()], f)
+        self.dirty = False
+
+
+class TableProfile(object):
+    """ Row count, cardinalities and widths used to size a table's views. """
+
+    def __init__(self, df):
+        """
+        Profile a warehouse table
+
+        :param df: The table's DataFrame
+        """
+        self.rows = len(df)
+        self.measures = tuple(m for m in MEASURES if m in df.columns)
+        self.cardinality = {}
+        self.width = {}
+        for dim in ("Country_Re", "Date"):
+            if dim in df.columns:
+                self.cardinality[dim] = int(df[dim].nunique())
+                self.width[dim] = max(8, int(df[dim].memory_usage(deep=True, index=False) / max(self.rows, 1)))
+        if "Date" in self.cardinality:
+            self.cardinality["Week"] = int(week_key(df["Date"].dropna().drop_duplicates()).nunique())
+            self.width["Week"] = 8
+        self.dimensions = tuple(d for d in DIMENSIONS if d in self.cardinality)
+
+    def grow(self, rows, cardinality):
+        """
+        Account for appended rows without profiling the table again
+
+        :param rows: Number of appended rows
+        :param cardinality: Dimension -> distinct values of the grown table
+        """
+        self.rows += rows
+        self.cardinality.update((d, c) for d, c in cardinality.items() if d in self.cardinality)
+
+    def view_rows(self, group_by):
+        """
+        Estimate a view's row count
+
+        :param group_by: The view's group-by dimensions
+        """
+        domain = 1
+        for dim in group_by:
+            domain *= self.cardinality[dim]
+        return distinct_estimate(domain, self.rows)
+
+    def view_bytes(self, group_by):
+        """
+        Estimate a view's memory size
+
+        :param group_by: The view's group-by dimensions
+        """
+        row_width = sum(self.width[d] for d in group_by) + 8 * len(self.measures)
+        return int(self.view_rows(group_by) * row_width)
+
+
+class ViewPlanner(object):
+    """ Greedy (HRU) selection of the cube aggregates to materialize under a byte budget. """
+
+    budget = None  #: Byte budget shared by all materialized views
+    usage = None  #: Recorded query frequencies
+    profiles = None  #: Table profiles
+    selected = None  #: Chosen views, table -> list of group_by
+    views = None  #: Materialized views, (table, group_by) -> (data version, DataFrame)
+
+    def __init__(self, budget, usage=None):
+        """
+        Create the planner
+
+        :param budget: Byte budget for materialized views
+        :param usage: UsageStats instance
+        """
+        self.budget = budget
+        self.usage = usage if usage is not None else UsageStats()
+        self.profiles = {}
+        self.selected = {}
+        self.views = {}
+
+    def register(self, table, df):
+        """
+        Profile a table and drop its stale views
+
+        :param table: The table name
+        :param df: The table's DataFrame
+        """
+        self.profiles[table] = TableProfile(df)
+        self.views = {k: v for k, v in self.views.items() if k[0] != table}
+
+    def grow(self, table, df, rows, cardinality):
+        """
+        Update the profile of a table after an append and drop its stale views
+
+        :param table: The table name
+        :param df: The grown DataFrame, profiled only if the table is unknown
+        :param rows: Number of appended rows
+        :param cardinality: Dimension -> distinct values of the grown table
+        """
+        if table not in self.profiles:
+            self.register(table, df)
+            return
+        self.profiles[table].grow(rows, cardinality)
+        self.views = {k: v for k, v in self.views.items() if k[0] != table}
+
+    def candidates(self, table):
+        """
+        The group-by lattice of a table, without the base table itself
+
+        :param table: The table name
+        """
+        dims = self.profiles[table].dimensions
+        lattice = []
+        for n in range(len(dims) + 1):
+            for group_by in itertools.combinations(dims, n):
+                # Date and Week together is just Date
+                if "Date" in group_by and "Week" in group_by:
+                    continue
+                lattice.append(group_by)
+        return lattice
+
+    def plan(self):
+        """
+        Choose the views to materialize, greedily by benefit per byte
+
+        :return: The selection, table -> list of group_by
+        """
+        pool = []
+        costs = {}
+        for table, profile in self.profiles.items():
+            queries = self.usage.frequencies(table)
+            # Without a view every query scans the base table
+            costs[table] = {q: profile.rows for q in queries}
+            for group_by in self.candidates(table):
+                served = {q: f for q, f in queries.items() if answers(group_by, q)}
+                if served:
+                    pool.append((table, group_by, profile.view_rows(group_by), profile.view_bytes(group_by), served))
+
+        selected = collections.defaultdict(list)
+        remaining = self.budget
+        while True:
+            best, best_ratio = None, 0
+            for candidate in pool:
+                table, group_by, rows, size, served = candidate
+                if size > remaining or group_by in selected[table]:
+                    continue
+                benefit = sum(f * max(0, costs[table][q] - rows) for q, f in served.items())
+                ratio = benefit / max(size, 1)
+                if ratio > best_ratio:
+                    best, best_ratio = candidate, ratio
+            if best is None:
+                break
+            table, group_by, rows, size, served = best
+            selected[table].append(group_by)
+            remaining -= size
+            for q in served:
+                costs[table][q] = min(costs[table][q], rows)
+
+        self.selected = dict(selected)
+        self.views = {k: v for k, v in self.views.items() if k[1] in self.selected.get(k[0], ())}
+        return self.selected
+
+    def aggregate(self, table, df, group_by, record=True, version=None):
+        """
+        Answer a max() aggregate query from the smallest materialized view, or from the base table
+
+        :param table: The table name
+        :param df: The table's DataFrame
+        :param group_by: The query's group-by dimensions
+        :param record: Count the query in the usage statistics
+        :param version: Data version of df, views of other versions are not used
+        :return: A DataFrame with the group-by columns and the measures
+        """
+        group_by = tuple(group_by)
+        if record:
+            self.usage.record(table, group_by)
+        if table not in self.profiles:
+            self.register(table, df)
+        profile = self.profiles[table]
+
+        source = df
+        # register() may swap the views on the refresh thread meanwhile
+        views = self.views
+        ready = [v for (name, v), (data_version, _) in list(views.items())
+                 if name == table and data_version == version and answers(v, group_by)]
+        if ready:
+            smallest = min(ready, key=lambda v: len(views[(table, v)][1]))
+            source = views[(table, smallest)][1]
+        else:
+            # Materialize the cheapest selected ancestor on first use
+            chosen = [v for v in self.selected.get(table, ()) if answers(v, group_by)]
+            if chosen:
+                view = min(chosen, key=profile.view_rows)
+                source = self._compute(df, view, profile.measures)
+                self.views[(table, view)] = (version, source)
+        return self._compute(source, group_by, profile.measures)
+
+    def resident_bytes(self):
+        """
+        Memory held by the materialized views
+        """
+        return int(sum(v.memory_usage(deep=True).sum() for _, v in self.views.values()))
+
+    @staticmethod
+    def _compute(source, group_by, measures):
+        """
+        Roll a source up to a group-by
+
+        :param source: The base table or a materialized view
+        :param group_by: The target group-by dimensions
+        :param measures: The measures to aggregate
+        """
+        measures = list(measures)
+        if "Week" in group_by and "Week" not in source.columns:
+            source = source.assign(Week=week_key(source["Date"]))
+        if not group_by:
+            return source[measures].max().to_frame().T
+        return source.groupby(list(group_by))[measures].max().reset_index()
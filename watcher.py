@@ -0,0 +1,129 @@
+"""
+    Tool : Pivot, Source Name : watcher.py, Author: M'hamed Bendenia.
+"""
+
+import os
+import re
+import threading
+import time
+
+TABLE_FILE = re.compile(r"^a([0-9a-f]{8})\.", re.IGNORECASE)  #: File gdb table files, a<table id in hex>.<ext>
+SYSTEM_TABLES = range(1, 9)  #: GDB_SystemCatalog, GDB_Items... ids, their changes are schema changes
+
+
+def file_id(filename):
+    """
+    Table id of a file gdb file
+
+    :param filename: The file name
+    :return: The id, None for other files
+    """
+    match = TABLE_FILE.match(filename)
+    return int(match.group(1), 16) if match else None
+
+
+def table_signatures(workspace):
+    """
+    Sizes and write times of each table's files, lock files left out
+
+    :param workspace: The gdb path
+    :return: A dict of table id -> signature tuple
+    """
+    signatures = {}
+    try:
+        entries = list(os.scandir(str(workspace)))
+    except OSError:
+        return signatures
+    for entry in entries:
+        table = file_id(entry.name)
+        # a<id>.<host>.<pid>...sr.lock files come and go with every reader, including ours
+        if table is None or entry.name.endswith(".lock") or not entry.is_file():
+            continue
+        try:
+            stat = entry.stat()
+        except OSError:
+            continue
+        signatures.setdefault(table, []).append((entry.name, stat.st_size, stat.st_mtime_ns))
+    return {table: tuple(sorted(files)) for table, files in signatures.items()}
+
+
+class GdbWatcher(object):
+    """ Polls a file gdb folder and reports the changed tables once edits settle. """
+
+    workspace = None  #: The gdb path
+    interval = None  #: Seconds between polls
+    debounce = None  #: Quiet seconds before reporting
+
+    def __init__(self, workspace, resolve, callback, interval=1.0, debounce=2.0):
+        """
+        Create the watcher, call start() to run it
+
+        :param workspace: The gdb path
+        :param resolve: Callable mapping a table id to a feature class or table name, None if unknown
+        :param callback: Called on the watcher thread with (set of names, True if unknown or system tables changed)
+        :param interval: Seconds between polls
+        :param debounce: Quiet seconds before reporting
+        """
+        self.workspace = workspace
+        self.resolve = resolve
+        self.callback = callback
+        self.interval = interval
+        self.debounce = debounce
+        self._signatures = table_signatures(workspace)
+        self._stop = threading.Event()
+        self._thread = None
+
+    def start(self):
+        """
+        Start polling on a daemon thread
+        """
+        if self._thread is None or not self._thread.is_alive():
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._run, name="GdbWatcher", daemon=True)
+            self._thread.start()
+
+    def stop(self):
+        """
+        Stop polling
+        """
+        self._stop.set()
+        if self._thread is not None and self._thread is not threading.current_thread():
+            self._thread.join(self.interval * 2)
+
+    def poll(self):
+        """
+        Compare the gdb files with the last poll
+
+        :return: Set of changed table ids
+        """
+        signatures = table_signatures(self.workspace)
+        changed = {t for t in set(signatures) | set(self._signatures)
+                   if signatures.get(t) != self._signatures.get(t)}
+        self._signatures = signatures
+        return changed
+
+    def _run(self):
+        """
+        Poll until stopped, reporting accumulated changes after the debounce interval
+        """
+        pending, last_change = set(), 0
+        while not self._stop.wait(self.interval):
+            changed = self.poll()
+            if changed:
+                pending |= changed
+                last_change = time.monotonic()
+            if pending and time.monotonic() - last_change >= self.debounce:
+                names, schema = set(), False
+                for table in pending:
+                    name = self.resolve(table)
+                    if name is None:
+                        schema = True
+                    else:
+                        names.add(name)
+                schema = schema or any(t in SYSTEM_TABLES for t in pending)
+                pending = set()
+                try:
+                    self.callback(names, schema)
+                except Exception:
+                    # The callback reports its own errors, polling goes on
+                    pass